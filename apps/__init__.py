@@ -15,6 +15,32 @@
    limitations under the License.
 """
 
-from apps.pycompssapp import PyCOMPSsApp
-from apps.localapp import LocalApp
-from apps.workflowapp import WorkflowApp
+import importlib
+import sys
+
+# Module of each App, imported on first access (see __getattr__)
+_APPS = {
+    "PyCOMPSsApp": "apps.pycompssapp",
+    "LocalApp": "apps.localapp",
+    "WorkflowApp": "apps.workflowapp",
+    "CacheApp": "apps.cacheapp",
+}
+
+__all__ = sorted(_APPS)
+
+
+def __getattr__(name):
+    """
+    Import an App on first access, so that importing one of the apps does not
+    import all of them.
+    """
+    if name not in _APPS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    app_class = getattr(importlib.import_module(_APPS[name]), name)
+    globals()[name] = app_class
+    return app_class
+
+
+if sys.version_info < (3, 7):  # no module __getattr__ (PEP 562)
+    for _name in __all__:
+        __getattr__(_name)
@@ -0,0 +1,354 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# -----------------------------------------------------------------------------
+# asyncio App
+# -----------------------------------------------------------------------------
+import asyncio
+import contextlib
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# Not imported by apps/__init__: this module requires Python 3.7
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    raise ImportError("apps.asyncapp requires Python 3.7 or later (contextvars)")
+
+from apps.jsonapp import JSONApp
+from basic_modules.app import App, LaunchResult
+from utils import events
+from utils import file_paths
+from utils import logger
+
+# Phases being timed by the current launch (see AsyncApp._timed)
+_PHASES = contextvars.ContextVar("phases", default=())
+
+
+class AsyncApp(App):  # pylint: disable=too-few-public-methods
+    """
+    asyncio App: launch, _pre_run and _post_run are coroutines, so that one
+    event loop can drive many concurrent launches (requires Python 3.7).
+
+    >>> import asyncio
+    >>> app = AsyncApp()
+    >>> results = asyncio.run(asyncio.gather(*[
+    ...     app.launch(Tool, input_files, input_metadata, output_files, {})
+    ...     for input_files, input_metadata, output_files in jobs]))
+
+    Tool.run, which is blocking, is run by _run_tool in an executor: a pool
+    of max_workers threads owned by the App, or the default executor of the
+    event loop if max_workers is None. Subclasses override the coroutines
+    _pre_run and _post_run, awaiting the superclass ones, and can run other
+    blocking operations with _in_executor.
+
+    AsyncApp can also be combined with synchronous Apps, e.g. in
+    class AsyncWorkflowApp(AsyncApp, WorkflowApp): the _pre_run and _post_run
+    of the Apps that follow AsyncApp in the method resolution order are run
+    in the executor.
+
+    The timings of each launch (see App) are kept in its asyncio context:
+    the timings attribute is that of the current launch, or of the last
+    launch awaited by the current task.
+    """
+
+    max_workers = None
+
+    @property
+    def timings(self):
+        """
+        Timings of the launch of the current context.
+        """
+        var = self._timings_var()
+        timings = var.get(None)
+        if timings is None:
+            timings = OrderedDict()
+            var.set(timings)
+        return timings
+
+    @timings.setter
+    def timings(self, timings):
+        self._timings_var().set(timings)
+
+    def _timings_var(self):
+        """
+        Returns the context variable holding the timings of this App.
+        """
+        var = self.__dict__.get("_timings")
+        if var is None:
+            var = self.__dict__.setdefault(
+                "_timings", contextvars.ContextVar("timings_{}".format(id(self))))
+        return var
+
+    @contextlib.contextmanager
+    def _timed(self, phase):
+        """
+        Context manager adding the wall-clock time spent in its block to the
+        timings of the given phase, in the current launch.
+        """
+        timings = self.timings
+        phases = _PHASES.get() + (phase,)
+        name = ".".join(phases)
+        token = _PHASES.set(phases)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            _PHASES.reset(token)
+            timings[name] = timings.get(name, 0.0) + elapsed
+            logger.debug("Phase {} took {:.3f}s", name, elapsed)
+
+    def _get_executor(self):
+        """
+        Returns the executor running blocking operations, starting it if
+        required; None for the default executor of the event loop.
+        """
+        if self.max_workers is None:
+            return None
+        executor = self.__dict__.get("_executor")
+        if executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with self.__dict__.setdefault("_executor_lock", threading.Lock()):
+                executor = self.__dict__.get("_executor")
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                    self.__dict__["_executor"] = executor
+        return executor
+
+    async def _in_executor(self, function, *args):
+        """
+        Run a blocking function in the executor, in the context of the
+        current launch (e.g. for its timings).
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_event_loop().run_in_executor(
+            self._get_executor(), functools.partial(context.run, function, *args))
+
+    def close(self):
+        """
+        Stop the threads of the executor of the App, if any.
+        """
+        executor = self.__dict__.pop("_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    async def launch(self, tool_class,  # pylint: disable=too-many-arguments,invalid-overridden-method
+                     input_files, input_metadata,
+                     output_files, configuration):
+        """
+        Run a Tool with the specified inputs and configuration; see
+        App.launch.
+
+        Returns
+        -------
+        (output_files, output_metadata)
+        """
+        self.timings = OrderedDict()
+        return await self._launch(
+            tool_class, input_files, input_metadata, output_files, configuration)
+
+    async def _launch(self, tool_class,  # pylint: disable=too-many-arguments
+                      input_files, input_metadata,
+                      output_files, configuration):
+        """
+        Body of launch, adding to the timings of the current launch.
+        """
+        with self._backend(configuration), self._log_levels(configuration):
+            logger.info("1) Instantiate and configure Tool")
+            with self._timed("instantiate_tool"):
+                tool_instance = self._instantiate_tool(tool_class, configuration)
+
+            start = time.time()
+            events.emit(events.LAUNCH_START, tool=tool_class.__name__)
+            status = "failed"
+            try:
+                logger.info("2) Run Tool")
+                with self._timed("pre_run"):
+                    input_files, input_metadata = await self._pre_run(
+                        tool_instance, input_files, input_metadata)
+
+                with self._timed("run"):
+                    output_files, output_metadata = await self._in_executor(
+                        self._run_tool, tool_instance, input_files, input_metadata,
+                        output_files)
+
+                with self._timed("post_run"):
+                    output_files, output_metadata = await self._post_run(
+                        tool_instance, output_files, output_metadata)
+                status = "done"
+            finally:
+                if events.enabled():
+                    events.emit(
+                        events.LAUNCH_FINISH, tool=tool_class.__name__, status=status,
+                        duration=time.time() - start,
+                        bytes_out=events.file_bytes(
+                            file_paths(output_files) if status == "done" else []))
+
+        if self._report_timings():
+            self._add_timings(output_metadata)
+
+        logger.info("Output_files: ", output_files)
+        return output_files, output_metadata
+
+    async def launch_many(self, tool_class, jobs, configuration,  # pylint: disable=invalid-overridden-method
+                          max_concurrency=None):
+        """
+        Run a Tool over many sets of inputs, using the same configuration,
+        with at most max_concurrency launches running concurrently (by
+        default, all of them). Each job is launched separately (see launch).
+
+        This method is an asynchronous generator: a LaunchResult is yielded
+        as each launch completes (see App.launch_many).
+
+        >>> async for result in app.launch_many(Tool, jobs, {}, 100):
+        ...     print(result.index, result.error)
+        """
+        launches = (
+            (index, functools.partial(
+                self.launch, tool_class, input_files, input_metadata,
+                output_files, configuration))
+            for index, (input_files, input_metadata, output_files) in enumerate(jobs))
+        async for result in self._as_completed(launches, max_concurrency):
+            yield result
+
+    @staticmethod
+    async def _launch_result(index, launch):
+        """
+        Await a launch, returning its LaunchResult.
+        """
+        try:
+            output_files, output_metadata = await launch()
+        except Exception as err:  # pylint: disable=broad-except
+            logger.error("Run {} failed: {}", index, err)
+            return LaunchResult(index, {}, {}, err)
+        return LaunchResult(index, output_files, output_metadata, None)
+
+    async def _as_completed(self, launches, max_concurrency=None):
+        """
+        Run the (index, launch) coroutine functions, with at most
+        max_concurrency running concurrently, yielding their LaunchResult as
+        they complete. Each launch runs in its own asyncio task, and context.
+        """
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and (max_concurrency is None or len(pending) < max_concurrency):
+                try:
+                    index, launch = next(launches)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(self._launch_result(index, launch)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    async def _pre_run(self, tool_instance, input_files, input_metadata):  # pylint: disable=invalid-overridden-method
+        """
+        Subclasses can specify here operations to be awaited BEFORE running
+        Tool.run(); see App._pre_run. Runs the _pre_run of the synchronous
+        Apps combined with AsyncApp, if any, and the staging of the inputs,
+        in the executor.
+        """
+        pre_run = super(AsyncApp, self)._pre_run
+        if pre_run.__func__ is App._pre_run and self._get_stager() is None:  # pylint: disable=no-member
+            return pre_run(tool_instance, input_files, input_metadata)
+        return await self._in_executor(pre_run, tool_instance, input_files, input_metadata)
+
+    async def _post_run(self, tool_instance, output_files, output_metadata):  # pylint: disable=invalid-overridden-method
+        """
+        Subclasses can specify here operations to be awaited AFTER running
+        Tool.run(); see App._post_run. Runs the _post_run of the synchronous
+        Apps combined with AsyncApp, if any, and the unstaging of the
+        outputs, in the executor.
+        """
+        post_run = super(AsyncApp, self)._post_run
+        if post_run.__func__ is App._post_run and self._get_unstager() is None:  # pylint: disable=no-member
+            return post_run(tool_instance, output_files, output_metadata)
+        return await self._in_executor(post_run, tool_instance, output_files, output_metadata)
+
+
+class AsyncJSONApp(AsyncApp, JSONApp):  # pylint: disable=too-few-public-methods
+    """
+    asyncio JSON-configured App: the coroutine version of JSONApp, whose
+    launch reads config.json and input_metadata.json, and writes results.json,
+    in the executor, so that the JSON files of concurrent launches are read
+    and written concurrently; the _pre_run and _post_run of JSONApp (e.g.
+    waiting for the outputs, see PyCOMPSsApp) are also run in the executor.
+
+    The outputs of Tools whose run method is a generator are written to
+    results.json once the Tool has finished (see JSONApp).
+    """
+
+    async def launch(self, tool_class,  # pylint: disable=arguments-differ,invalid-overridden-method
+                     config_path, input_metadata_path, output_metadata_path):
+        """
+        Run a Tool with the specified inputs and configuration; see
+        JSONApp.launch.
+
+        Returns
+        -------
+        bool
+        """
+        self.timings = OrderedDict()
+        logger.info("0) Unpack information from JSON")
+        with self._timed("read_inputs"):
+            input_files, input_metadata, output_files, arguments = await self._in_executor(
+                self._read_inputs, config_path, input_metadata_path)
+
+        output_files, output_metadata = await self._launch(
+            tool_class, input_files, input_metadata, output_files, arguments)
+
+        logger.info("4) Pack information to JSON")
+        with self._timed("write_results"):
+            result = await self._in_executor(
+                self._write_results, input_files, input_metadata,
+                output_files, output_metadata, output_metadata_path)
+
+        if self._report_timings():
+            await self._in_executor(self._write_timings, output_metadata_path)
+        return result
+
+    async def launch_many(self, tool_class, jobs,  # pylint: disable=arguments-differ,invalid-overridden-method
+                          max_concurrency=None):
+        """
+        Run a Tool over many sets of JSON-configured inputs, given as
+        (config_path, input_metadata_path, output_metadata_path), with at
+        most max_concurrency launches running concurrently.
+
+        This method is an asynchronous generator: a LaunchResult is yielded
+        as each launch completes; its output_files and output_metadata are
+        empty, as they are written to results.json.
+        """
+        launches = (
+            (index, functools.partial(self._launch_json, tool_class, *job))
+            for index, job in enumerate(jobs))
+        async for result in self._as_completed(launches, max_concurrency):
+            yield result
+
+    async def _launch_json(self, tool_class, *paths):
+        """
+        Launch a JSON-configured run for launch_many.
+        """
+        await self.launch(tool_class, *paths)
+        return {}, {}
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+# -----------------------------------------------------------------------------
+# Result-caching App
+# -----------------------------------------------------------------------------
+import os
+
+from basic_modules.app import App
+from utils.result_cache import ResultCache
+from utils import logger
+from utils.runtime import compss_wait_on
+
+
+class CacheApp(App):  # pylint: disable=too-few-public-methods
+    """
+    Result-caching App.
+
+    Memoises the results of Tool runs in a local cache directory, keyed on
+    the Tool class, its configuration and the content of the input files
+    (see utils.result_cache). When a Tool is launched with inputs that have
+    already been processed, the outputs and their metadata are restored
+    from the cache instead of running the Tool.
+
+    The cache is disabled unless a cache directory is set, either in the
+    cache_dir attribute or in the MUG_RESULT_CACHE environment variable. Its
+    total size is bounded by cache_max_size (in bytes), evicting the least
+    recently used results; Apps sharing a directory with different bounds
+    each evict according to their own. Setting bypass_cache (or the
+    MUG_RESULT_CACHE_BYPASS environment variable) runs Tools without
+    reading or writing the cache.
+
+    CacheApp can be combined with other Apps, e.g.:
+
+    >>> class CachedJSONApp(CacheApp, JSONApp):
+    ...     cache_dir = "/scratch/cache"
+    """
+
+    cache_dir = None
+    cache_max_size = 10 * 1024 ** 3
+    bypass_cache = False
+
+    _caches = {}
+
+    def _get_cache(self):
+        """
+        Returns the ResultCache, or None if caching is disabled.
+        """
+        if self.bypass_cache or os.environ.get("MUG_RESULT_CACHE_BYPASS"):
+            return None
+        cache_dir = self.cache_dir or os.environ.get("MUG_RESULT_CACHE")
+        if not cache_dir:
+            return None
+        # One cache per bound, so that Apps sharing a directory apply theirs
+        key = (cache_dir, self.cache_max_size)
+        if key not in self._caches:
+            self._caches.setdefault(key, ResultCache(cache_dir, self.cache_max_size))
+        return self._caches[key]
+
+    def _run_tool(self, tool_instance, input_files, input_metadata, output_files):
+        """
+        Restores the results from the cache if available; otherwise runs the
+        Tool, waits for its outputs, and stores them in the cache.
+        """
+        cache = self._get_cache()
+        if cache is None:
+            return super(CacheApp, self)._run_tool(
+                tool_instance, input_files, input_metadata, output_files)
+
+        key = cache.key(
+            type(tool_instance), tool_instance.configuration,
+            input_files, input_metadata, output_files)
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info("Restored results of {} from the cache",
+                        type(tool_instance).__name__)
+            return cached
+
+        output_files, output_metadata = super(CacheApp, self)._run_tool(
+            tool_instance, input_files, input_metadata, output_files)
+        compss_wait_on(output_files.values())
+        if cache.put(key, output_files, output_metadata):
+            logger.info("Stored results of {} in the cache",
+                        type(tool_instance).__name__)
+        return output_files, output_metadata
+
+    def _register_output(self, tool_instance, role, path, metadata):  # pylint: disable=too-many-arguments
+        """
+        Keeps the metadata of the outputs yielded by the Tool if caching is
+        enabled, as it is stored in the cache with the outputs.
+        """
+        kept = super(CacheApp, self)._register_output(
+            tool_instance, role, path, metadata)
+        if self._get_cache() is None:
+            return kept
+        return metadata
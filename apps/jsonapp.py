@@ -19,11 +19,51 @@
 # -----------------------------------------------------------------------------
 # JSON-configured App
 # -----------------------------------------------------------------------------
+import itertools
 import json
+import os
+import threading
+from collections import OrderedDict
 
 from apps.workflowapp import WorkflowApp
 from basic_modules.metadata import Metadata
+from utils import file_paths
+from utils import json_stream
 from utils import logger
+from utils import runtime
+from utils.runtime import compss_wait_on
+
+# Runs traced with tracemalloc, which traces the whole process: it is started
+# by the first of the concurrent runs, and stopped by the last one
+_TRACING = {"runs": 0, "owned": False}
+_TRACING_LOCK = threading.Lock()
+
+
+def _start_tracing():
+    """
+    Start tracing the allocations of a run, if no other run is being traced.
+    """
+    import tracemalloc
+
+    with _TRACING_LOCK:
+        if _TRACING["runs"] == 0:
+            _TRACING["owned"] = not tracemalloc.is_tracing()
+            if _TRACING["owned"]:
+                tracemalloc.start()
+        _TRACING["runs"] += 1
+
+
+def _stop_tracing():
+    """
+    Stop tracing the allocations of a run, if it is the last one being
+    traced and the tracing was started by _start_tracing.
+    """
+    import tracemalloc
+
+    with _TRACING_LOCK:
+        _TRACING["runs"] -= 1
+        if _TRACING["runs"] == 0 and _TRACING["owned"]:
+            tracemalloc.stop()
 
 
 class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
@@ -34,8 +74,56 @@ class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
 
     launch(tool_class, config_path, input_metadata_path, output_metadata_path)
 
+    JSONApp also times the reading of the JSON files ("read_inputs") and
+    the writing of results.json ("write_results"); when timings are reported
+    (see App), they are also written next to results.json, as
+    <results>.timings.json.
+
+    If compact_results is True, results.json is written without whitespace.
+
+    If the run method of the Tool is a generator (see Tool.run), the entry of
+    results.json of each output is written as soon as it is yielded, and its
+    metadata is then released; in this case, the timings are only written to
+    <results>.timings.json. results.json is only replaced once complete.
+    The references of the metadata to its parents are also dropped (see
+    Metadata.release_parents), so that a Tool deriving each output from the
+    previous one does not keep the whole lineage alive.
+
+    If full_provenance is True, the "sources" of each output in results.json
+    list all the files it was derived from, rather than only its direct
+    sources (see Metadata.get_ancestry).
+
+    The "profiling" argument of config.json captures a profile of the Tool
+    run, and can be set to "cprofile", "tracemalloc", or both (as a list, or
+    separated by commas). The run, including the wait for its output files,
+    is profiled with cProfile and/or traced with tracemalloc; note that
+    cProfile only profiles the thread running the Tool, not its tasks. The
+    pstats dump and the top allocations are written next to the first output
+    of the Tool, in files named after the Tool, the process id and the number
+    of the run in the process (e.g. "SimpleTool1.1234-1.profile.pstats"), so
+    that concurrent launches do not overwrite each other's; they are added
+    to results.json as outputs with the roles "profiling_cprofile" and
+    "profiling_tracemalloc" and the data_type "profiling". The allocations
+    listed are those made since the start of the run, but as tracemalloc
+    traces the whole process, they include those of the runs executed
+    concurrently (see launch_many), and the peak is that of the process.
     """
 
+    full_provenance = False
+    compact_results = False
+
+    # results.json of the current launch, and its writer once a generator
+    # Tool has yielded outputs, with their roles (see _register_output)
+    _results_path = None
+    _results_writer = None
+    _streamed_roles = ()
+
+    PROFILING_ARGUMENT = "profiling"
+    PROFILING_MODES = ("cprofile", "tracemalloc")
+    # Number of allocation sites listed in the tracemalloc output
+    tracemalloc_top = 25
+    _profile_ids = itertools.count(1)
+
     # The arguments deffer between this function and the supeclass in
     # basic_modules.app to provide a common interface and so that the JSON
     # configuration files can be provided to generate the parameters required
@@ -78,12 +166,157 @@ class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
         >>> # writes /path/to/results.json
         """
 
+        self.timings = OrderedDict()
+        logger.info("0) Unpack information from JSON")
+        with self._timed("read_inputs"):
+            input_files, input_metadata, output_files, arguments = self._read_inputs(
+                config_path, input_metadata_path)
+        read_timings = self.timings
+
+        # Run launch from the superclass
+        self._results_path = output_metadata_path
+        self._results_writer = None
+        self._streamed_roles = set()
+        completed = False
+        try:
+            output_files, output_metadata = super(JSONApp, self).launch(
+                tool_class, input_files, input_metadata,
+                output_files, arguments)
+            completed = True
+        finally:
+            self._results_path = None
+            if not completed and self._results_writer is not None:
+                self._results_writer.abort()
+                self._results_writer = None
+
+        self.timings = OrderedDict(
+            list(read_timings.items()) + list(self.timings.items()))
+        if self._report_timings():
+            self._add_timings(output_metadata)
+
+        logger.info("4) Pack information to JSON")
+        with self._timed("write_results"):
+            if self._results_writer is not None:
+                result = self._finish_results(output_files, output_metadata)
+            else:
+                result = self._write_results(
+                    input_files, input_metadata,
+                    output_files, output_metadata,
+                    output_metadata_path)
+
+        if self._report_timings():
+            self._write_timings(output_metadata_path)
+        return result
+
+    def launch_many(self, tool_class, jobs, max_workers=None):  # pylint: disable=arguments-differ
+        """
+        Run a Tool over many sets of JSON-configured inputs.
+
+        Instances of the Tool are shared by all the jobs with the same
+        arguments in their config.json; the runs are executed concurrently
+        (see App.launch_many), and the results.json of each job is written as
+        soon as its run completes. As the backend and the log thresholds are
+        shared by the process (see runtime.using and logger.using_levels),
+        jobs selecting another backend, or other log levels, than the
+        previous jobs fail.
+
+        This method is a generator: results are yielded as each run
+        completes, which is not necessarily in the order of jobs.
+
+
+        Parameters
+        ----------
+        tool_class : class
+            the subclass of Tool to be run;
+        jobs : iterable
+            (config_path, input_metadata_path, output_metadata_path) for each
+            run; see launch();
+        max_workers : int
+            maximum number of runs executed concurrently; defaults to the
+            number of CPUs.
+
+
+        Returns
+        -------
+        LaunchResult
+            (index, output_files, output_metadata, error) for each of the
+            jobs, where error is the Exception raised by a failed run.
+
+
+        Example
+        -------
+        >>> import App, Tool
+        >>> app = JSONApp()
+        >>> jobs = [("/path/to/config1.json", "/path/to/input_metadata1.json",
+        ...          "/path/to/results1.json"), ...]
+        >>> for result in app.launch_many(Tool, jobs, max_workers=4):
+        ...     print(result.index, result.error)
+        """
+        tools = {}
+        pending = {}
+        backends = []
+        levels = []
+
+        def _items():
+            """
+            Unpack the JSON files of each job.
+            """
+            for index, (config_path, input_metadata_path, output_metadata_path) in \
+                    enumerate(jobs):
+                try:
+                    input_files, input_metadata, output_files, arguments = \
+                        self._read_inputs(config_path, input_metadata_path)
+                    key = json.dumps(arguments, sort_keys=True)
+                    if key not in tools:
+                        if self._acquire_backend(arguments):
+                            backends.append(key)
+                        if self._acquire_log_levels(arguments):
+                            levels.append(key)
+                        tools[key] = self._instantiate_tool(tool_class, arguments)
+                except Exception as err:  # pylint: disable=broad-except
+                    yield err
+                    continue
+                pending[index] = (input_files, input_metadata, output_metadata_path)
+                yield tools[key], input_files, input_metadata, output_files
+
         logger.info("0) Unpack information from JSON")
+        try:
+            for result in self._launch_items(_items(), max_workers):
+                job = pending.pop(result.index, None)
+                if result.error is None:
+                    input_files, input_metadata, output_metadata_path = job
+                    try:
+                        self._write_results(
+                            input_files, input_metadata,
+                            result.output_files, result.output_metadata,
+                            output_metadata_path)
+                    except Exception as err:  # pylint: disable=broad-except
+                        logger.error("Run {} failed: {}", result.index, err)
+                        result = result._replace(error=err)
+                yield result
+        finally:
+            for _ in backends:
+                runtime.release()
+            for _ in levels:
+                logger.release_levels()
+
+    def _read_inputs(self, config_path, input_metadata_path):
+        """
+        Read config.json and input_metadata.json to obtain the inputs of
+        App.launch: input_files, input_metadata, output_files and the tool
+        arguments.
+        """
         input_ids, arguments, output_files = self._read_config(
             config_path)
 
+        wanted_ids = []
+        for input_id in input_ids.values():
+            if isinstance(input_id, (list, tuple)):
+                wanted_ids.extend(input_id)
+            else:
+                wanted_ids.append(input_id)
         input_metadata_ids = self._read_metadata(
-            input_metadata_path)
+            input_metadata_path, wanted_ids)
 
         # arrange by role
         input_metadata = {}
@@ -101,18 +334,9 @@ class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
             else:
                 input_files[role] = metadata.file_path
 
-        # Run launch from the superclass
-        output_files, output_metadata = super(JSONApp, self).launch(
-            tool_class, input_files, input_metadata,
-            output_files, arguments)
-
-        logger.info("4) Pack information to JSON")
-        return self._write_results(
-            input_files, input_metadata,
-            output_files, output_metadata,
-            output_metadata_path)
+        return input_files, input_metadata, output_files, arguments
 
-    def _read_config(self, json_path):  # pylint: disable=no-self-use
+    def _read_config(self, json_path):
         """
         Read config.json to obtain:
         input_ids: dict containing IDs of tool input files
@@ -149,19 +373,164 @@ class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
         for argument in configuration["arguments"]:
             arguments[argument["name"]] = argument["value"]
 
+        if arguments.get(self.PROFILING_ARGUMENT):
+            arguments[self.PROFILING_ARGUMENT] = self._profiling_modes(
+                arguments[self.PROFILING_ARGUMENT])
+
         return input_ids, arguments, output_files
 
-    def _read_metadata(self, json_path):  # pylint: disable=no-self-use
+    def _profiling_modes(self, value):
+        """
+        Returns the list of the profiling modes given as the "profiling"
+        argument, either as a list or as a comma-separated string.
+        """
+        if not isinstance(value, (list, tuple)):
+            value = str(value).split(",")
+        modes = [mode.strip().lower() for mode in value if mode.strip()]
+        for mode in modes:
+            if mode not in self.PROFILING_MODES:
+                raise ValueError("Unknown profiling mode '{}': choose from {}".format(
+                    mode, self.PROFILING_MODES))
+        if "tracemalloc" in modes:
+            try:
+                import tracemalloc  # pylint: disable=unused-variable
+            except ImportError:  # Python 2
+                logger.warn("tracemalloc is not available: memory allocations not traced")
+                modes.remove("tracemalloc")
+        return modes
+
+    def _run_tool(self, tool_instance, input_files, input_metadata, output_files):
+        """
+        Runs the Tool, profiling the run if requested by the "profiling"
+        argument of config.json.
+        """
+        modes = (tool_instance.configuration or {}).get(self.PROFILING_ARGUMENT)
+        if not modes:
+            return super(JSONApp, self)._run_tool(
+                tool_instance, input_files, input_metadata, output_files)
+
+        # Only imported when profiling, to keep the startup short
+        import cProfile
+        if "tracemalloc" in modes:
+            import tracemalloc
+
+        profiler = cProfile.Profile() if "cprofile" in modes else None
+        if "tracemalloc" in modes:
+            _start_tracing()
+            start_snapshot = tracemalloc.take_snapshot()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        if profiler is not None:
+            profiler.enable()
+        try:
+            output_files, output_metadata = super(JSONApp, self)._run_tool(
+                tool_instance, input_files, input_metadata, output_files)
+            compss_wait_on(output_files.values())
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if "tracemalloc" in modes:
+                try:
+                    snapshot = tracemalloc.take_snapshot()
+                    memory, peak = tracemalloc.get_traced_memory()
+                finally:
+                    _stop_tracing()
+
+        paths = file_paths(output_files)
+        directory = os.path.dirname(os.path.abspath(paths[0])) if paths else os.getcwd()
+        prefix = os.path.join(directory, "{}.{}-{}".format(
+            type(tool_instance).__name__, os.getpid(), next(self._profile_ids)))
+        output_files = dict(output_files)
+        output_metadata = dict(output_metadata)
+
+        if profiler is not None:
+            path = prefix + ".profile.pstats"
+            profiler.dump_stats(path)
+            self._add_profiling_output(output_files, output_metadata, "cprofile", path,
+                                       "pstats", "cProfile statistics of the Tool run")
+        if "tracemalloc" in modes:
+            path = prefix + ".tracemalloc.txt"
+            with open(path, "w") as handle:
+                handle.write("Peak traced memory: {} B\n".format(peak))
+                handle.write("Allocated during the run: {} B\n".format(
+                    memory - start_memory))
+                stats = snapshot.compare_to(start_snapshot, "lineno")
+                for stat in stats[:self.tracemalloc_top]:
+                    handle.write("{}\n".format(stat))
+            self._add_profiling_output(output_files, output_metadata, "tracemalloc", path,
+                                       "txt", "Top memory allocations of the Tool run")
+        return output_files, output_metadata
+
+    def _register_output(self, tool_instance, role, path, metadata):  # pylint: disable=too-many-arguments
+        """
+        During launch, writes the entry of results.json of each output as
+        soon as it is yielded by the Tool, and drops its metadata; unless the
+        outputs are unstaged (see App), as their entries are only complete
+        once they have been moved.
+        """
+        metadata = super(JSONApp, self)._register_output(
+            tool_instance, role, path, metadata)
+        if metadata is None or self._results_path is None or self._get_unstager() is not None:
+            return metadata
+
+        if self._results_writer is None:
+            self._results_writer = json_stream.JSONArrayWriter(
+                self._results_path, "output_files", compact=self.compact_results)
+        self._streamed_roles.add(role)
+        self._results_writer.write(self._new_result(role, path, metadata))
+        # The Tool may keep the metadata as the parent of its next outputs
+        metadata.release_parents(self.full_provenance)
+        return None
+
+    def _finish_results(self, output_files, output_metadata):
+        """
+        Complete the results.json written as the outputs of the Tool were
+        yielded (see _register_output) with its other outputs, e.g. profiles.
+        """
+        writer, self._results_writer = self._results_writer, None
+        remaining = dict(
+            (role, path) for role, path in output_files.items()
+            if role not in self._streamed_roles)
+        with writer:
+            for entry in self._result_entries(remaining, output_metadata):
+                writer.write(entry)
+        return True
+
+    @staticmethod
+    def _add_profiling_output(output_files, output_metadata,  # pylint: disable=too-many-arguments
+                              mode, path, file_type, description):
+        """
+        Add a profile to the outputs of the Tool.
+        """
+        role = "profiling_" + mode
+        output_files[role] = path
+        output_metadata[role] = Metadata(
+            "profiling", file_type, path,
+            meta_data={"profiling": mode, "description": description})
+        logger.info("Wrote {} profile to {}", mode, path)
+
+    def _read_metadata(self, json_path, input_ids=None):  # pylint: disable=no-self-use
         """
         Read input_metadata.json to obtain input_metadata_ids, a dict
         containing metadata on each of the tool input files,
         arranged by their ID.
 
+        If input_ids is given, only the metadata of the files with these IDs
+        is read: the file is parsed one entry at a time, and only the
+        requested entries are kept (see utils.json_stream); if several
+        entries have the same ID, the last one is used. The position of the
+        entries in the file is indexed, so that further reads of the same
+        file are faster.
+
         For more information see the schema for input_metadata.json.
         """
-        metadata = json.load(open(json_path))
+        index = json_stream.get_index(json_path)
+        if input_ids is None:
+            entries = index
+        else:
+            entries = index.lookup(input_ids).values()
+
         input_metadata = {}
-        for input_file in metadata:
+        for input_file in entries:
             input_id = input_file["_id"]
             input_metadata[input_id] = Metadata(
                 data_type=input_file["data_type"],
@@ -173,7 +542,55 @@ class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
             )
         return input_metadata
 
-    def _write_results(self,  # pylint: disable=no-self-use,too-many-arguments
+    def _write_timings(self, output_metadata_path):
+        """
+        Write the timings of the launch next to results.json, as
+        <results>.timings.json.
+        """
+        json_path = os.path.splitext(output_metadata_path)[0] + ".timings.json"
+        with open(json_path, "w") as handle:
+            json.dump(self.timings, handle, indent=4, separators=(',', ': '))
+        return json_path
+
+    def _new_result(self, role, path, metadata):
+        """
+        Returns the entry of results.json describing an output file.
+        """
+        return {
+            "name": role,
+            "file_path": path,
+            "data_type": metadata.data_type,
+            "file_type": metadata.file_type,
+            "sources": (metadata.get_ancestry() if self.full_provenance
+                        else metadata.sources),
+            "taxon_id": metadata.taxon_id,
+            "meta_data": metadata.meta_data.to_dict()
+        }
+
+    def _result_entries(self, output_files, output_metadata):
+        """
+        Generate the entries of results.json for the outputs of a Tool (see
+        _write_results).
+        """
+        for role, path in output_files.items():
+            metadata = output_metadata[role]
+            if isinstance(path, (list, tuple)):  # check allow_multiple?
+                assert (
+                    isinstance(metadata, (list, tuple)) and
+                    len(metadata) == len(path)
+                ) or isinstance(metadata, Metadata), \
+                        """Wrong number of metadata entries for role {role}:
+either 1 or {np}, not {nm}""".format(role=role, np=len(path), nm=len(metadata))
+
+                if not isinstance(metadata, (list, tuple)):
+                    metadata = [metadata] * len(path)
+
+                for pa, md in zip(path, metadata):
+                    yield self._new_result(role, pa, md)
+            else:
+                yield self._new_result(role, path, metadata)
+
+    def _write_results(self,  # pylint: disable=too-many-arguments
                        input_files, input_metadata,  # pylint: disable=unused-argument
                        output_files, output_metadata, json_path):
         """
@@ -195,39 +612,13 @@ class JSONApp(WorkflowApp):  # pylint: disable=too-few-public-methods
         instance of Metadata is used for all outputs for that role.
 
         For more information see the schema for results.json.
-        """
-        results = []
-
-        def _newresult(role, path, metadata):
-            return {
-                "name": role,
-                "file_path": path,
-                "data_type": metadata.data_type,
-                "file_type": metadata.file_type,
-                "sources": metadata.sources,
-                "taxon_id": metadata.taxon_id,
-                "meta_data": metadata.meta_data
-            }
 
-        for role, path in output_files.items():
-            metadata = output_metadata[role]
-            if isinstance(path, (list, tuple)):  # check allow_multiple?
-                assert (
-                    isinstance(metadata, (list, tuple)) and
-                    len(metadata) == len(path)
-                ) or isinstance(metadata, Metadata), \
-                        """Wrong number of metadata entries for role {role}:
-either 1 or {np}, not {nm}""".format(role=role, np=len(path), nm=len(metadata))
-
-                if not isinstance(metadata, (list, tuple)):
-                    metadata = [metadata] * len(path)
-
-                results.extend(
-                    [_newresult(role, pa, md) for pa, md in zip(path, metadata)])
-            else:
-                results.append(
-                    _newresult(role, path, metadata))
-        json.dump(
-            {"output_files": results}, open(json_path, 'w'),
-            indent=4, separators=(',', ': '))
+        results.json is written one entry at a time, to a temporary file
+        that replaces json_path once complete (see JSONArrayWriter); if
+        compact_results is True, it is written without whitespace.
+        """
+        with json_stream.JSONArrayWriter(
+                json_path, "output_files", compact=self.compact_results) as writer:
+            for entry in self._result_entries(output_files, output_metadata):
+                writer.write(entry)
         return True
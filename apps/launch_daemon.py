@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+# -----------------------------------------------------------------------------
+# Launch daemon
+# -----------------------------------------------------------------------------
+import argparse
+import importlib
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from utils import logger
+from utils import runtime
+from utils import task_profile
+from utils.resources import host_cores
+
+"""
+Long-lived daemon running JSON-configured launches (see JSONApp), so that
+each job does not pay for the startup of the interpreter and the imports of
+the framework and of the Tool.
+
+The daemon imports the framework and the registered Tool classes once,
+then listens on a local UNIX socket. Each request names a registered Tool
+and the config.json, input_metadata.json and results.json of the job; the
+daemon forks a child from its warm process for each job, which runs
+JSONApp.launch in the working directory of the client, replies, and exits.
+Jobs are therefore isolated from each other, and from the daemon: the
+state they change (e.g. the configuration of the Tool class, the logger or
+the runtime backend) is lost with the child. At most max_jobs jobs run at a
+time; the other requests wait.
+
+The standard output and error of each job are written to its log file, by
+default <results>.log next to its results.json. As the children exit
+without running the exit handlers of the daemon, each child writes its
+queued log messages, and its task profile (see utils.task_profile) to
+<results>.task_profile.json, before exiting.
+
+The protocol is one line of JSON per request and per reply:
+
+    {"tool": "SimpleTool1", "config": "/path/config.json",
+     "input_metadata": "/path/input_metadata.json",
+     "results": "/path/results.json", "cwd": "/path",
+     "log": "/path/results.log"}
+    {"status": "done", "result": true, "pid": 1234, "duration": 0.05,
+     "log": "/path/results.log"}
+
+The "log" of the request is optional. A failed job replies with "status":
+"failed" and an "error"; the request {"command": "shutdown"} stops the
+daemon once its jobs have finished. A client that does not send its
+request within request_timeout seconds is disconnected.
+
+From the command line:
+
+    python -m apps.launch_daemon serve /tmp/mug.sock tools_demos.simpleTool1.SimpleTool1
+    python -m apps.launch_daemon launch /tmp/mug.sock SimpleTool1 \\
+        config.json input_metadata.json results.json
+
+The daemon requires os.fork (POSIX).
+"""  # pylint: disable=pointless-string-statement
+
+# Modules imported by the daemon before it accepts requests
+PRELOAD = (
+    "basic_modules.metadata", "basic_modules.tool", "basic_modules.app",
+    "basic_modules.workflow", "apps.jsonapp", "apps.workflowapp",
+    "utils.local_runtime", "utils.json_stream", "utils.hashing",
+)
+
+
+def import_object(dotted_name):
+    """
+    Returns the object with the given dotted name, e.g.
+    "tools_demos.simpleTool1.SimpleTool1".
+    """
+    module_name, _, name = dotted_name.rpartition(".")
+    if not module_name:
+        raise ValueError("Not a dotted name: '{}'".format(dotted_name))
+    return getattr(importlib.import_module(module_name), name)
+
+
+def _read_line(connection):
+    """
+    Read one line from a socket, without the newline.
+    """
+    chunks = []
+    while True:
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        if b"\n" in chunk:
+            chunks.append(chunk[:chunk.index(b"\n")])
+            break
+        chunks.append(chunk)
+    return b"".join(chunks).decode("utf-8")
+
+
+def _send_json(connection, message):
+    """
+    Write one line of JSON to a socket.
+    """
+    connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+class LaunchDaemon(object):
+    """
+    Daemon running launches of registered Tools in forked children.
+
+    >>> daemon = LaunchDaemon("/tmp/mug.sock", [SimpleTool1])
+    >>> daemon.serve_forever()
+    """
+
+    # Seconds allowed to a client to send its request
+    request_timeout = 10.0
+
+    def __init__(self, socket_path, tools=(), app_class=None, max_jobs=None):
+        """
+        Initialise the daemon, importing the framework and the Tools.
+
+
+        Parameters
+        ----------
+        socket_path : str
+            Path of the UNIX socket the daemon listens on.
+        tools : list
+            Tool classes, or their dotted names, that can be launched; see
+            register_tool.
+        app_class : class or str
+            App running the jobs, with the interface of JSONApp, or its
+            dotted name; by default, JSONApp.
+        max_jobs : int
+            Maximum number of jobs running concurrently; by default, the
+            number of cores of the host (see utils.resources).
+        """
+        if not hasattr(os, "fork"):
+            raise RuntimeError("The launch daemon requires os.fork")
+        for module_name in PRELOAD:
+            runtime.load(module_name)
+
+        self.socket_path = socket_path
+        if app_class is None:
+            from apps.jsonapp import JSONApp
+            app_class = JSONApp
+        elif not isinstance(app_class, type):
+            app_class = import_object(app_class)
+        self.app_class = app_class
+        self.max_jobs = max_jobs or host_cores()
+        self.tools = {}
+        for tool_class in tools:
+            self.register_tool(tool_class)
+
+        self._jobs = set()
+        self._socket = None
+        self._running = False
+
+    def register_tool(self, tool_class, name=None):
+        """
+        Allow launching a Tool, given as a class or a dotted name, by its
+        name: by default, the name of its class.
+        """
+        if not isinstance(tool_class, type):
+            tool_class = import_object(tool_class)
+        self.tools[name or tool_class.__name__] = tool_class
+        return tool_class
+
+    def serve_forever(self):
+        """
+        Accept requests until the daemon is stopped, by a "shutdown"
+        request, stop() or SIGTERM.
+        """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.socket_path)
+        self._socket.listen(128)
+        self._socket.settimeout(0.5)
+        self._running = True
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        logger.info("Launch daemon listening on {} (pid {}), Tools: {}",
+                    self.socket_path, os.getpid(), ", ".join(sorted(self.tools)))
+        try:
+            while self._running:
+                self._reap()
+                try:
+                    connection, _ = self._socket.accept()
+                except socket.timeout:
+                    continue
+                except (IOError, OSError):
+                    if not self._running:
+                        break
+                    raise
+                self._handle(connection)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self._socket.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            while self._jobs:
+                self._reap(block=True)
+
+    def stop(self):
+        """
+        Stop accepting requests; serve_forever returns once the running
+        jobs have finished.
+        """
+        self._running = False
+
+    def _reap(self, block=False):
+        """
+        Collect the children that have exited; if block is True, wait for
+        at least one of them.
+        """
+        while self._jobs:
+            try:
+                pid, _ = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except OSError:  # no children left
+                self._jobs.clear()
+                return
+            if pid == 0:
+                return
+            self._jobs.discard(pid)
+            block = False
+
+    def _handle(self, connection):
+        """
+        Read a request, and fork the child running its job.
+        """
+        connection.settimeout(self.request_timeout)
+        try:
+            request = json.loads(_read_line(connection))
+            if request.get("command") == "shutdown":
+                self.stop()
+                _send_json(connection, {"status": "stopping"})
+                connection.close()
+                return
+            tool_class = self.tools.get(request.get("tool"))
+            if tool_class is None:
+                raise ValueError("Unknown Tool '{}': choose from {}".format(
+                    request.get("tool"), sorted(self.tools)))
+            paths = [request[key] for key in ("config", "input_metadata", "results")]
+        except socket.timeout:
+            logger.error("No launch request received in {}s", self.request_timeout)
+            connection.close()
+            return
+        except (ValueError, KeyError, TypeError, AttributeError) as err:
+            logger.error("Invalid launch request: {}", err)
+            try:
+                _send_json(connection, {"status": "failed", "error": str(err)})
+            except (IOError, OSError):  # the client has gone
+                pass
+            connection.close()
+            return
+        except BaseException:
+            connection.close()
+            raise
+        log_path = request.get("log") or os.path.splitext(paths[2])[0] + ".log"
+
+        while len(self._jobs) >= self.max_jobs:
+            self._reap(block=True)
+
+        pid = os.fork()
+        if pid == 0:
+            self._socket.close()
+            self._run_job(connection, tool_class, paths, request.get("cwd"), log_path)
+        self._jobs.add(pid)
+        connection.close()
+
+    def _run_job(self, connection, tool_class, paths, cwd, log_path):  # pylint: disable=too-many-arguments
+        """
+        Run a job in the forked child, reply, and exit.
+        """
+        status = 1
+        start = time.time()
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            random.seed()
+            task_profile.reset()
+            if cwd:
+                os.chdir(cwd)
+            log_path = _redirect_output(log_path)
+            try:
+                result = self.app_class().launch(tool_class, *paths)
+                reply = {"status": "done", "result": result}
+                status = 0
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error("Launch of {} failed: {}", tool_class.__name__, err)
+                reply = {"status": "failed", "error": str(err),
+                         "traceback": traceback.format_exc()}
+            _finish_job(paths[2])
+            reply.update(pid=os.getpid(), duration=time.time() - start, log=log_path)
+            _send_json(connection, reply)
+            connection.close()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)  # pylint: disable=protected-access
+
+
+def _redirect_output(log_path):
+    """
+    Redirect the standard output and error of the process to a log file;
+    returns its path, or None if it cannot be written, in which case they
+    are left unchanged.
+    """
+    try:
+        log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    except (IOError, OSError) as err:
+        logger.warn("Cannot write the log file {}: {}", log_path, err)
+        return None
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log_fd, sys.stdout.fileno())
+    os.dup2(log_fd, sys.stderr.fileno())
+    os.close(log_fd)
+    return os.path.abspath(log_path)
+
+
+def _finish_job(results_path):
+    """
+    Do the work of the exit handlers skipped by os._exit: write the task
+    profile of the job next to its results.json, if profiling is enabled,
+    and the queued log messages.
+    """
+    try:
+        if task_profile.enabled():
+            stats = task_profile.report()
+            if stats:
+                task_profile.log_report(stats)
+                task_profile.write_report(
+                    os.path.splitext(results_path)[0] + ".task_profile.json", stats)
+    except (IOError, OSError) as err:
+        logger.error("Cannot write the task profile: {}", err)
+    finally:
+        logger.disable_async()
+
+
+def launch(socket_path, tool, config_path, input_metadata_path, results_path,  # pylint: disable=too-many-arguments
+           log_path=None):
+    """
+    Run a job with the launch daemon listening on socket_path, and wait for
+    it to finish.
+
+
+    Parameters
+    ----------
+    socket_path : str
+        Path of the UNIX socket of the daemon
+    tool : str
+        Name of the Tool, as registered in the daemon
+    config_path : str
+        Path of the config.json of the job
+    input_metadata_path : str
+        Path of the input_metadata.json of the job
+    results_path : str
+        Path of the results.json to write
+    log_path : str
+        Path of the log file of the job; by default, <results>.log
+
+
+    Returns
+    -------
+    dict
+        The reply of the daemon, see the protocol above.
+    """
+    request = {
+        "tool": tool,
+        "config": os.path.abspath(config_path),
+        "input_metadata": os.path.abspath(input_metadata_path),
+        "results": os.path.abspath(results_path),
+        "cwd": os.getcwd()}
+    if log_path:
+        request["log"] = os.path.abspath(log_path)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        _send_json(connection, request)
+        reply = _read_line(connection)
+    finally:
+        connection.close()
+    if not reply:
+        return {"status": "failed", "error": "The job exited without replying"}
+    return json.loads(reply)
+
+
+def shutdown(socket_path):
+    """
+    Stop the launch daemon listening on socket_path, once its jobs have
+    finished.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        _send_json(connection, {"command": "shutdown"})
+        return json.loads(_read_line(connection))
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    """
+    Parse the command line, and serve or submit launches.
+    """
+    parser = argparse.ArgumentParser(description="mg-tool-api launch daemon")
+    commands = parser.add_subparsers(dest="command")
+
+    serve = commands.add_parser("serve", help="run the daemon")
+    serve.add_argument("socket", help="path of the UNIX socket")
+    serve.add_argument("tools", nargs="+",
+                       help="dotted names of the Tool classes, e.g. "
+                       "tools_demos.simpleTool1.SimpleTool1")
+    serve.add_argument("--app", help="dotted name of the App (default: JSONApp)")
+    serve.add_argument("--max-jobs", type=int, help="maximum number of concurrent jobs")
+
+    submit = commands.add_parser("launch", help="run a job with the daemon")
+    submit.add_argument("socket", help="path of the UNIX socket")
+    submit.add_argument("tool", help="name of the Tool")
+    submit.add_argument("config", help="path of config.json")
+    submit.add_argument("input_metadata", help="path of input_metadata.json")
+    submit.add_argument("results", help="path of results.json")
+    submit.add_argument("--log", help="path of the log file (default: <results>.log)")
+
+    stop = commands.add_parser("shutdown", help="stop the daemon")
+    stop.add_argument("socket", help="path of the UNIX socket")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        LaunchDaemon(args.socket, args.tools, args.app, args.max_jobs).serve_forever()
+    elif args.command == "launch":
+        reply = launch(args.socket, args.tool, args.config, args.input_metadata,
+                       args.results, args.log)
+        if reply["status"] != "done":
+            print(reply.get("traceback") or reply.get("error"), file=sys.stderr)
+            return 1
+    elif args.command == "shutdown":
+        shutdown(args.socket)
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
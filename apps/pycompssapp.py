@@ -21,19 +21,8 @@ from __future__ import print_function
 # -----------------------------------------------------------------------------
 # PyCOMPSs App
 # -----------------------------------------------------------------------------
-import sys
-
-try:
-    if hasattr(sys, '_run_from_cmdl') is True:
-        raise ImportError
-    from pycompss.api.api import compss_wait_on
-except ImportError:
-    print("[Warning] Cannot import \"pycompss\" API packages.")
-    print("          Using mock decorators.")
-
-    from utils.dummy_pycompss import compss_wait_on
-
 from basic_modules.app import App
+from utils.runtime import compss_wait_on
 
 
 class PyCOMPSsApp(App):  # pylint: disable=too-few-public-methods
@@ -45,8 +34,13 @@ class PyCOMPSsApp(App):  # pylint: disable=too-few-public-methods
         """
         Adds a wait command to ensure asynchronous tasks are
         terminated.
+
+        If the outputs are unstaged (see App), each of them is waited for
+        separately, and moved as soon as it is complete, instead.
         """
-        compss_wait_on(output_files.values())
+        if self._get_unstager() is None:
+            with self._timed("compss_wait_on"):
+                compss_wait_on(output_files.values())
         # Please note that the _post_run can not be done before waiting for
         # the output files.
         # The compss_wait_on performs a synchronization and retrieves the
@@ -19,9 +19,13 @@
 # -----------------------------------------------------------------------------
 # Workflow App
 # -----------------------------------------------------------------------------
+import os
+
 from apps.localapp import LocalApp
 from apps.pycompssapp import PyCOMPSsApp
-from basic_modules.workflow import Workflow  # pylint: disable=unused-import
+from basic_modules.workflow import Workflow
+from utils import file_paths
+from utils import logger
 
 
 class WorkflowApp(PyCOMPSsApp, LocalApp):  # pylint: disable=too-few-public-methods
@@ -29,5 +33,32 @@ class WorkflowApp(PyCOMPSsApp, LocalApp):  # pylint: disable=too-few-public-meth
     Workflow-aware App.
 
     Inherits from the LocalApp (see LocalApp) and the PyCOMPSsApp.
+
+    Intermediate files registered by a Workflow (see
+    Workflow.add_intermediate) are deleted as soon as their last consumer
+    has finished; the intermediates that are left once the Workflow has
+    run successfully, i.e. all of its outputs exist, and that are not among
+    its outputs, are deleted in _post_run. Intermediates are kept if the
+    Workflow is run incrementally (see Workflow.keeps_intermediates), or if
+    the run failed, so that it can be resubmitted.
     """
-    pass
+
+    def _post_run(self, tool_instance, output_files, output_metadata):
+        """
+        Deletes the intermediates left by a Workflow that ran successfully.
+        """
+        output_files, output_metadata = super(WorkflowApp, self)._post_run(
+            tool_instance,
+            output_files,
+            output_metadata)
+        if isinstance(tool_instance, Workflow) and not tool_instance.keeps_intermediates():
+            missing = [path for path in file_paths(output_files)
+                       if not os.path.exists(path)]
+            if missing:
+                logger.warn("Outputs missing, intermediate files kept: {}",
+                            ", ".join(missing))
+            else:
+                removed = tool_instance.remove_intermediates(keep=output_files)
+                if removed:
+                    logger.info("Deleted {} unused intermediate files", len(removed))
+        return output_files, output_metadata
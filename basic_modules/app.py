@@ -17,8 +17,30 @@
 """
 
 from __future__ import print_function
+
+import contextlib
+import itertools
+import os
+import threading
+import time
+from collections import namedtuple, OrderedDict
+
 from basic_modules.metadata import Metadata  # pylint: disable=unused-import
+from basic_modules.tool import collect_outputs
+from utils import events
+from utils import file_paths
 from utils import logger
+from utils import runtime
+
+
+class LaunchResult(namedtuple(
+        "LaunchResult", ["index", "output_files", "output_metadata", "error"])):
+    """
+    Result of one of the runs of App.launch_many: index is the position of
+    the inputs in the list of jobs, and error is the Exception raised by the
+    run, or None if it was successful.
+    """
+    __slots__ = ()
 
 
 # -----------------------------------------------------------------------------
@@ -54,8 +76,52 @@ class App(object):  # pylint: disable=too-few-public-methods
     This general interface outlines the App's workload, independent of the
     execution environment and runtime used (e.g. it does not rely on PyCOMPSs,
     see PyCOMPSsApp).
+
+    App.launch records the wall-clock time spent in each of its phases in the
+    timings attribute, a dict of seconds by phase ("instantiate_tool",
+    "pre_run", "run", "post_run"); subclasses can time additional phases
+    with _timed, where nested phases are named after their enclosing phase
+    (e.g. "post_run.compss_wait_on"). If report_timings is True, or the
+    MUG_REPORT_TIMINGS environment variable is set, the timings are also
+    added to the "timings" entry of the meta_data of the outputs.
+
+    The tasks of the Tool are run by the backend selected by the "backend"
+    entry of the configuration, e.g. "serial", "thread", "process" or
+    "pycompss", for the duration of the launch (see runtime.using). The
+    backend is shared by the process: concurrent launches selecting
+    different backends fail with a RuntimeError. Likewise, the "log_level"
+    entry of the configuration sets the log thresholds for the duration of
+    the launch (see logger.using_levels).
+
+    If a staging directory is set, either in the staging_dir attribute or in
+    the MUG_STAGING_DIR environment variable, _pre_run stages the input
+    files of the Tool to it, staging_workers files at a time, and each
+    source file only once per node (see utils.staging); the Tool receives
+    the paths of the staged files. As the staged files are reused by the
+    other runs on the node, Tools must not modify their inputs. Unlike
+    copies, reflinks (and hard links, if the Stager returned by _get_stager
+    allows them) are not verified against their source.
+
+    If an unstaging directory is set, either in the unstaging_dir attribute
+    or in the MUG_UNSTAGING_DIR environment variable, the output files of
+    the Tool are moved to it, unstaging_workers files at a time. Each output
+    is moved as soon as the tasks writing it have finished, from when it is
+    yielded by the Tool (see _register_output) or returned by Tool.run, and
+    _post_run waits for all of them. The output_files returned by launch are
+    the moved files, and the "unstaging" entry of the meta_data of each
+    output reports its move (see utils.staging.Unstager.submit).
     """
 
+    report_timings = False
+    staging_dir = None
+    staging_workers = None
+    unstaging_dir = None
+    unstaging_workers = None
+
+    _stagers = {}
+    _unstagers = {}
+    _unstaging_lock = threading.Lock()
+
     def launch(self, tool_class,  # pylint: disable=too-many-arguments
                input_files, input_metadata,
                output_files, configuration):
@@ -99,25 +165,219 @@ class App(object):  # pylint: disable=too-few-public-methods
         >>> app.launch(Tool, {"input": <input_file>}, {})
         """
 
-        logger.info("1) Instantiate and configure Tool")
-        tool_instance = self._instantiate_tool(tool_class, configuration)
+        self.timings = OrderedDict()
+        with self._backend(configuration), self._log_levels(configuration):
+            logger.info("1) Instantiate and configure Tool")
+            with self._timed("instantiate_tool"):
+                tool_instance = self._instantiate_tool(tool_class, configuration)
+
+            start = time.time()
+            events.emit(events.LAUNCH_START, tool=tool_class.__name__)
+            status = "failed"
+            try:
+                logger.info("2) Run Tool")
+                with self._timed("pre_run"):
+                    input_files, input_metadata = self._pre_run(tool_instance,
+                                                                input_files,
+                                                                input_metadata)
 
-        logger.info("2) Run Tool")
-        input_files, input_metadata = self._pre_run(tool_instance,
-                                                    input_files,
-                                                    input_metadata)
+                with self._timed("run"):
+                    output_files, output_metadata = self._run_tool(tool_instance,
+                                                                   input_files,
+                                                                   input_metadata,
+                                                                   output_files)
 
-        output_files, output_metadata = tool_instance.run(input_files,
-                                                          input_metadata,
-                                                          output_files)
+                with self._timed("post_run"):
+                    output_files, output_metadata = self._post_run(tool_instance,
+                                                                   output_files,
+                                                                   output_metadata)
+                status = "done"
+            finally:
+                if events.enabled():
+                    events.emit(
+                        events.LAUNCH_FINISH, tool=tool_class.__name__, status=status,
+                        duration=time.time() - start,
+                        bytes_out=events.file_bytes(
+                            file_paths(output_files) if status == "done" else []))
 
-        output_files, output_metadata = self._post_run(tool_instance,
-                                                       output_files,
-                                                       output_metadata)
+        if self._report_timings():
+            self._add_timings(output_metadata)
 
         logger.info("Output_files: ", output_files)
         return output_files, output_metadata
 
+    @contextlib.contextmanager
+    def _timed(self, phase):
+        """
+        Context manager adding the wall-clock time spent in its block to the
+        timings of the given phase.
+        """
+        timings = self.__dict__.setdefault("timings", OrderedDict())
+        local = self.__dict__.setdefault("_timed_phases", threading.local())
+        if not hasattr(local, "stack"):
+            local.stack = []
+        stack = local.stack
+        name = ".".join(stack + [phase])
+        stack.append(phase)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            stack.pop()
+            timings[name] = timings.get(name, 0.0) + elapsed
+            logger.debug("Phase {} took {:.3f}s", name, elapsed)
+
+    def _report_timings(self):
+        """
+        Returns True if the timings should be reported with the results.
+        """
+        return bool(self.report_timings or os.environ.get("MUG_REPORT_TIMINGS"))
+
+    def _add_timings(self, output_metadata):
+        """
+        Add the timings recorded so far to the meta_data of the outputs.
+        """
+        timings = dict(self.timings)
+        for metadata in output_metadata.values():
+            for md in metadata if isinstance(metadata, (list, tuple)) else [metadata]:
+                md.meta_data["timings"] = timings
+
+    def launch_many(self, tool_class, jobs, configuration, max_workers=None):
+        """
+        Run a Tool over many sets of inputs, using the same configuration.
+
+        The Tool is instantiated once, and its instance is shared by all the
+        runs, which are executed concurrently in up to max_workers threads;
+        Tool.run should therefore not store the state of a run in the
+        instance. Inputs are read from jobs and prepared by _pre_run in
+        batches, as runs complete, so that only a bounded number of jobs is
+        held in memory.
+
+        This method is a generator: results are yielded as each run
+        completes, which is not necessarily in the order of jobs.
+
+
+        Parameters
+        ----------
+        tool_class : class
+            the subclass of Tool to be run;
+        jobs : iterable
+            (input_files, input_metadata, output_files) for each run; see
+            launch();
+        configuration : dict
+            a dictionary containing information on how the tool should be
+            executed;
+        max_workers : int
+            maximum number of runs executed concurrently; defaults to the
+            number of CPUs.
+
+
+        Returns
+        -------
+        LaunchResult
+            (index, output_files, output_metadata, error) for each of the
+            jobs, where error is the Exception raised by a failed run.
+
+
+        Example
+        -------
+        >>> import App, Tool
+        >>> app = App()
+        >>> jobs = [({"input": <input_1>}, {"input": <in_data_1>},
+        ...          {"output": <output_1>}), ...]
+        >>> for result in app.launch_many(Tool, jobs, {}, max_workers=4):
+        ...     print(result.index, result.output_files, result.error)
+        """
+
+        with self._backend(configuration), self._log_levels(configuration):
+            logger.info("1) Instantiate and configure Tool")
+            tool_instance = self._instantiate_tool(tool_class, configuration)
+
+            logger.info("2) Run Tool")
+            items = (
+                (tool_instance, input_files, input_metadata, output_files)
+                for input_files, input_metadata, output_files in jobs)
+            for result in self._launch_items(items, max_workers):
+                yield result
+
+    def _launch_items(self, items, max_workers=None):
+        """
+        Run the (tool_instance, input_files, input_metadata, output_files)
+        items with bounded concurrency, yielding a LaunchResult for each as it
+        completes. Items can also be Exception instances, for inputs that
+        could not be read; these are reported as failed runs.
+        """
+        # Only imported by batch launches, to keep the startup of single
+        # launches short (see utils.runtime)
+        import multiprocessing
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED
+        from concurrent.futures import wait as wait_futures
+
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+        window = 2 * max_workers
+
+        items = enumerate(items)
+        running = {}
+        exhausted = False
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            while running or not exhausted:
+                if not exhausted and len(running) < max_workers:
+                    size = window - len(running)
+                    batch = list(itertools.islice(items, size))
+                    exhausted = len(batch) < size
+                    for index, tool_instance, inputs, error in self._pre_run_many(batch):
+                        if error is not None:
+                            yield LaunchResult(index, {}, {}, error)
+                            continue
+                        future = executor.submit(self._run_tool, tool_instance, *inputs)
+                        running[future] = (index, tool_instance)
+                    continue
+
+                done, _ = wait_futures(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, tool_instance = running.pop(future)
+                    try:
+                        output_files, output_metadata = future.result()
+                        output_files, output_metadata = self._post_run(
+                            tool_instance, output_files, output_metadata)
+                    except Exception as err:  # pylint: disable=broad-except
+                        logger.error("Run {} failed: {}", index, err)
+                        yield LaunchResult(index, {}, {}, err)
+                        continue
+                    yield LaunchResult(index, output_files, output_metadata, None)
+        finally:
+            executor.shutdown(wait=True)
+
+    def _pre_run_many(self, batch):
+        """
+        Prepare a batch of (index, item) runs for launch_many, by calling
+        _pre_run on each of them before any is submitted.
+
+        Returns a list of (index, tool_instance, inputs, error), where inputs
+        are the arguments for Tool.run, and error is the Exception raised
+        while preparing the run, if any.
+        """
+        prepared = []
+        for index, item in batch:
+            if isinstance(item, Exception):
+                logger.error("Run {} failed: {}", index, item)
+                prepared.append((index, None, None, item))
+                continue
+            tool_instance, input_files, input_metadata, output_files = item
+            try:
+                input_files, input_metadata = self._pre_run(
+                    tool_instance, input_files, input_metadata)
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error("Run {} failed: {}", index, err)
+                prepared.append((index, tool_instance, None, err))
+                continue
+            prepared.append(
+                (index, tool_instance, (input_files, input_metadata, output_files), None))
+        return prepared
+
     def _instantiate_tool(self, tool_class, configuration):  # pylint: disable=no-self-use
         """
         Instantiate the Tool with its configuration.
@@ -125,6 +385,64 @@ class App(object):  # pylint: disable=too-few-public-methods
         """
         return tool_class(configuration)
 
+    @staticmethod
+    def _acquire_backend(configuration):
+        """
+        Select the backend running the tasks, given by the "backend" entry
+        of the configuration, with at most "backend_workers" tasks running
+        concurrently, until runtime.release is called (see runtime.using).
+
+        Returns True if a backend was selected, or False if the
+        configuration has none, in which case the active backend is left
+        unchanged.
+        """
+        if not (configuration and configuration.get("backend")):
+            return False
+        workers = configuration.get("backend_workers")
+        runtime.acquire(configuration["backend"], int(workers) if workers else None)
+        return True
+
+    @contextlib.contextmanager
+    def _backend(self, configuration):
+        """
+        Context manager selecting the backend of the configuration for the
+        duration of its block (see _acquire_backend).
+        """
+        acquired = self._acquire_backend(configuration)
+        try:
+            yield
+        finally:
+            if acquired:
+                runtime.release()
+
+    @staticmethod
+    def _acquire_log_levels(configuration):
+        """
+        Set the log thresholds given by the "log_level" entry of the
+        configuration, until logger.release_levels is called (see
+        logger.using_levels).
+
+        Returns True if thresholds were set, or False if the configuration
+        has none.
+        """
+        if not (configuration and configuration.get("log_level")):
+            return False
+        logger.acquire_levels(configuration["log_level"])
+        return True
+
+    @contextlib.contextmanager
+    def _log_levels(self, configuration):
+        """
+        Context manager setting the log thresholds of the configuration for
+        the duration of its block (see _acquire_log_levels).
+        """
+        acquired = self._acquire_log_levels(configuration)
+        try:
+            yield
+        finally:
+            if acquired:
+                logger.release_levels()
+
     def _pre_run(self, tool_instance, input_files, input_metadata):  # pylint: disable=no-self-use,unused-argument
         """
         Subclasses can specify here operations to be executed BEFORE running
@@ -133,9 +451,116 @@ class App(object):  # pylint: disable=too-few-public-methods
         Receives the instance of the Tool that will be run, and its inputs
         values: input_files and input_metadata (see Tool).
         Returns input_files and input_metadata.
+
+        Stages the input files, if a staging directory is set.
         """
+        stager = self._get_stager()
+        if stager is not None:
+            with self._timed("stage_in"):
+                input_files = stager.stage_files(input_files)
         return input_files, input_metadata
 
+    def _get_stager(self):
+        """
+        Returns the Stager of the input files, or None if staging is
+        disabled.
+        """
+        staging_dir = self.staging_dir or os.environ.get("MUG_STAGING_DIR")
+        if not staging_dir:
+            return None
+        if staging_dir not in self._stagers:
+            # Only imported when staging, to keep the startup of Apps fast
+            from utils.staging import Stager
+            self._stagers.setdefault(
+                staging_dir, Stager(staging_dir, self.staging_workers))
+        return self._stagers[staging_dir]
+
+    def _get_unstager(self):
+        """
+        Returns the Unstager of the output files, or None if unstaging is
+        disabled.
+        """
+        unstaging_dir = self.unstaging_dir or os.environ.get("MUG_UNSTAGING_DIR")
+        if not unstaging_dir:
+            return None
+        if unstaging_dir not in self._unstagers:
+            from utils.staging import Unstager
+            self._unstagers.setdefault(
+                unstaging_dir, Unstager(unstaging_dir, self.unstaging_workers))
+        return self._unstagers[unstaging_dir]
+
+    def _pending_unstaging(self):
+        """
+        Returns the dict of the Futures of the moves of the outputs submitted
+        while their Tool runs (see _register_output), by absolute path: the
+        outputs of the concurrent launches of an App, which may share their
+        Tool instance (see launch_many), are distinct files. Requires
+        _unstaging_lock.
+        """
+        return self.__dict__.setdefault("_unstaging", {})
+
+    def _discard_unstaging(self, paths):
+        """
+        Forget the moves submitted for the outputs of a failed run.
+        """
+        unstager = self._get_unstager()
+        with self._unstaging_lock:
+            pending = self._pending_unstaging()
+            futures = [pending.pop(os.path.abspath(path)) for path in paths
+                       if os.path.abspath(path) in pending]
+        if unstager is not None and futures:
+            unstager.discard(futures)
+
+    def _run_tool(self, tool_instance, input_files, input_metadata, output_files):  # pylint: disable=no-self-use
+        """
+        Call Tool.run(); subclasses can override this method to change how
+        the Tool is run (see for example CacheApp), and should run the
+        superclass _run_tool to actually run the Tool.
+
+        Receives the instance of the Tool, and the input_files,
+        input_metadata and output_files arguments of Tool.run().
+        Returns output_files and output_metadata.
+
+        If Tool.run is a generator, each of the outputs it yields is passed
+        to _register_output as soon as it is yielded.
+        """
+        registered = []
+
+        def _register(role, path, metadata):
+            registered.append(path)
+            return self._register_output(tool_instance, role, path, metadata)
+
+        try:
+            return collect_outputs(
+                tool_instance.run(input_files, input_metadata, output_files),
+                _register)
+        except BaseException:
+            if registered:
+                self._discard_unstaging(registered)
+            raise
+
+    def _register_output(self, tool_instance, role, path, metadata):  # pylint: disable=no-self-use,unused-argument,too-many-arguments
+        """
+        Subclasses can specify here operations to be executed on each output
+        of a Tool whose run method is a generator (see Tool.run), as soon as
+        it is yielded and while the Tool is still running; subclasses should
+        also run the superclass _register_output.
+
+        Receives the instance of the Tool, and the role, path and metadata of
+        the output. Returns the metadata to keep in the output_metadata
+        returned by the Tool, or None if it is no longer needed; note that the
+        output file may still be written by asynchronous tasks.
+
+        Submits the output to be moved once complete, if an unstaging
+        directory is set.
+        """
+        unstager = self._get_unstager()
+        if unstager is not None and path is not None:
+            future = unstager.submit(path)
+            with self._unstaging_lock:
+                self._pending_unstaging()[os.path.abspath(path)] = future
+        return metadata
+
     def _post_run(self, tool_instance, output_files, output_metadata):  # pylint: disable=no-self-use,unused-argument
         """
         Subclasses can specify here operations to be executed AFTER running
@@ -144,5 +569,57 @@ class App(object):  # pylint: disable=too-few-public-methods
         Receives the instance of the Tool that was run, and its return values:
         output_files and output_metadata (see Tool).
         Returns output_files and output_metadata.
+
+        Moves the output files, if an unstaging directory is set.
         """
+        unstager = self._get_unstager()
+        if unstager is not None:
+            with self._timed("unstage"):
+                output_files, output_metadata = self._unstage(
+                    unstager, tool_instance, output_files, output_metadata)
+        return output_files, output_metadata
+
+    def _unstage(self, unstager, tool_instance, output_files, output_metadata):
+        """
+        Waits for the outputs submitted to the Unstager while the Tool was
+        running, and for the other outputs, which are submitted first.
+
+        Returns output_files and output_metadata, with the paths of the
+        moved files and the reports of their moves.
+        """
+        paths = file_paths(output_files)
+        with self._unstaging_lock:
+            pending = self._pending_unstaging()
+            pending = dict(
+                (path, pending.pop(os.path.abspath(path), None)) for path in paths)
+        futures = OrderedDict()
+        for path in paths:
+            if path not in futures:
+                futures[path] = pending.get(path) or unstager.submit(path)
+        reports = dict(zip(futures, unstager.collect(list(futures.values()))))
+
+        def _summary(report):
+            return dict((key, value) for key, value in report.items() if key != "path")
+
+        def _record(metadata, report):
+            metadata.file_path = report["path"]
+            metadata.meta_data["unstaging"] = _summary(report)
+
+        output_files = dict(output_files)
+        for role, path in output_files.items():
+            metadata = output_metadata.get(role)
+            if isinstance(path, (list, tuple)):
+                output_files[role] = [
+                    reports[el]["path"] if el is not None else None for el in path]
+                if isinstance(metadata, (list, tuple)) and len(metadata) == len(path):
+                    for md, el in zip(metadata, path):
+                        if md is not None and el is not None:
+                            _record(md, reports[el])
+                elif metadata is not None:
+                    metadata.meta_data["unstaging"] = [
+                        _summary(reports[el]) for el in path if el is not None]
+            elif path is not None:
+                output_files[role] = reports[path]["path"]
+                if metadata is not None:
+                    _record(metadata, reports[path])
         return output_files, output_metadata
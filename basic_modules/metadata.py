@@ -17,15 +17,172 @@
 """
 
 from __future__ import print_function
+import collections
 import copy
 
 
+class CopyOnWriteDict(dict):
+    """
+    dict holding the "meta_data" of Metadata, whose mutable values (dicts,
+    lists and sets) are shared with the instances it was created from, or
+    created from it, until they are read.
+
+    Creating an instance from others (see merge and copy) only copies their
+    keys and references to their values. A mutable value that may be shared
+    is copied (a deep copy) the first time it is read with [] or get, or
+    when all values are read with items or values, so that changes to it
+    never affect other instances; keys are set and deleted in each instance
+    independently. Values read by functions working on the content of dicts
+    directly, such as dict(), json.dumps or to_dict, are not copied, and
+    must not be modified.
+    """
+    __slots__ = ("_owned",)
+
+    MUTABLE_TYPES = (dict, list, set)
+
+    def __init__(self, data=None):  # pylint: disable=super-init-not-called
+        """
+        Initialise the container with the content of the given dict; the
+        values of another CopyOnWriteDict are shared, see merge.
+        """
+        dict.__init__(self, data or ())
+        # Keys whose values are owned by this instance, or None if they all are
+        self._owned = None
+        if isinstance(data, CopyOnWriteDict):
+            data._share()  # pylint: disable=protected-access
+            self._owned = set()
+
+    @classmethod
+    def merge(cls, mappings):
+        """
+        Create an instance sharing the content of the given mappings, with
+        values in later mappings prevailing; this does not copy the values.
+        """
+        merged = cls()
+        merged._owned = set()  # pylint: disable=protected-access
+        for mapping in mappings:
+            if isinstance(mapping, CopyOnWriteDict):
+                mapping._share()  # pylint: disable=protected-access
+            dict.update(merged, mapping)
+        return merged
+
+    def _share(self):
+        """
+        Mark all the values as shared with another instance.
+        """
+        self._owned = set()
+
+    def _own(self, key, value):
+        """
+        Returns the value of a key, copying it first if it may be shared.
+        """
+        if self._owned is not None and key not in self._owned:
+            if isinstance(value, self.MUTABLE_TYPES):
+                value = copy.deepcopy(value)
+                dict.__setitem__(self, key, value)
+            self._owned.add(key)
+        return value
+
+    def _own_all(self):
+        """
+        Copy all the values that may be shared.
+        """
+        if self._owned is not None:
+            for key, value in list(dict.items(self)):
+                self._own(key, value)
+            self._owned = None
+
+    def __getitem__(self, key):
+        return self._own(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if self._owned is not None:
+            self._owned.add(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        if self._owned is not None:
+            self._owned.discard(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        value = self._own(key, value)
+        if self._owned is not None:
+            self._owned.discard(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._owned = None
+
+    def items(self):  # pylint: disable=arguments-differ
+        self._own_all()
+        return dict.items(self)
+
+    def values(self):  # pylint: disable=arguments-differ
+        self._own_all()
+        return dict.values(self)
+
+    def copy(self):
+        """
+        Returns a new instance sharing the content of this one.
+        """
+        return CopyOnWriteDict(self)
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return (CopyOnWriteDict, (dict(self),))
+
+    def to_dict(self):
+        """
+        Returns the content as a plain dict, e.g. for serialisation; nested
+        values are not copied, and must not be modified.
+        """
+        return dict(self)
+
+
 class Metadata(object):  # pylint: disable=too-few-public-methods
     """
     Object containing all information pertaining to a specific data element.
+
+    To limit the memory used by Tools generating many outputs, instances do
+    not have a __dict__, and their "meta_data" is a CopyOnWriteDict, a dict
+    whose nested values are shared with the parents of a child created with
+    get_child until they are read.
+
+    Children created with get_child keep a reference to their parents, from
+    which their "sources" are computed when first read; the full provenance
+    of a data element can be retrieved with get_ancestry. These references
+    are dropped by release_parents.
     """
+    __slots__ = ("data_type", "file_type", "file_path", "parents",
+                 "taxon_id", "_sources", "_meta_data")
+
     def __init__(self, data_type=None, file_type=None, file_path=None,  # pylint: disable=too-many-arguments
-                 sources=None, meta_data=None, taxon_id=None):
+                 sources=None, meta_data=None, taxon_id=None, parents=None):
         """
         Initialise the Metadata; for more information see the documentation for
         the MuG DMP API.
@@ -44,17 +201,49 @@ class Metadata(object):  # pylint: disable=too-few-public-methods
         meta_data : dict
             Dictionary object containing the extra data related to the
             generation of the file or describing the way it was processed
+        parents : tuple
+            Metadata instances of the files that were processed to generate
+            this file; if sources is None, it is computed from their paths
         """
         self.data_type = data_type
         self.file_type = file_type
         self.file_path = file_path
         self.taxon_id = taxon_id
-        if sources is None:
+        self.parents = tuple(parents) if parents is not None else None
+        if sources is None and parents is None:
             sources = []
-        self.sources = sources
+        self._sources = sources
+        self.meta_data = meta_data
+
+    @property
+    def sources(self):
+        """
+        List of paths of files that were processed to generate this file.
+        """
+        if self._sources is None:
+            self._sources = [parent.file_path for parent in self.parents]
+        return self._sources
+
+    @sources.setter
+    def sources(self, sources):
+        self._sources = sources
+
+    @property
+    def meta_data(self):
+        """
+        Dictionary object containing the extra data related to the generation
+        of the file or describing the way it was processed (see
+        CopyOnWriteDict).
+        """
+        return self._meta_data
+
+    @meta_data.setter
+    def meta_data(self, meta_data):
         if meta_data is None:
             meta_data = {}
-        self.meta_data = meta_data
+        if not isinstance(meta_data, CopyOnWriteDict):
+            meta_data = CopyOnWriteDict(meta_data)
+        self._meta_data = meta_data
 
     def __repr__(self):
         return """<Metadata:
@@ -65,6 +254,86 @@ class Metadata(object):  # pylint: disable=too-few-public-methods
             taxon_id: {md.taxon_id}
             meta_data: {md.meta_data}>""".format(md=self)
 
+    def to_dict(self):
+        """
+        Returns a dict of the fields of the Metadata, with the same keys as
+        in results.json (see JSONApp).
+        """
+        return {
+            "data_type": self.data_type,
+            "file_type": self.file_type,
+            "file_path": self.file_path,
+            "sources": self.sources,
+            "taxon_id": self.taxon_id,
+            "meta_data": self.meta_data.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, fields):
+        """
+        Create a Metadata from a dict of its fields, as returned by to_dict.
+        """
+        return cls(
+            data_type=fields.get("data_type"),
+            file_type=fields.get("file_type"),
+            file_path=fields.get("file_path"),
+            sources=fields.get("sources"),
+            meta_data=fields.get("meta_data"),
+            taxon_id=fields.get("taxon_id"))
+
+    def get_ancestry(self):
+        """
+        Returns the paths of all the files that were processed to generate
+        this file, directly or indirectly: the sources, then the sources of
+        the sources, and so on; each path is listed once.
+
+        The ancestry is followed through the parents of children created with
+        get_child; for other instances, it stops at their sources.
+
+
+        Returns
+        -------
+        list
+            List of paths, from the closest to the furthest ancestors
+
+
+        Example
+        -------
+        >>> metadata1 = Metadata(..., file_path='file1')
+        >>> metadata2 = Metadata.get_child(metadata1, 'file2')
+        >>> metadata3 = Metadata.get_child(metadata2, 'file3')
+        >>> metadata3.get_ancestry()
+        ['file2', 'file1']
+        """
+        ancestry = []
+        seen_paths = set()
+        seen_nodes = set([id(self)])
+        queue = collections.deque([self])
+        while queue:
+            node = queue.popleft()
+            for path in node.sources:
+                if path is not None and path not in seen_paths:
+                    seen_paths.add(path)
+                    ancestry.append(path)
+            for parent in node.parents or ():
+                if id(parent) not in seen_nodes:
+                    seen_nodes.add(id(parent))
+                    queue.append(parent)
+        return ancestry
+
+    def release_parents(self, keep_ancestry=False):
+        """
+        Drop the references to the parents, e.g. once the metadata has been
+        written, so that a long lineage of children created with get_child
+        does not keep all of its ancestors alive. The sources are kept; if
+        keep_ancestry is True, they are replaced with the full ancestry, so
+        that get_ancestry still returns it for the descendants.
+        """
+        if self.parents is None:
+            return
+        self._sources = self.get_ancestry() if keep_ancestry else self.sources
+        self.parents = None
+
     @classmethod
     def get_child(cls, parents, path):
         """
@@ -76,7 +345,11 @@ class Metadata(object):  # pylint: disable=too-few-public-methods
         order (i.e. values in the last parent prevail).
 
         While making a copy, ensure the copy is deep enough that changing the
-        child instance will not affect the parents.
+        child instance will not affect the parents: the "meta_data" of the
+        child shares the nested values of its parents until either reads them
+        (see CopyOnWriteDict), so creating a child does not copy them. Likewise, the
+        child references its parents rather than copying their lineage (see
+        get_ancestry).
 
 
         Parameters
@@ -101,14 +374,32 @@ class Metadata(object):  # pylint: disable=too-few-public-methods
         """
         if isinstance(parents, (list, tuple)) is False:
             parents = (parents,)
-        meta_data = copy.deepcopy(parents[0].meta_data)
-
-        for parent in parents[1:]:
-            meta_data.update(parent.meta_data)
+        meta_data = CopyOnWriteDict.merge(
+            [parent.meta_data for parent in parents])
 
         return cls(parents[0].data_type,
                    parents[0].file_type,
                    path,
-                   sources=[parent.file_path for parent in parents],
                    meta_data=meta_data,
-                   taxon_id=parents[0].taxon_id)
+                   taxon_id=parents[0].taxon_id,
+                   parents=parents)
+
+
+def dump_metadata(metadata):
+    """
+    Returns the fields of a Metadata instance, or the list of the fields of a
+    list of instances, as a JSON-serialisable object (see Metadata.to_dict).
+    """
+    if isinstance(metadata, (list, tuple)):
+        return [md.to_dict() for md in metadata]
+    return metadata.to_dict()
+
+
+def load_metadata(fields):
+    """
+    Returns the Metadata instance, or list of instances, serialised by
+    dump_metadata.
+    """
+    if isinstance(fields, list):
+        return [Metadata.from_dict(el) for el in fields]
+    return Metadata.from_dict(fields)
@@ -18,22 +18,9 @@
 
 from __future__ import print_function
 
-import sys
-
-try:
-    if hasattr(sys, '_run_from_cmdl') is True:
-        raise ImportError
-    from pycompss.api.parameter import FILE_IN, FILE_OUT
-    from pycompss.api.task import task
-except ImportError:
-    print("[Warning] Cannot import \"pycompss\" API packages.")
-    print("          Using mock decorators.")
-
-    from utils.dummy_pycompss import FILE_IN, FILE_OUT
-    from utils.dummy_pycompss import task
-
 from basic_modules.metadata import Metadata
-from utils import logger  # pylint: disable=ungrouped-imports
+from utils import logger
+from utils.runtime import FILE_IN, FILE_OUT, task
 
 
 # -----------------------------------------------------------------------------
@@ -72,11 +59,14 @@ class Tool(object):  # pylint: disable=too-few-public-methods
         ----------
         configuration : dict
             a dictionary containing parameters that define how the operation
-            should be carried out, which are specific to each Tool.
+            should be carried out, which are specific to each Tool; it is
+            added to the default configuration of the class, which is not
+            modified, so that concurrent launches do not share it.
         """
         if configuration is None:
             configuration = {}
 
+        self.configuration = dict(self.configuration)
         self.configuration.update(configuration)
 
     # @constraint()
@@ -106,6 +96,14 @@ class Tool(object):  # pylint: disable=too-few-public-methods
         Metadata.set_exception), to allow the wrapping App to report the
         error (see App).
 
+        Tools with many outputs can instead implement run as a generator,
+        yielding a (role, path, metadata) tuple for each output as soon as it
+        is created, rather than accumulating them; the App can then process
+        each output as it is yielded, e.g. write its results entry, and free
+        its metadata (see App._register_output). The outputs of a generator
+        are returned by App.launch as lists of paths by role (see
+        collect_outputs).
+
         Note that this method calls the actual task(s). Ideally, each task
         should have a unique name that identifies the operation: these will be
         used by the COMPSs runtime to build a graph and trace.
@@ -164,3 +162,41 @@ class Tool(object):  # pylint: disable=too-few-public-methods
 
         logger.error("Task failed")
         return {}, {}
+
+
+def collect_outputs(result, register=None):
+    """
+    Returns the output_files and output_metadata of the value returned by
+    Tool.run.
+
+    If Tool.run is a generator (see Tool.run), its (role, path, metadata)
+    records are gathered in lists by role. If register is given, it is
+    called with each record as soon as it is yielded, and returns the
+    metadata to keep in output_metadata, or None to drop it, e.g. once it has
+    been written out.
+
+
+    Parameters
+    ----------
+    result : tuple or iterable
+        (output_files, output_metadata), or (role, path, metadata) records;
+    register : function
+        called as register(role, path, metadata) for each record.
+
+
+    Returns
+    -------
+    (output_files, output_metadata)
+    """
+    if isinstance(result, (tuple, list)):
+        return result
+
+    output_files = {}
+    output_metadata = {}
+    for role, path, metadata in result:
+        if register is not None:
+            metadata = register(role, path, metadata)
+        output_files.setdefault(role, []).append(path)
+        if metadata is not None:
+            output_metadata.setdefault(role, []).append(metadata)
+    return output_files, output_metadata
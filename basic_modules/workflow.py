@@ -16,6 +16,17 @@
    limitations under the License.
 """
 
+from __future__ import print_function
+
+import os
+import threading
+
+from basic_modules.tool import collect_outputs
+from utils import file_paths
+from utils import logger
+from utils.manifest import StepManifest
+from utils.runtime import compss_wait_on, compss_delete_file
+
 
 # ------------------------------------------------------------------------------
 # Main Workflow interface
@@ -41,21 +52,34 @@ class Workflow(object):  # pylint: disable=too-few-public-methods
 
     The "run()" method of Workflows should keep track of these intermediate
     outputs by using the "add_intermediate()" method, to allow the wrapping App
-    to unstage these (see App).
+    to unstage these (see App). Each intermediate is registered with the
+    number of Tool runs that consume it, and is deleted as soon as the last
+    of them has finished, rather than at the end of the Workflow; the
+    WorkflowApp deletes the intermediates left at the end of a successful
+    run. When the Workflow is run incrementally (see below), intermediates
+    are kept, so that the steps that produced them can be skipped when a
+    failed Workflow is resubmitted.
 
     As for Tools, Workflows are expected to generate metadata for each of the
     outputs (as well as for intermediate outputs); generally the metadata
     generated by the Tools called by the Workflow will be sufficient.
 
+    Tools should be run using the "run_tool()" method: when the "incremental"
+    configuration parameter is True, Tools whose outputs are up to date with
+    their inputs and configuration are skipped, so that a Workflow that
+    failed can be resubmitted without re-running the steps that completed.
+
     """
     configuration = {}
 
+    _intermediates_lock = threading.Lock()
+
     def run(self, input_files, metadata, output_files):  # pylint: disable=no-self-use,unused-argument
         """
         Perform the required operations to achieve the functionality of the
         Workflow. This usually involves:
         0. Perform relevant checks on the input
-        1. Instantiate a Tool and run it using some input data
+        1. Instantiate a Tool and run it using some input data (see run_tool)
         2. Add the Tool's output to the intermediates
         3. Repeat from 1 as many times as required
         4. Optionally edit the output metadata
@@ -64,3 +88,158 @@ class Workflow(object):  # pylint: disable=too-few-public-methods
         See also help(Tool.run).
         """
         return output_files, {}
+
+    def run_tool(self, tool_instance, input_files, input_metadata, output_files):
+        """
+        Run one of the Tools of the Workflow, i.e. call tool_instance.run()
+        with the given input_files, input_metadata and output_files, and
+        return its output_files and output_metadata (see Tool.run); the
+        outputs of Tools whose run method is a generator are collected first
+        (see collect_outputs).
+
+        If the "incremental" configuration parameter is True, the run is
+        recorded in a manifest stored next to its outputs (see
+        utils.manifest.StepManifest), and later runs of the same Tool with
+        the same requested outputs are skipped if the recorded outputs exist
+        and each input is either older than the outputs or has the same
+        content, and the configuration of the Tool is unchanged. In this
+        mode, run_tool waits for the outputs of the Tool to be written before
+        recording them.
+
+        Once the Tool has run, it is counted as a consumer of each of its
+        input files that were registered as intermediates (see
+        add_intermediate); intermediates are not deleted in incremental mode.
+        """
+        output_files, output_metadata = self._run_step(
+            tool_instance, input_files, input_metadata, output_files)
+        self._consume_intermediates(input_files)
+        return output_files, output_metadata
+
+    def _run_step(self, tool_instance, input_files, input_metadata, output_files):
+        """
+        Run a Tool, skipping it if its outputs are up to date and the
+        Workflow is run incrementally (see run_tool).
+        """
+        if not self.configuration.get("incremental", False):
+            return collect_outputs(
+                tool_instance.run(input_files, input_metadata, output_files))
+
+        manifest = StepManifest.for_outputs(output_files)
+        if manifest is None:
+            return collect_outputs(
+                tool_instance.run(input_files, input_metadata, output_files))
+
+        tool_name = type(tool_instance).__name__
+        key = manifest.step_key(tool_instance, output_files)
+        recorded = manifest.lookup(key, tool_instance.configuration, input_files)
+        if recorded is not None:
+            logger.info("{}: outputs are up to date, skipping", tool_name)
+            return recorded
+
+        output_files, output_metadata = collect_outputs(tool_instance.run(
+            input_files, input_metadata, output_files))
+        compss_wait_on(output_files.values())
+
+        paths = file_paths(output_files)
+        if paths and all(os.path.isfile(path) for path in paths):
+            manifest.record(key, tool_instance.configuration,
+                            input_files, output_files, output_metadata)
+        else:
+            logger.warn("{}: outputs missing, not recorded in the manifest", tool_name)
+            manifest.discard(key)
+        return output_files, output_metadata
+
+    def add_intermediate(self, path, consumers=1):
+        """
+        Register an intermediate output of the Workflow, i.e. a file created
+        by one of its Tools, that is only used as input by other Tools of the
+        Workflow.
+
+        The file is deleted as soon as the given number of Tool runs reading
+        it (see run_tool) have finished; under COMPSs, or with the
+        asynchronous local runtime, it is deleted once the tasks of these
+        Tool runs have finished (see compss_delete_file). If the Workflow is
+        run incrementally, the file is kept (see keeps_intermediates).
+
+
+        Parameters
+        ----------
+        path : str or list
+            Path of the intermediate file, or list of paths
+        consumers : int
+            Number of Tool runs that use the file as input
+        """
+        if isinstance(path, (list, tuple)):
+            for element in path:
+                self.add_intermediate(element, consumers)
+            return
+        if self.keeps_intermediates():
+            return
+        if consumers < 1:
+            self._delete_intermediate(path)
+            return
+        with self._intermediates_lock:
+            intermediates = self.__dict__.setdefault("_intermediates", {})
+            key = os.path.abspath(path)
+            intermediates[key] = intermediates.get(key, 0) + consumers
+
+    def keeps_intermediates(self):
+        """
+        Returns True if intermediates are kept rather than deleted, i.e. if
+        the Workflow is run incrementally: a resubmitted Workflow can then
+        skip the steps whose outputs are intermediates (see run_tool).
+        """
+        return bool(self.configuration.get("incremental", False))
+
+    def get_intermediates(self):
+        """
+        Returns a dict of the intermediates that have not been deleted yet,
+        with the number of Tool runs still expected to consume each of them.
+        """
+        with self._intermediates_lock:
+            return dict(self.__dict__.get("_intermediates", {}))
+
+    def _consume_intermediates(self, input_files):
+        """
+        Count a Tool run as a consumer of its intermediate input files, and
+        delete the intermediates that have no consumers left.
+        """
+        finished = []
+        with self._intermediates_lock:
+            intermediates = self.__dict__.get("_intermediates")
+            if not intermediates:
+                return
+            for path in file_paths(input_files):
+                key = os.path.abspath(path)
+                if key not in intermediates:
+                    continue
+                intermediates[key] -= 1
+                if intermediates[key] <= 0:
+                    del intermediates[key]
+                    finished.append(path)
+        for path in finished:
+            self._delete_intermediate(path)
+
+    def remove_intermediates(self, keep=None):
+        """
+        Delete all the intermediates that have not been deleted yet, except
+        for those in the keep dict of files by role (e.g. the output_files of
+        the Workflow).
+
+        Returns the list of deleted paths.
+        """
+        kept = set(os.path.abspath(path) for path in file_paths(keep or {}))
+        with self._intermediates_lock:
+            intermediates = self.__dict__.get("_intermediates", {})
+            remaining = [path for path in intermediates if path not in kept]
+            intermediates.clear()
+        for path in remaining:
+            self._delete_intermediate(path)
+        return remaining
+
+    def _delete_intermediate(self, path):  # pylint: disable=no-self-use
+        """
+        Delete an intermediate file.
+        """
+        logger.debug("Deleting intermediate file {}", path)
+        compss_delete_file(path)
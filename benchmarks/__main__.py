@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+from benchmarks import harness
+from benchmarks import bench_framework  # pylint: disable=unused-import
+from benchmarks import bench_json  # pylint: disable=unused-import
+from benchmarks import bench_demos  # pylint: disable=unused-import
+from utils import logger
+
+"""
+Run the benchmarks of mg-tool-api, from the root of the repository:
+
+    python -m benchmarks -o results.json
+    python -m benchmarks --full jsonapp
+    python -m benchmarks --compare baseline.json -o results.json
+
+The results are written as JSON; when compared with a baseline, the exit
+status is 1 if any benchmark is slower than the threshold allows.
+"""  # pylint: disable=pointless-string-statement
+
+
+def _print_result(result):
+    """
+    Print a line summarising the result of a benchmark.
+    """
+    line = "{name:<32} {param!s:>8} median {median:10.4f}s  min {min:10.4f}s".format(**result)
+    if "ops_per_sec" in result:
+        line += "  {:12.1f} ops/s".format(result["ops_per_sec"])
+    print(line)
+
+
+def main(argv=None):
+    """
+    Parse the command line and run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="mg-tool-api benchmarks")
+    parser.add_argument("names", nargs="*",
+                        help="run only the benchmarks whose name starts with these")
+    parser.add_argument("-o", "--output", help="path of the JSON results")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="number of timings of each benchmark (default: 5)")
+    parser.add_argument("--full", action="store_true",
+                        help="also run the largest sizes")
+    parser.add_argument("--compare", help="path of the JSON results of a baseline")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio reported as a regression (default: 1.2)")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="log threshold while running the benchmarks (default: WARNING)")
+    args = parser.parse_args(argv)
+
+    logger.set_level(args.log_level)
+    results = harness.run_all(args.names, args.repeat, args.full, _print_result)
+    if args.output:
+        harness.write_results(results, args.output)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = 0
+        for name, param, before, after, ratio, regressed in harness.compare(
+                baseline, results, args.threshold):
+            regressions += regressed
+            print("{:<32} {!s:>8} {:10.4f}s -> {:10.4f}s  x{:.2f}{}".format(
+                name, param, before, after, ratio, "  REGRESSION" if regressed else ""))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from apps.workflowapp import WorkflowApp
+from basic_modules.metadata import Metadata
+from benchmarks.harness import benchmark, silenced
+from summer_demo import SimpleWorkflow
+from summer_demo2 import SimpleWorkflow2
+from utils import runtime
+
+"""
+End-to-end benchmarks of the demo Workflows, run with the WorkflowApp and
+the backend configured by the environment (see utils.runtime);
+each run includes waiting for all its tasks, e.g. deleting intermediates.
+"""  # pylint: disable=pointless-string-statement
+
+
+@benchmark("demo.summer_demo")
+def bench_summer_demo(_):
+    """
+    SimpleWorkflow of summer_demo, on two inputs.
+    """
+    directory = tempfile.mkdtemp()
+    inputs = []
+    for i, value in enumerate((5, 9)):
+        inputs.append(os.path.join(directory, "file{}".format(i)))
+        with open(inputs[-1], "w") as handle:
+            handle.write(str(value))
+
+    def _run():
+        # The intermediate outputs of SimpleWorkflow are relative paths
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with silenced():
+                WorkflowApp().launch(
+                    SimpleWorkflow,
+                    {"number1": inputs[0], "number2": inputs[1]},
+                    {"number1": Metadata("Number", "plainText"),
+                     "number2": Metadata("Number", "plainText")},
+                    {"output": os.path.join(directory, "output")}, {})
+            runtime.barrier()
+        finally:
+            os.chdir(cwd)
+    return _run, lambda: shutil.rmtree(directory)
+
+
+@benchmark("demo.summer_demo2", params=[10, 100], full_params=[1000, 10000])
+def bench_summer_demo2(count):
+    """
+    SimpleWorkflow2 of summer_demo2, on the given number of inputs.
+    """
+    directory = tempfile.mkdtemp()
+    inputs = []
+    for i in range(count):
+        inputs.append(os.path.join(directory, "file{}".format(i)))
+        with open(inputs[-1], "w") as handle:
+            handle.write(str(i))
+
+    def _run():
+        with silenced():
+            WorkflowApp().launch(
+                SimpleWorkflow2,
+                {"number": inputs},
+                {"number": [Metadata("Number", "plainText", path) for path in inputs]},
+                {"output": os.path.join(directory, "output{}")}, {})
+            runtime.barrier()
+        return count
+    return _run, lambda: shutil.rmtree(directory)
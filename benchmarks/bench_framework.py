@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+
+from basic_modules.app import App
+from basic_modules.metadata import Metadata
+from basic_modules.tool import Tool
+from benchmarks.harness import benchmark
+from utils import logger
+
+"""
+Benchmarks of the overhead of the framework: App.launch, Metadata.get_child
+and the logger.
+"""  # pylint: disable=pointless-string-statement
+
+LAUNCHES = 1000
+CHILDREN = 10000
+MESSAGES = 20000
+
+
+class NoopTool(Tool):
+    """
+    Tool doing nothing, to measure the overhead of App.launch.
+    """
+
+    def run(self, input_files, input_metadata, output_files):
+        return output_files, {}
+
+
+@benchmark("app.launch_noop")
+def bench_launch(_):
+    """
+    App.launch round-trip with a Tool doing nothing.
+    """
+    app = App()
+
+    def _run():
+        for _ in range(LAUNCHES):
+            app.launch(NoopTool, {}, {}, {"output": "/tmp/noop"}, {})
+        return LAUNCHES
+    return _run
+
+
+def _parent(size):
+    """
+    Returns a Metadata with the given number of meta_data entries.
+    """
+    return Metadata(
+        "Number", "plainText", "/tmp/parent",
+        meta_data=dict(("key{}".format(i), {"value": i}) for i in range(size)))
+
+
+@benchmark("metadata.get_child", params=[10, 1000], full_params=[100000])
+def bench_get_child(size):
+    """
+    Metadata.get_child of a parent with the given meta_data size.
+    """
+    parent = _parent(size)
+
+    def _run():
+        for i in range(CHILDREN):
+            Metadata.get_child(parent, "/tmp/child{}".format(i))
+        return CHILDREN
+    return _run
+
+
+@benchmark("metadata.get_child_chain", params=[10, 1000], full_params=[100000])
+def bench_get_child_chain(size):
+    """
+    Chain of children, each derived from the previous one and a shared
+    input, as in SimpleTool3.
+    """
+    first = _parent(size)
+    other = Metadata("Number", "plainText", "/tmp/other", meta_data={"tool": "other"})
+
+    def _run():
+        metadata = first
+        for i in range(CHILDREN):
+            metadata = Metadata.get_child([metadata, other], "/tmp/child{}".format(i))
+        return CHILDREN
+    return _run
+
+
+@benchmark("metadata.get_child_write", params=[10, 1000])
+def bench_get_child_write(size):
+    """
+    Metadata.get_child followed by a change of the meta_data of the child,
+    which copies it.
+    """
+    parent = _parent(size)
+    children = CHILDREN // 10
+
+    def _run():
+        for i in range(children):
+            child = Metadata.get_child(parent, "/tmp/child{}".format(i))
+            child.meta_data["tool"] = "child"
+        return children
+    return _run
+
+
+@benchmark("logger.throughput", params=["sync", "async", "filtered"])
+def bench_logger(mode):
+    """
+    Logging of INFO messages with arguments, written synchronously,
+    asynchronously, or dropped by the level threshold.
+    """
+    devnull = open(os.devnull, "w")
+
+    def _run():
+        stdout, sys.stdout = sys.stdout, devnull
+        level = logger.get_level()
+        logger.set_level(logger.WARNING if mode == "filtered" else logger.DEBUG)
+        if mode == "async":
+            logger.enable_async()
+        try:
+            for i in range(MESSAGES):
+                logger.info("Message {} of {}", i, MESSAGES)
+            logger.flush()
+        finally:
+            if mode == "async":
+                logger.disable_async()
+            logger.set_level(level)
+            sys.stdout = stdout
+        return MESSAGES
+    return _run, devnull.close
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from apps.jsonapp import JSONApp
+from basic_modules.metadata import Metadata
+from benchmarks.harness import benchmark
+from utils import json_stream
+
+"""
+Benchmarks of the JSON files read and written by JSONApp.
+"""  # pylint: disable=pointless-string-statement
+
+SIZES = [10 ** 3, 10 ** 4]
+FULL_SIZES = [10 ** 5, 10 ** 6]
+
+# Number of entries looked up in input_metadata.json
+LOOKUPS = 10
+
+# Launch of SimpleTool1 by JSONApp in a new interpreter, including its imports
+STARTUP_SCRIPT = """
+from apps.jsonapp import JSONApp
+from tools_demos.simpleTool1 import SimpleTool1
+JSONApp().launch(SimpleTool1, {!r}, {!r}, {!r})
+"""
+
+
+def _write_input_metadata(directory, count):
+    """
+    Write an input_metadata.json with the given number of entries.
+    """
+    path = os.path.join(directory, "input_metadata.json")
+    with open(path, "w") as handle:
+        handle.write("[\n")
+        for i in range(count):
+            if i:
+                handle.write(",\n")
+            json.dump({
+                "_id": "ID{}".format(i),
+                "data_type": "Number",
+                "file_type": "plainText",
+                "file_path": "/tmp/file{}".format(i),
+                "meta_data": {"visible": True, "tool": "benchmark"},
+                "taxon_id": 9606,
+                "sources": []
+            }, handle)
+        handle.write("\n]\n")
+    return path
+
+
+@benchmark("jsonapp.read_metadata_all", params=SIZES, full_params=FULL_SIZES)
+def bench_read_all(count):
+    """
+    JSONApp._read_metadata of all the entries of input_metadata.json.
+    """
+    directory = tempfile.mkdtemp()
+    path = _write_input_metadata(directory, count)
+
+    def _run():
+        JSONApp()._read_metadata(path)  # pylint: disable=protected-access
+        return count
+    return _run, lambda: shutil.rmtree(directory)
+
+
+@benchmark("jsonapp.read_metadata_ids", params=SIZES, full_params=FULL_SIZES)
+def bench_read_ids(count):
+    """
+    JSONApp._read_metadata of a few entries spread over input_metadata.json,
+    without the index of previous reads.
+    """
+    directory = tempfile.mkdtemp()
+    path = _write_input_metadata(directory, count)
+    ids = ["ID{}".format(i * count // LOOKUPS) for i in range(LOOKUPS)]
+
+    def _run():
+        json_stream._INDEXES.clear()  # pylint: disable=protected-access
+        JSONApp()._read_metadata(path, ids)  # pylint: disable=protected-access
+        return LOOKUPS
+    return _run, lambda: shutil.rmtree(directory)
+
+
+@benchmark("jsonapp.write_results", params=SIZES, full_params=FULL_SIZES)
+def bench_write_results(count):
+    """
+    JSONApp._write_results of a role with the given number of outputs.
+    """
+    directory = tempfile.mkdtemp()
+    parent = Metadata("Number", "plainText", "/tmp/input", meta_data={"tool": "benchmark"})
+    paths = ["/tmp/output{}".format(i) for i in range(count)]
+    metadata = [Metadata.get_child(parent, path) for path in paths]
+    results_path = os.path.join(directory, "results.json")
+
+    def _run():
+        JSONApp()._write_results(  # pylint: disable=protected-access
+            {}, {}, {"output": paths}, {"output": metadata}, results_path)
+        return count
+    return _run, lambda: shutil.rmtree(directory)
+
+
+@benchmark("jsonapp.startup")
+def bench_startup(_):
+    """
+    JSONApp launch of SimpleTool1 in a new interpreter, i.e. the cost of a
+    short job, including the imports of the runtime (see utils.runtime).
+    """
+    directory = tempfile.mkdtemp()
+    input_path = os.path.join(directory, "input")
+    with open(input_path, "w") as handle:
+        handle.write("1")
+    config_path = os.path.join(directory, "config.json")
+    with open(config_path, "w") as handle:
+        json.dump({
+            "input_files": [{"name": "input", "value": "ID1"}],
+            "output_files": [{
+                "name": "output", "file": {"file_path": os.path.join(directory, "output")}}],
+            "arguments": []}, handle)
+    input_metadata_path = os.path.join(directory, "input_metadata.json")
+    with open(input_metadata_path, "w") as handle:
+        json.dump([{
+            "_id": "ID1", "data_type": "Number", "file_type": "plainText",
+            "file_path": input_path, "meta_data": {}, "taxon_id": 0, "sources": []}], handle)
+    script = STARTUP_SCRIPT.format(
+        config_path, input_metadata_path, os.path.join(directory, "results.json"))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def _run():
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call([sys.executable, "-c", script], cwd=root, stdout=devnull)
+    return _run, lambda: shutil.rmtree(directory)
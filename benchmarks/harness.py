@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+"""
+Minimal benchmark harness.
+
+A benchmark is a function registered with the benchmark decorator, which
+receives one of its parameters, prepares the data it needs, and returns a
+callable running the measured operation; or a tuple (callable, cleanup)
+if the data has to be removed afterwards. The callable can return the
+number of operations it performed, which is used to report a throughput.
+
+Each benchmark is run once per parameter, and its callable is timed
+"repeat" times; the results are reported as JSON (see write_results), so
+that they can be compared between versions (see compare).
+"""  # pylint: disable=pointless-string-statement
+
+SCHEMA_VERSION = 1
+
+BENCHMARKS = []
+
+
+def benchmark(name, params=(None,), full_params=()):
+    """
+    Register a benchmark.
+
+
+    Parameters
+    ----------
+    name : str
+        Name of the benchmark
+    params : list
+        Parameters the benchmark is run with
+    full_params : list
+        Additional parameters, only used for full runs (e.g. larger sizes)
+    """
+    def _register(function):
+        BENCHMARKS.append({
+            "name": name, "function": function,
+            "params": list(params), "full_params": list(full_params)})
+        return function
+    return _register
+
+
+@contextlib.contextmanager
+def silenced():
+    """
+    Context manager discarding what is printed to stdout, e.g. by Tools.
+    """
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def _median(values):
+    """
+    Returns the median of a list of numbers.
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def run_benchmark(entry, param, repeat):
+    """
+    Run a benchmark with one of its parameters.
+
+
+    Returns
+    -------
+    dict
+        name, param, times (seconds), min, median, mean, ops and
+        ops_per_sec (if the benchmark reports its number of operations)
+    """
+    prepared = entry["function"](param)
+    run, cleanup = prepared if isinstance(prepared, tuple) else (prepared, None)
+    times = []
+    ops = None
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            ops = run()
+            times.append(time.time() - start)
+    finally:
+        if cleanup is not None:
+            cleanup()
+
+    result = {
+        "name": entry["name"],
+        "param": param,
+        "repeat": repeat,
+        "times": times,
+        "min": min(times),
+        "median": _median(times),
+        "mean": sum(times) / len(times)
+    }
+    if ops:
+        result["ops"] = ops
+        result["ops_per_sec"] = ops / result["median"] if result["median"] else None
+    return result
+
+
+def _git_revision():
+    """
+    Returns the git revision of the working tree, or None.
+    """
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(names=None, repeat=5, full=False, report=None):
+    """
+    Run the registered benchmarks.
+
+
+    Parameters
+    ----------
+    names : list
+        Run only the benchmarks whose name starts with one of these
+    repeat : int
+        Number of timings of each benchmark
+    full : bool
+        Also run the parameters reserved for full runs
+    report : function
+        Called with each result as it is available
+
+
+    Returns
+    -------
+    dict
+        Machine-readable results, with the environment they were obtained in
+    """
+    results = []
+    for entry in BENCHMARKS:
+        if names and not any(entry["name"].startswith(name) for name in names):
+            continue
+        params = entry["params"] + (entry["full_params"] if full else [])
+        for param in params:
+            result = run_benchmark(entry, param, repeat)
+            results.append(result)
+            if report is not None:
+                report(result)
+
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "executor": os.environ.get("MUG_LOCAL_EXECUTOR", "serial"),
+        "backend": os.environ.get("MUG_BACKEND"),
+        "benchmarks": results
+    }
+
+
+def write_results(results, path):
+    """
+    Write the results of run_all to a JSON file.
+    """
+    with open(path, "w") as handle:
+        json.dump(results, handle, indent=4, separators=(',', ': '), sort_keys=True)
+
+
+def compare(baseline, results, threshold=1.2):
+    """
+    Compare results with a baseline, by the median time of each benchmark.
+
+
+    Returns
+    -------
+    list
+        (name, param, baseline median, median, ratio, regressed) for each
+        benchmark present in both, where regressed is True if the ratio is
+        above the threshold
+    """
+    baseline_medians = dict(
+        ((bench["name"], json.dumps(bench["param"])), bench["median"])
+        for bench in baseline["benchmarks"])
+    comparison = []
+    for bench in results["benchmarks"]:
+        key = (bench["name"], json.dumps(bench["param"]))
+        if key not in baseline_medians:
+            continue
+        before = baseline_medians[key]
+        ratio = bench["median"] / before if before else float("inf")
+        comparison.append(
+            (bench["name"], bench["param"], before, bench["median"], ratio, ratio > threshold))
+    return comparison
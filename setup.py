@@ -34,7 +34,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[
-        'configparser', 'pytest'
+        'configparser', 'pytest', 'futures; python_version < "3"'
     ],
     setup_requires=[
         'pytest-runner',
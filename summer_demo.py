@@ -82,7 +82,8 @@ class SimpleWorkflow(Workflow):  # pylint: disable=too-few-public-methods
         simple_tool1 = SimpleTool1(self.configuration)
 
         try:
-            output1, outmd1 = simple_tool1.run(
+            output1, outmd1 = self.run_tool(
+                simple_tool1,
                 # Use remap to convert role "number1" to "input" for simpleTool1
                 remap(input_files, input="number1"),
                 remap(metadata, input="number1"),
@@ -95,7 +96,8 @@ class SimpleWorkflow(Workflow):  # pylint: disable=too-few-public-methods
 
         logger.info("\t1.b (Instantiate Tool) and run")
         try:
-            output2, outmd2 = simple_tool1.run(
+            output2, outmd2 = self.run_tool(
+                simple_tool1,
                 # Use remap to convert role "number2" to "input" for simpleTool1
                 remap(input_files, input="number2"),
                 remap(metadata, input="number2"),
@@ -106,10 +108,14 @@ class SimpleWorkflow(Workflow):  # pylint: disable=too-few-public-methods
             return {}, {}
         logger.progress(75)  # out of 100
 
+        # file1.out and file2.out are only used as inputs of SimpleTool2
+        self.add_intermediate([output1["output"], output2["output"]])
+
         logger.info("\t2. Instantiate Tool and run")
         simple_tool2 = SimpleTool2(self.configuration)
         try:
-            output3, outmd3 = simple_tool2.run(
+            output3, outmd3 = self.run_tool(
+                simple_tool2,
                 # Instead of using remap, here we re-build dicts to convert input roles
                 {"input1": output1["output"], "input2": output2["output"]},
                 {"input1": outmd1["output"], "input2": outmd2["output"]},
@@ -96,12 +96,15 @@ class SimpleWorkflow2(Workflow):  # pylint: disable=too-few-public-methods
             input_metadata = metadata["number"][i]
             logger.info("\t1.b run {}".format(i))
             try:
-                output, outmd = simple_tool1.run(
+                output, outmd = self.run_tool(
+                    simple_tool1,
                     {"input": path},
                     {"input": input_metadata},
                     {"output": path + '.out'})
                 outputs.append(output["output"])
                 out_mds.append(outmd["output"])
+                # Only used as input of SimpleTool3
+                self.add_intermediate(output["output"])
             except Exception as err:  # pylint: disable=broad-except
                 logger.error("Tool 1, run {} failed: {}", i, err)
             logger.progress(75 * i / len(input_files["number"]))
@@ -110,7 +113,8 @@ class SimpleWorkflow2(Workflow):  # pylint: disable=too-few-public-methods
         # Apply SimpleTool3 to all outputs of first step
         simple_tool3 = SimpleTool3(self.configuration)
         try:
-            output3, outmd3 = simple_tool3.run(
+            output3, outmd3 = self.run_tool(
+                simple_tool3,
                 {"input": outputs},
                 {"input": out_mds},
                 output_files)
@@ -0,0 +1,713 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import gc
+import json
+
+import pytest
+
+from apps.jsonapp import JSONApp
+from basic_modules.app import App
+from basic_modules.metadata import Metadata
+from basic_modules.tool import Tool
+from tools_demos.simpleTool1 import SimpleTool1
+from tools_demos.simpleTool3 import SimpleTool3
+from utils import hashing
+from utils import logger
+from utils import runtime
+
+
+def _write_input(tmpdir, name, value):
+    """
+    Write an input file for SimpleTool1
+    """
+    path = tmpdir.join(name)
+    path.write(str(value))
+    return str(path)
+
+
+def _json_job(tmpdir, index):
+    """
+    Write the config.json and input_metadata.json of a run of SimpleTool1
+    """
+    config = {
+        "input_files": [{"name": "input", "value": "ID1"}],
+        "output_files": [{
+            "name": "output",
+            "file": {"file_path": str(tmpdir.join("output{}".format(index)))}}],
+        "arguments": []}
+    metadata = [{
+        "_id": "ID1", "data_type": "Number", "file_type": "plainText",
+        "file_path": _write_input(tmpdir, "input{}".format(index), index),
+        "meta_data": {}, "taxon_id": 0, "sources": []}]
+    tmpdir.join("config{}.json".format(index)).write(json.dumps(config))
+    tmpdir.join("in_metadata{}.json".format(index)).write(json.dumps(metadata))
+    return (
+        str(tmpdir.join("config{}.json".format(index))),
+        str(tmpdir.join("in_metadata{}.json".format(index))),
+        str(tmpdir.join("results{}.json".format(index))))
+
+
+@pytest.mark.app
+def test_launch_many(tmpdir):
+    """
+    Test running a Tool over multiple inputs
+    """
+    jobs = []
+    for i in range(10):
+        jobs.append((
+            {"input": _write_input(tmpdir, "input{}".format(i), i)},
+            {"input": Metadata("Number", "plainText")},
+            {"output": str(tmpdir.join("output{}".format(i)))}))
+    # The input file of the last job is missing
+    jobs.append((
+        {"input": str(tmpdir.join("missing"))},
+        {"input": Metadata("Number", "plainText")},
+        {"output": str(tmpdir.join("output_missing"))}))
+
+    results = list(App().launch_many(SimpleTool1, jobs, {}, max_workers=3))
+    assert sorted(result.index for result in results) == list(range(11))
+
+    for result in results:
+        assert result.error is None
+        if result.index < 10:
+            with open(result.output_files["output"]) as handle:
+                assert handle.read() == str(result.index + 1)
+        else:
+            assert result.output_files == {}
+
+
+@pytest.mark.app
+def test_launch_backend(tmpdir):
+    """
+    Test selecting the backend running the tasks in the configuration, for
+    the duration of the launch
+    """
+    from utils import local_runtime
+
+    class BackendTool(SimpleTool1):  # pylint: disable=too-few-public-methods
+        """
+        SimpleTool1 recording the backend running its tasks
+        """
+        backends = []
+
+        def run(self, input_files, input_metadata, output_files):
+            self.backends.append(runtime.active_backend().name)
+            return super(BackendTool, self).run(input_files, input_metadata, output_files)
+
+    runtime.use("serial")
+    args = ({"input": _write_input(tmpdir, "input", 1)},
+            {"input": Metadata("Number", "plainText")},
+            {"output": str(tmpdir.join("output"))})
+    App().launch(BackendTool, *(args + ({"backend": "thread", "backend_workers": 2},)))
+    assert BackendTool.backends == ["thread"]
+    assert tmpdir.join("output").read() == "2"
+    assert runtime.active_backend().name == "serial"
+    assert local_runtime.get_runtime().executor == "serial"
+
+    # Launches cannot select another backend than a running one
+    with runtime.using("thread"):
+        App().launch(BackendTool, *(args + ({"backend": "thread"},)))
+        with pytest.raises(RuntimeError):
+            App().launch(BackendTool, *(args + ({"backend": "serial"},)))
+        with pytest.raises(RuntimeError):
+            runtime.use("serial")
+        assert runtime.active_backend().name == "thread"
+    assert runtime.active_backend().name == "serial"
+
+    # Nor can the jobs of a batch
+    jobs = [_json_job(tmpdir, i) for i in range(2)]
+    for i, backend in enumerate(["thread", "serial"]):
+        config = json.loads(tmpdir.join("config{}.json".format(i)).read())
+        config["arguments"].append({"name": "backend", "value": backend})
+        tmpdir.join("config{}.json".format(i)).write(json.dumps(config))
+    errors = dict((result.index, result.error)
+                  for result in JSONApp().launch_many(SimpleTool1, jobs, max_workers=1))
+    assert errors[0] is None and isinstance(errors[1], RuntimeError)
+    assert runtime.active_backend().name == "serial"
+
+
+@pytest.mark.app
+def test_launch_log_level(tmpdir):
+    """
+    Test setting the log thresholds in the configuration, for the duration
+    of the launch
+    """
+    class LevelTool(SimpleTool1):  # pylint: disable=too-few-public-methods
+        """
+        SimpleTool1 recording the global log threshold during its run
+        """
+        levels = []
+
+        def run(self, input_files, input_metadata, output_files):
+            self.levels.append(logger.get_level())
+            return super(LevelTool, self).run(input_files, input_metadata, output_files)
+
+    threshold = logger.get_level()
+    args = ({"input": _write_input(tmpdir, "input", 1)},
+            {"input": Metadata("Number", "plainText")},
+            {"output": str(tmpdir.join("output"))})
+    App().launch(LevelTool, *(args + ({"log_level": "ERROR,utils=DEBUG"},)))
+    assert LevelTool.levels == [logger.ERROR]
+    assert logger.get_level() == threshold
+    assert logger.get_level("utils.staging") == threshold
+
+    # The jobs of a batch cannot set other levels than a running one
+    jobs = [_json_job(tmpdir, i) for i in range(2)]
+    for i, level in enumerate(["ERROR", "WARNING"]):
+        config = json.loads(tmpdir.join("config{}.json".format(i)).read())
+        config["arguments"].append({"name": "log_level", "value": level})
+        tmpdir.join("config{}.json".format(i)).write(json.dumps(config))
+    errors = dict((result.index, result.error)
+                  for result in JSONApp().launch_many(SimpleTool1, jobs, max_workers=1))
+    assert errors[0] is None and isinstance(errors[1], RuntimeError)
+    assert logger.get_level() == threshold
+
+
+@pytest.mark.app
+def test_json_launch_many(tmpdir):
+    """
+    Test running a Tool over multiple JSON-configured inputs
+    """
+    jobs = [_json_job(tmpdir, i) for i in range(4)]
+    jobs.append((str(tmpdir.join("missing.json")),) * 3)
+
+    results = list(JSONApp().launch_many(SimpleTool1, jobs, max_workers=2))
+    assert sorted(result.index for result in results) == list(range(5))
+
+    for result in results:
+        if result.index == 4:
+            assert result.error is not None
+            continue
+        assert result.error is None
+        with open(str(tmpdir.join("results{}.json".format(result.index)))) as handle:
+            output = json.load(handle)["output_files"][0]
+        assert output["file_path"] == str(tmpdir.join("output{}".format(result.index)))
+
+
+@pytest.mark.app
+def test_cache_app(tmpdir):
+    """
+    Test restoring the results of a Tool from the cache
+    """
+    from apps.cacheapp import CacheApp
+
+    class TestCacheApp(CacheApp):  # pylint: disable=too-few-public-methods
+        """
+        CacheApp using a temporary directory
+        """
+        cache_dir = str(tmpdir.join("cache"))
+
+    runs = []
+
+    class CountingTool(SimpleTool1):  # pylint: disable=too-few-public-methods
+        """
+        SimpleTool1 recording its runs
+        """
+        def inputPlusOne(self, input_file, output_file):
+            runs.append(input_file)
+            return super(CountingTool, self).inputPlusOne(input_file, output_file)
+
+    input_file = _write_input(tmpdir, "input", 1)
+    output_file = str(tmpdir.join("output"))
+    args = ({"input": input_file}, {"input": Metadata("Number", "plainText")},
+            {"output": output_file})
+
+    app = TestCacheApp()
+    app.launch(CountingTool, *(args + ({},)))
+    tmpdir.join("output").remove()
+    output_files, output_metadata = app.launch(CountingTool, *(args + ({},)))
+    assert len(runs) == 1
+    assert output_files == {"output": output_file}
+    assert output_metadata["output"].data_type == "Number"
+    assert tmpdir.join("output").read() == "2"
+
+    # Changing the content of the input invalidates the cache
+    _write_input(tmpdir, "input", 5)
+    app.launch(CountingTool, *(args + ({},)))
+    assert len(runs) == 2
+
+    app.bypass_cache = True
+    app.launch(CountingTool, *(args + ({},)))
+    assert len(runs) == 3
+
+    # Apps sharing the directory keep their own bound
+    class SmallCacheApp(TestCacheApp):  # pylint: disable=too-few-public-methods
+        """
+        TestCacheApp with a smaller cache
+        """
+        cache_max_size = 1024
+
+    small = SmallCacheApp()._get_cache()  # pylint: disable=protected-access
+    assert small.max_size == 1024
+    assert TestCacheApp()._get_cache().max_size == TestCacheApp.cache_max_size  # pylint: disable=protected-access
+    assert small.cache_dir == TestCacheApp.cache_dir
+
+
+@pytest.mark.app
+def test_result_cache_eviction(tmpdir):
+    """
+    Test the eviction of the least recently used results
+    """
+    import os
+    from utils.result_cache import ResultCache
+
+    cache = ResultCache(str(tmpdir.join("cache")), max_size=25)
+    for i in range(3):
+        output_file = _write_input(tmpdir, "output{}".format(i), "x" * 10)
+        cache.put("key{}".format(i), {"output": output_file},
+                  {"output": Metadata("Text", "plainText", output_file)})
+        entry = str(tmpdir.join("cache", "ke", "key{}".format(i)))
+        os.utime(entry, (i, i))
+        if i == 1:
+            assert cache.get("key0") is not None
+
+    assert cache.get("key1") is None
+    assert cache.get("key0") is not None
+    assert cache.get("key2") is not None
+    assert cache.size() == 20
+
+    # The entries are only scanned again when some have to be evicted
+    scans = []
+    entries = cache._entries  # pylint: disable=protected-access
+
+    def _counting_entries():
+        scans.append(None)
+        return entries()
+
+    cache._entries = _counting_entries  # pylint: disable=protected-access
+    cache.max_size = 1000
+    for i in range(3, 10):
+        output_file = _write_input(tmpdir, "output{}".format(i), "x" * 10)
+        cache.put("key{}".format(i), {"output": output_file},
+                  {"output": Metadata("Text", "plainText", output_file)})
+    assert scans == []
+
+    # Inputs without metadata
+    key = ResultCache.key(SimpleTool1, {}, {"input": output_file}, {"input": None}, {})
+    assert key != ResultCache.key(
+        SimpleTool1, {}, {"input": output_file},
+        {"input": Metadata("Text", "plainText", output_file)}, {})
+    assert ResultCache.key(
+        SimpleTool1, {}, {"inputs": [output_file]}, {"inputs": [None]}, {})
+
+
+@pytest.mark.app
+def test_staging(tmpdir):
+    """
+    Test staging files, including lists of files, once per source
+    """
+    from utils import staging
+
+    shared = tmpdir.mkdir("shared")
+    genome = _write_input(shared, "genome.fa", "ACGT" * 1000)
+    reads = [_write_input(shared, "reads{}.fq".format(i), i) for i in range(4)]
+
+    stager = staging.Stager(str(tmpdir.join("staging")), max_workers=4, link=False)
+    staged = stager.stage_files({"genome": genome, "reads": reads + [genome], "bam": None})
+    assert staged["bam"] is None
+    assert staged["reads"][-1] == staged["genome"] != genome
+    for source, path in zip(reads + [genome], staged["reads"]):
+        assert path.startswith(stager.staging_dir)
+        with open(source) as src, open(path) as dst:
+            assert src.read() == dst.read()
+    assert stager.stats["copy"] + stager.stats["reflink"] == 5
+
+    # Staged again by another process on the node, until the source changes
+    other = staging.Stager(stager.staging_dir)
+    assert other.stage(genome) == staged["genome"]
+    assert other.stats["reused"] == 1
+    shared.join("genome.fa").write("ACGT")
+    assert other.stage(genome) != staged["genome"]
+    assert other.stats["link"] == 0
+
+    copy = str(tmpdir.join("copy"))
+    assert staging.copy_file(genome, copy, block_size=3) == hashing.file_digest(genome)
+
+
+@pytest.mark.app
+def test_staged_launch(tmpdir, monkeypatch):
+    """
+    Test launching a Tool on staged input files
+    """
+    monkeypatch.setenv("MUG_STAGING_DIR", str(tmpdir.join("staging")))
+    app = App()
+    output_files, _ = app.launch(
+        SimpleTool1, {"input": _write_input(tmpdir, "input", 1)},
+        {"input": Metadata("Number", "plainText")},
+        {"output": str(tmpdir.join("output"))}, {})
+    assert tmpdir.join("output").read() == "2"
+    assert "pre_run.stage_in" in app.timings
+    assert app._get_stager().stats["reused"] == 0  # pylint: disable=protected-access
+
+
+@pytest.mark.app
+def test_unstaged_outputs(tmpdir):
+    """
+    Test moving the outputs of a Tool as soon as each of them is complete
+    """
+    from apps.workflowapp import WorkflowApp
+
+    inputs = [_write_input(tmpdir, "input{}".format(i), i) for i in range(4)]
+    app = WorkflowApp()
+    app.unstaging_dir = str(tmpdir.join("results"))
+    try:
+        output_files, output_metadata = app.launch(
+            SimpleTool3, {"input": inputs},
+            {"input": [Metadata("Number", "plainText", path) for path in inputs]},
+            {"output": str(tmpdir.join("sum{}"))},
+            {"backend": "thread", "backend_workers": 2})
+    finally:
+        runtime.use("serial")
+
+    assert output_files == {"output": [
+        str(tmpdir.join("results", "sum{}".format(i))) for i in range(3)]}
+    assert tmpdir.join("results", "sum2").read() == "6"
+    assert not tmpdir.join("sum0").exists()
+    for i, metadata in enumerate(output_metadata["output"]):
+        assert metadata.file_path == output_files["output"][i]
+        report = metadata.meta_data["unstaging"]
+        assert report["source"] == str(tmpdir.join("sum{}".format(i)))
+        assert report["method"] in ("reflink", "link", "copy")
+    assert "post_run.unstage" in app.timings
+
+
+@pytest.mark.app
+def test_unstaging_paths(tmpdir, monkeypatch):
+    """
+    Test that unstaged outputs keep their path relative to the working
+    directory, and that two files unstaged to the same path are rejected
+    """
+    from utils.staging import StagingError, Unstager
+
+    monkeypatch.chdir(str(tmpdir))
+    jobs = []
+    for i in range(4):
+        tmpdir.mkdir("job{}".format(i))
+        jobs.append((
+            {"input": _write_input(tmpdir, "input{}".format(i), i)},
+            {"input": Metadata("Number", "plainText")},
+            {"output": str(tmpdir.join("job{}".format(i), "out"))}))
+
+    # The runs share their Tool instance, and their outputs have the same names
+    app = App()
+    app.unstaging_dir = str(tmpdir.join("results"))
+    results = list(app.launch_many(StreamingTool, jobs, {"count": 2}, max_workers=4))
+    assert [result.error for result in results] == [None] * 4
+    for result in results:
+        assert result.output_files["output"] == [
+            str(tmpdir.join("results", "job{}".format(result.index), "out{}".format(i)))
+            for i in range(2)]
+        assert tmpdir.join("results", "job{}".format(result.index), "out1").read() == "1"
+
+    unstager = Unstager(str(tmpdir.join("other")), root=str(tmpdir.join("job0")))
+    try:
+        tmpdir.join("job0", "out0").write("0")
+        future = unstager.submit(str(tmpdir.join("job0", "out0")))
+        assert future.target == str(tmpdir.join("other", "out0"))
+        # Not under the root: moved by its name
+        tmpdir.join("out0").write("other")
+        with pytest.raises(StagingError):
+            unstager.submit(str(tmpdir.join("out0")))
+        assert unstager.collect([future])[0]["path"] == future.target
+        assert unstager.collect([unstager.submit(str(tmpdir.join("out0")))])
+    finally:
+        unstager.close()
+    assert tmpdir.join("other", "out0").read() == "other"
+
+
+@pytest.mark.app
+def test_launch_timings(tmpdir):
+    """
+    Test the timings of the phases of a launch
+    """
+    class TimedJSONApp(JSONApp):  # pylint: disable=too-few-public-methods
+        """
+        JSONApp reporting its timings
+        """
+        report_timings = True
+
+    app = TimedJSONApp()
+    config_path, input_metadata_path, results_path = _json_job(tmpdir, 0)
+    assert app.launch(SimpleTool1, config_path, input_metadata_path, results_path)
+
+    assert list(app.timings) == [
+        "read_inputs", "instantiate_tool", "pre_run", "run",
+        "post_run.compss_wait_on", "post_run", "write_results"]
+    assert app.timings["post_run"] >= app.timings["post_run.compss_wait_on"]
+
+    with open(results_path) as handle:
+        timings = json.load(handle)["output_files"][0]["meta_data"]["timings"]
+    assert "run" in timings and "write_results" not in timings
+    with open(str(tmpdir.join("results0.timings.json"))) as handle:
+        assert json.load(handle) == app.timings
+
+    app = JSONApp()
+    config_path, input_metadata_path, results_path = _json_job(tmpdir, 1)
+    app.launch(SimpleTool1, config_path, input_metadata_path, results_path)
+    assert "run" in app.timings
+    assert not tmpdir.join("results1.timings.json").exists()
+    with open(results_path) as handle:
+        assert "timings" not in json.load(handle)["output_files"][0]["meta_data"]
+
+
+
+@pytest.mark.app
+def test_json_profiling(tmpdir):
+    """
+    Test the profiles captured with the "profiling" argument
+    """
+    import os
+    import pstats
+
+    config_path, input_metadata_path, results_path = _json_job(tmpdir, 0)
+    config = json.loads(tmpdir.join("config0.json").read())
+    config["arguments"].append({"name": "profiling", "value": "cprofile, tracemalloc"})
+    tmpdir.join("config0.json").write(json.dumps(config))
+
+    assert JSONApp().launch(SimpleTool1, config_path, input_metadata_path, results_path)
+    with open(results_path) as handle:
+        outputs = dict(
+            (output["name"], output) for output in json.load(handle)["output_files"])
+
+    assert sorted(outputs) == ["output", "profiling_cprofile", "profiling_tracemalloc"]
+    assert outputs["profiling_cprofile"]["data_type"] == "profiling"
+    stats = pstats.Stats(outputs["profiling_cprofile"]["file_path"])
+    assert any(func[2] == "run" for func in stats.stats)
+    with open(outputs["profiling_tracemalloc"]["file_path"]) as handle:
+        assert handle.readline().startswith("Peak traced memory")
+
+    # Launches writing their outputs to the same directory keep their profiles
+    config_path, input_metadata_path, results_path = _json_job(tmpdir, 1)
+    tmpdir.join("config1.json").write(json.dumps(config).replace("output0", "output1"))
+    assert JSONApp().launch(SimpleTool1, config_path, input_metadata_path, results_path)
+    with open(results_path) as handle:
+        profile = [output["file_path"] for output in json.load(handle)["output_files"]
+                   if output["name"] == "profiling_cprofile"][0]
+    assert os.path.dirname(profile) == os.path.dirname(
+        outputs["profiling_cprofile"]["file_path"])
+    assert profile != outputs["profiling_cprofile"]["file_path"]
+    assert os.path.isfile(outputs["profiling_cprofile"]["file_path"])
+
+
+@pytest.mark.app
+def test_json_profiling_many(tmpdir):
+    """
+    Test tracing the allocations of concurrent runs with launch_many
+    """
+    import time
+    import tracemalloc
+
+    class SlowTool(SimpleTool1):  # pylint: disable=too-few-public-methods
+        """
+        SimpleTool1 taking long enough for the runs to overlap
+        """
+        def run(self, input_files, input_metadata, output_files):
+            time.sleep(0.05)
+            return super(SlowTool, self).run(input_files, input_metadata, output_files)
+
+    jobs = []
+    for i in range(8):
+        jobs.append(_json_job(tmpdir, i))
+        config = json.loads(tmpdir.join("config{}.json".format(i)).read())
+        config["arguments"].append({"name": "profiling", "value": "tracemalloc"})
+        tmpdir.join("config{}.json".format(i)).write(json.dumps(config))
+
+    results = list(JSONApp().launch_many(SlowTool, jobs, max_workers=4))
+    assert [result.error for result in results] == [None] * 8
+    for i in range(8):
+        with open(str(tmpdir.join("results{}.json".format(i)))) as handle:
+            outputs = dict((output["name"], output)
+                           for output in json.load(handle)["output_files"])
+        with open(outputs["profiling_tracemalloc"]["file_path"]) as handle:
+            assert handle.readline().startswith("Peak traced memory")
+    assert not tracemalloc.is_tracing()
+
+
+class StreamingTool(Tool):  # pylint: disable=too-few-public-methods
+    """
+    Tool yielding its outputs one at a time, and failing after "fail_after"
+    outputs if it is configured
+    """
+    # Not shared with the configuration of the other Tools (see Tool.__init__)
+    configuration = {}
+
+    def run(self, input_files, input_metadata, output_files):
+        for i in range(self.configuration.get("count", 3)):
+            if i == self.configuration.get("fail_after"):
+                raise ValueError("Failed after {} outputs".format(i))
+            path = output_files["output"] + str(i)
+            with open(path, "w") as handle:
+                handle.write(str(i))
+            yield "output", path, Metadata.get_child(input_metadata["input"], path)
+
+
+@pytest.mark.app
+def test_streamed_outputs(tmpdir):
+    """
+    Test Tools registering their outputs as they are created
+    """
+    inputs = [_write_input(tmpdir, "input{}".format(i), i) for i in range(4)]
+    output_files, output_metadata = App().launch(
+        SimpleTool3, {"input": inputs},
+        {"input": [Metadata("Number", "plainText", path) for path in inputs]},
+        {"output": str(tmpdir.join("sum{}"))}, {})
+    assert output_files == {"output": [str(tmpdir.join("sum{}".format(i))) for i in range(3)]}
+    assert [md.file_path for md in output_metadata["output"]] == output_files["output"]
+    assert tmpdir.join("sum2").read() == "6"
+
+    class RecordingJSONApp(JSONApp):  # pylint: disable=too-few-public-methods
+        """
+        JSONApp checking that results.json is only written once complete
+        """
+        registered = []
+
+        def _register_output(self, tool_instance, role, path, metadata):  # pylint: disable=too-many-arguments
+            assert not tmpdir.join("results0.json").exists()
+            self.registered.append(path)
+            return super(RecordingJSONApp, self)._register_output(
+                tool_instance, role, path, metadata)
+
+    app = RecordingJSONApp()
+    config_path, input_metadata_path, results_path = _json_job(tmpdir, 0)
+    config = json.loads(tmpdir.join("config0.json").read())
+    config["arguments"].append({"name": "count", "value": 5})
+    tmpdir.join("config0.json").write(json.dumps(config))
+    assert app.launch(StreamingTool, config_path, input_metadata_path, results_path)
+
+    paths = [str(tmpdir.join("output0{}".format(i))) for i in range(5)]
+    assert app.registered == paths
+    with open(results_path) as handle:
+        outputs = json.load(handle)["output_files"]
+    assert [output["file_path"] for output in outputs] == paths
+    assert outputs[0]["sources"] == [str(tmpdir.join("input0"))]
+
+    # A failure leaves the previous results.json, and no temporary file
+    config["arguments"].append({"name": "fail_after", "value": 2})
+    tmpdir.join("config0.json").write(json.dumps(config))
+    with pytest.raises(ValueError):
+        JSONApp().launch(StreamingTool, config_path, input_metadata_path, results_path)
+    with open(results_path) as handle:
+        assert len(json.load(handle)["output_files"]) == 5
+    assert not [path for path in tmpdir.listdir() if ".tmp-" in path.basename]
+
+
+@pytest.mark.app
+def test_streamed_lineage_freed(tmpdir):
+    """
+    Test that the metadata of the streamed outputs of a Tool deriving each
+    output from the previous one is freed once written
+    """
+    count = 200
+    inputs = [_write_input(tmpdir, "input{}".format(i), i) for i in range(count)]
+    tmpdir.join("config.json").write(json.dumps({
+        "input_files": [{"name": "input", "value": str(i)} for i in range(count)],
+        "output_files": [{"name": "output", "file": {"file_path": str(tmpdir.join("sum{}"))}}],
+        "arguments": []}))
+    tmpdir.join("in_metadata.json").write(json.dumps([
+        {"_id": str(i), "data_type": "Number", "file_type": "plainText",
+         "file_path": path, "meta_data": {}, "taxon_id": 0, "sources": []}
+        for i, path in enumerate(inputs)]))
+
+    class CountingJSONApp(JSONApp):  # pylint: disable=too-few-public-methods
+        """
+        JSONApp counting the live Metadata instances as outputs are written
+        """
+        full_provenance = True
+        live = []
+
+        def _register_output(self, tool_instance, role, path, metadata):  # pylint: disable=too-many-arguments
+            result = super(CountingJSONApp, self)._register_output(
+                tool_instance, role, path, metadata)
+            if path.endswith("0"):
+                self.live.append(_live())
+            return result
+
+    def _live():
+        return sum(1 for obj in gc.get_objects() if isinstance(obj, Metadata))
+
+    app = CountingJSONApp()
+    before = _live()
+    assert app.launch(SimpleTool3, str(tmpdir.join("config.json")),
+                      str(tmpdir.join("in_metadata.json")),
+                      str(tmpdir.join("results.json")))
+    # The inputs, and a few outputs rather than all of the previous ones
+    assert max(app.live) - before < count + 10
+
+    with open(str(tmpdir.join("results.json"))) as handle:
+        outputs = json.load(handle)["output_files"]
+    assert len(outputs) == count - 1
+    assert set(outputs[-1]["sources"]) >= set(inputs)
+    assert outputs[-1]["sources"][:2] == [str(tmpdir.join("sum{}".format(count - 3))),
+                                          inputs[-1]]
+
+
+@pytest.mark.app
+def test_launch_daemon(tmpdir):
+    """
+    Test running JSON-configured launches in children of a launch daemon
+    """
+    import os
+    import socket
+    import subprocess
+    import sys
+    import time
+    from apps import launch_daemon
+
+    socket_path = str(tmpdir.join("daemon.sock"))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    daemon = subprocess.Popen(
+        [sys.executable, "-m", "apps.launch_daemon", "serve", socket_path,
+         "tools_demos.simpleTool1.SimpleTool1"], cwd=root,
+        env=dict(os.environ, MUG_TASK_PROFILE="1"))
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.05)
+
+        replies = [launch_daemon.launch(socket_path, "SimpleTool1", *_json_job(tmpdir, i))
+                   for i in range(2)]
+        assert [reply["status"] for reply in replies] == ["done", "done"]
+        assert replies[0]["pid"] != replies[1]["pid"] != daemon.pid
+        assert tmpdir.join("output1").read() == "2"
+        results = json.loads(tmpdir.join("results1.json").read())
+        assert results["output_files"][0]["file_path"] == str(tmpdir.join("output1"))
+
+        # Each job has its own log, and writes its task profile before exiting
+        assert replies[1]["log"] == str(tmpdir.join("results1.log"))
+        assert "Output_files" in tmpdir.join("results1.log").read()
+        profile = json.loads(tmpdir.join("results1.task_profile.json").read())
+        assert sum(values["count"] for values in profile.values()) == 1
+
+        # A client leaving without a request does not stop the daemon
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        client.close()
+
+        reply = launch_daemon.launch(socket_path, "Unknown", *_json_job(tmpdir, 2))
+        assert reply["status"] == "failed" and "SimpleTool1" in reply["error"]
+        reply = launch_daemon.launch(socket_path, "SimpleTool1", *_json_job(tmpdir, 3)[:2] +
+                                     (str(tmpdir.join("missing", "results.json")),))
+        assert reply["status"] == "failed"
+
+        assert launch_daemon.shutdown(socket_path) == {"status": "stopping"}
+        assert daemon.wait(10) == 0
+        assert not os.path.exists(socket_path)
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
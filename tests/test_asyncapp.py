@@ -0,0 +1,130 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from basic_modules.metadata import Metadata
+from tools_demos.simpleTool1 import SimpleTool1
+
+# AsyncApp requires Python 3.7 (see conftest.py)
+pytest.importorskip("contextvars")
+
+from apps.asyncapp import AsyncApp, AsyncJSONApp  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def _write_input(tmpdir, name, value):
+    """
+    Write an input file for SimpleTool1
+    """
+    path = tmpdir.join(name)
+    path.write(str(value))
+    return str(path)
+
+
+def _json_job(tmpdir, index):
+    """
+    Write the config.json and input_metadata.json of a run of SimpleTool1
+    """
+    config = {
+        "input_files": [{"name": "input", "value": "ID1"}],
+        "output_files": [{
+            "name": "output",
+            "file": {"file_path": str(tmpdir.join("output{}".format(index)))}}],
+        "arguments": []}
+    metadata = [{
+        "_id": "ID1", "data_type": "Number", "file_type": "plainText",
+        "file_path": _write_input(tmpdir, "input{}".format(index), index),
+        "meta_data": {}, "taxon_id": 0, "sources": []}]
+    tmpdir.join("config{}.json".format(index)).write(json.dumps(config))
+    tmpdir.join("in_metadata{}.json".format(index)).write(json.dumps(metadata))
+    return (
+        str(tmpdir.join("config{}.json".format(index))),
+        str(tmpdir.join("in_metadata{}.json".format(index))),
+        str(tmpdir.join("results{}.json".format(index))))
+
+
+class SleepingTool(SimpleTool1):  # pylint: disable=too-few-public-methods
+    """
+    SimpleTool1 blocking for a while before running
+    """
+
+    def run(self, input_files, input_metadata, output_files):
+        time.sleep(0.2)
+        return super(SleepingTool, self).run(input_files, input_metadata, output_files)
+
+
+@pytest.mark.app
+def test_async_app(tmpdir):
+    """
+    Test running concurrent launches on an event loop
+    """
+    class TestAsyncApp(AsyncApp):  # pylint: disable=too-few-public-methods
+        """
+        AsyncApp running 10 Tools concurrently
+        """
+        max_workers = 10
+
+    app = TestAsyncApp()
+    jobs = [
+        ({"input": _write_input(tmpdir, "input{}".format(i), i)},
+         {"input": Metadata("Number", "plainText")},
+         {"output": str(tmpdir.join("output{}".format(i)))})
+        for i in range(10)]
+
+    async def _launch_all():
+        return await asyncio.gather(*[app.launch(SleepingTool, *(job + ({},))) for job in jobs])
+
+    start = time.time()
+    results = asyncio.run(_launch_all())
+    assert time.time() - start < 1.5
+    for i, (output_files, output_metadata) in enumerate(results):
+        assert output_files == {"output": str(tmpdir.join("output{}".format(i)))}
+        assert output_metadata["output"].file_path == output_files["output"]
+        assert tmpdir.join("output{}".format(i)).read() == str(i + 1)
+    app.close()
+
+    class TimedAsyncJSONApp(AsyncJSONApp):  # pylint: disable=too-few-public-methods
+        """
+        AsyncJSONApp reporting its timings
+        """
+        report_timings = True
+
+    json_app = TimedAsyncJSONApp()
+    json_jobs = [_json_job(tmpdir, i) for i in range(4)]
+    json_jobs.append((str(tmpdir.join("missing.json")),) * 3)
+
+    async def _launch_json():
+        assert await json_app.launch(SimpleTool1, *json_jobs[0])
+        timings = json_app.timings
+        results = [result async for result in json_app.launch_many(SimpleTool1, json_jobs, 2)]
+        return timings, results
+
+    timings, results = asyncio.run(_launch_json())
+    assert list(timings) == [
+        "read_inputs", "instantiate_tool", "pre_run", "run",
+        "post_run.compss_wait_on", "post_run", "write_results"]
+    assert sorted(result.index for result in results) == list(range(5))
+    for result in results:
+        assert (result.error is not None) == (result.index == 4)
+    with open(json_jobs[3][2]) as handle:
+        output = json.load(handle)["output_files"][0]
+    assert output["file_path"] == str(tmpdir.join("output3"))
+    assert output["meta_data"]["timings"]["run"] >= 0
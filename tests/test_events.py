@@ -0,0 +1,130 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from utils import events
+from utils import local_runtime
+from utils import logger
+
+
+@pytest.fixture
+def event_file(tmpdir):
+    """
+    Write the events to a file for the duration of a test
+    """
+    path = str(tmpdir.join("events.ndjson"))
+    events.configure(path)
+    yield path
+    events.configure(None)
+
+
+def _read_events(path):
+    """
+    Returns the events written to a file
+    """
+    with open(path) as handle:
+        return [json.loads(line) for line in handle]
+
+
+@pytest.mark.events
+def test_progress_events(event_file):
+    """
+    Test that logger.progress emits typed events
+    """
+    logger.progress("test", status="RUNNING")
+    logger.progress("test", task_id=2, total=5)
+    logger.progress("test {}", 3)
+
+    progress = _read_events(event_file)
+    assert [event["event"] for event in progress] == [events.PROGRESS] * 3
+    assert progress[0]["status"] == "RUNNING"
+    assert (progress[1]["task_id"], progress[1]["total"]) == (2, 5)
+    assert progress[2]["message"] == "test 3"
+    assert progress[2]["pid"] == os.getpid()
+
+
+def _copy(source, target):
+    """
+    Copy a file
+    """
+    with open(source) as handle, open(target, "w") as out:
+        out.write(handle.read())
+    return True
+
+
+@pytest.mark.events
+@pytest.mark.parametrize("executor", [local_runtime.SERIAL, local_runtime.THREAD])
+def test_task_events(tmpdir, event_file, executor):
+    """
+    Test the task_start and task_finish events of the local runtime
+    """
+    source = tmpdir.join("in.txt")
+    source.write("x" * 100)
+    runtime = local_runtime.LocalRuntime(executor)
+    result = runtime.submit(_copy, (str(source), str(tmpdir.join("out.txt"))), {},
+                            reads=[str(source)], writes=[str(tmpdir.join("out.txt"))])
+    runtime.wait_on(result)
+    runtime.shutdown()
+
+    started, finished = _read_events(event_file)
+    assert started["event"] == events.TASK_START
+    assert finished["event"] == events.TASK_FINISH
+    assert finished["task"] == "_copy"
+    assert finished["status"] == "done"
+    assert finished["bytes_in"] == finished["bytes_out"] == 100
+    assert finished["duration"] >= 0
+
+
+@pytest.mark.events
+def test_unix_socket(tmpdir):
+    """
+    Test writing the events to a UNIX socket
+    """
+    path = str(tmpdir.join("events.sock"))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    received = []
+
+    def _receive():
+        connection, _ = server.accept()
+        data = b""
+        while True:
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        received.extend(data.decode("utf-8").splitlines())
+
+    thread = threading.Thread(target=_receive)
+    thread.start()
+    events.configure("unix:" + path)
+    try:
+        assert events.emit("custom", value=1)
+    finally:
+        events.configure(None)
+    thread.join()
+    server.close()
+
+    assert json.loads(received[0])["value"] == 1
+    assert not events.enabled()
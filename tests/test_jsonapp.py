@@ -0,0 +1,121 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import json
+
+import pytest
+
+from apps.jsonapp import JSONApp
+from basic_modules.metadata import Metadata
+from utils import json_stream
+
+
+def _input_metadata(count):
+    """
+    Generate the entries of an input_metadata.json
+    """
+    return [{
+        "_id": "ID{}".format(i),
+        "data_type": "Number",
+        "file_type": "plainText",
+        "file_path": "/tmp/file{}".format(i),
+        "meta_data": {"description": u"é" * (i % 7)},
+        "taxon_id": 9606,
+        "sources": []
+    } for i in range(count)]
+
+
+@pytest.mark.json
+def test_read_metadata(tmpdir):
+    """
+    Test reading all the entries of input_metadata.json
+    """
+    metadata_file = tmpdir.join("input_metadata.json")
+    metadata_file.write(json.dumps(_input_metadata(100), indent=4))
+
+    input_metadata = JSONApp()._read_metadata(str(metadata_file))  # pylint: disable=protected-access
+    assert len(input_metadata) == 100
+    assert input_metadata["ID42"].file_path == "/tmp/file42"
+
+
+@pytest.mark.json
+def test_read_metadata_ids(tmpdir):
+    """
+    Test reading selected entries of input_metadata.json
+    """
+    metadata_file = tmpdir.join("input_metadata.json")
+    metadata_file.write(json.dumps(_input_metadata(1000)))
+
+    app = JSONApp()
+    input_metadata = app._read_metadata(str(metadata_file), ["ID3", "ID10"])  # pylint: disable=protected-access
+    assert sorted(input_metadata) == ["ID10", "ID3"]
+    assert input_metadata["ID3"].meta_data["description"] == u"é" * 3
+
+    # Further entries are read through the index
+    index = json_stream.get_index(str(metadata_file))
+    assert index.complete
+    input_metadata = app._read_metadata(str(metadata_file), ["ID5", "ID999"])  # pylint: disable=protected-access
+    assert input_metadata["ID5"].file_path == "/tmp/file5"
+    assert input_metadata["ID999"].file_path == "/tmp/file999"
+    assert len(index.offsets) == 1000
+
+    # As with a dict, the last entry with a given ID wins
+    entries = _input_metadata(3)
+    entries.append(dict(entries[1], file_path="/tmp/duplicate"))
+    metadata_file.write(json.dumps(entries))
+    for input_ids in (["ID1"], None):
+        input_metadata = app._read_metadata(str(metadata_file), input_ids)  # pylint: disable=protected-access
+        assert input_metadata["ID1"].file_path == "/tmp/duplicate"
+
+
+@pytest.mark.json
+def test_write_results(tmpdir):
+    """
+    Test that results.json is written as json.dump would, and atomically
+    """
+    parent = Metadata("Number", "plainText", "/tmp/input", meta_data={"tool": u"é"})
+    paths = ["/tmp/output{}".format(i) for i in range(10)]
+    output_metadata = {
+        "output": [Metadata.get_child(parent, path) for path in paths],
+        "summary": Metadata("Text", "txt", "/tmp/summary", taxon_id=9606)}
+    results_file = tmpdir.join("results.json")
+
+    app = JSONApp()
+    app._write_results(  # pylint: disable=protected-access
+        {}, {}, {"output": paths, "summary": "/tmp/summary"}, output_metadata,
+        str(results_file))
+    entries = [app._new_result("output", path, metadata)  # pylint: disable=protected-access
+               for path, metadata in zip(paths, output_metadata["output"])]
+    entries.append(app._new_result(  # pylint: disable=protected-access
+        "summary", "/tmp/summary", output_metadata["summary"]))
+    assert results_file.read() == json.dumps(
+        {"output_files": entries}, indent=4, separators=(',', ': '))
+
+    app.compact_results = True
+    app._write_results(  # pylint: disable=protected-access
+        {}, {}, {"output": paths, "summary": "/tmp/summary"}, output_metadata,
+        str(results_file))
+    assert json.loads(results_file.read()) == {"output_files": entries}
+    assert "\n" not in results_file.read()
+
+    # A failure leaves the previous results.json, and no temporary file
+    with pytest.raises(AssertionError):
+        app._write_results(  # pylint: disable=protected-access
+            {}, {}, {"output": paths}, {"output": output_metadata["output"][:2]},
+            str(results_file))
+    assert json.loads(results_file.read()) == {"output_files": entries}
+    assert tmpdir.listdir() == [results_file]
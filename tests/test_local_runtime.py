@@ -0,0 +1,371 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from concurrent.futures import Future
+
+import pytest
+
+from utils import local_runtime
+from utils import runtime
+from utils import task_profile
+from utils.dummy_pycompss import FILE_IN, FILE_OUT
+from utils.dummy_pycompss import task, compss_wait_on, barrier
+from utils.resources import ResourcePool
+from utils.scheduler import DependencyError
+
+
+@task(input_file=FILE_IN, output_file=FILE_OUT)
+def slow_plus_one(input_file, output_file, delay=0.0):
+    """
+    Task writing the content of input_file plus one to output_file
+    """
+    time.sleep(delay)
+    with open(input_file, "r") as input_handle:
+        value = int(input_handle.read())
+    with open(output_file, "w") as output_handle:
+        output_handle.write(str(value + 1))
+    return value + 1
+
+
+@pytest.fixture(params=[local_runtime.THREAD, local_runtime.PROCESS])
+def async_runtime(request):
+    """
+    Configure an asynchronous local runtime for the duration of a test
+    """
+    yield local_runtime.configure(request.param, 4)
+    local_runtime.configure(local_runtime.SERIAL)
+
+
+@pytest.mark.runtime
+def test_serial(tmpdir):
+    """
+    Test that tasks return their values directly in serial mode
+    """
+    local_runtime.configure(local_runtime.SERIAL)
+    input_file = tmpdir.join("input")
+    input_file.write("1")
+    result = slow_plus_one(str(input_file), str(tmpdir.join("output")))
+    assert result == 2
+
+
+@pytest.mark.runtime
+def test_async_futures(tmpdir, async_runtime):  # pylint: disable=redefined-outer-name,unused-argument
+    """
+    Test that tasks return Futures resolved by compss_wait_on
+    """
+    input_file = tmpdir.join("input")
+    input_file.write("1")
+    result = slow_plus_one(str(input_file), str(tmpdir.join("output")))
+    assert isinstance(result, Future)
+    assert compss_wait_on([result]) == [2]
+
+
+@pytest.mark.runtime
+def test_async_file_dependencies(tmpdir, async_runtime):  # pylint: disable=redefined-outer-name,unused-argument
+    """
+    Test that a task waits for the task producing its input file
+    """
+    paths = [str(tmpdir.join("file{}".format(i))) for i in range(4)]
+    with open(paths[0], "w") as handle:
+        handle.write("0")
+    for i in range(3):
+        slow_plus_one(paths[i], paths[i + 1], delay=0.1 * (3 - i))
+
+    assert compss_wait_on(paths[3]) == paths[3]
+    with open(paths[3], "r") as handle:
+        assert handle.read() == "3"
+    barrier()
+
+
+@pytest.mark.runtime
+def test_async_dispatch(tmpdir):
+    """
+    Test that tasks waiting on their inputs do not block the caller, and that
+    independent tasks run concurrently
+    """
+    local_runtime.configure(local_runtime.THREAD, 4)
+    paths = [str(tmpdir.join("file{}".format(i))) for i in range(6)]
+    for path in paths[:2]:
+        with open(path, "w") as handle:
+            handle.write("0")
+
+    start = time.time()
+    # Two independent chains of two tasks each
+    slow_plus_one(paths[0], paths[2], delay=0.3)
+    slow_plus_one(paths[1], paths[3], delay=0.3)
+    slow_plus_one(paths[2], paths[4], delay=0.3)
+    slow_plus_one(paths[3], paths[5], delay=0.3)
+    assert time.time() - start < 0.2
+
+    barrier()
+    assert time.time() - start < 0.9
+    for path in paths[4:]:
+        with open(path, "r") as handle:
+            assert handle.read() == "2"
+    local_runtime.configure(local_runtime.SERIAL)
+
+
+@pytest.mark.runtime
+def test_async_write_after_read(tmpdir):
+    """
+    Test that a file is not overwritten before the tasks reading it finish
+    """
+    local_runtime.configure(local_runtime.THREAD, 4)
+    source = str(tmpdir.join("source"))
+    copy = str(tmpdir.join("copy"))
+    with open(source, "w") as handle:
+        handle.write("0")
+
+    reader = slow_plus_one(source, copy, delay=0.3)
+    overwrite = str(tmpdir.join("overwrite"))
+    with open(overwrite, "w") as handle:
+        handle.write("10")
+    writer = slow_plus_one(overwrite, source)
+
+    assert compss_wait_on(reader) == 1
+    assert compss_wait_on(writer) == 11
+    local_runtime.configure(local_runtime.SERIAL)
+
+
+@pytest.mark.runtime
+def test_async_failed_dependency(tmpdir):
+    """
+    Test that the tasks depending on a failed task fail without being run
+    """
+    local_runtime.configure(local_runtime.THREAD, 4)
+    paths = [str(tmpdir.join("file{}".format(i))) for i in range(4)]
+    results = [slow_plus_one(paths[i], paths[i + 1], delay=0.1) for i in range(3)]
+
+    with pytest.raises(IOError):
+        compss_wait_on(results[0])
+    for result in results[1:]:
+        with pytest.raises(DependencyError) as error:
+            compss_wait_on(result)
+        assert isinstance(error.value.cause, IOError)
+    barrier()
+    assert not any(os.path.exists(path) for path in paths)
+    local_runtime.configure(local_runtime.SERIAL)
+
+
+@pytest.mark.runtime
+@pytest.mark.parametrize("executor", local_runtime.EXECUTORS)
+def test_task_profile(tmpdir, executor):
+    """
+    Test that task calls are measured and aggregated by task name
+    """
+    local_runtime.configure(executor, 2)
+    task_profile.reset()
+    task_profile.enable()
+    try:
+        input_file = tmpdir.join("input")
+        input_file.write("1")
+        results = [
+            slow_plus_one(str(input_file), str(tmpdir.join("output{}".format(i))), 0.05)
+            for i in range(3)]
+        assert compss_wait_on(results) == [2, 2, 2]
+        barrier()
+        stats = task_profile.report()
+    finally:
+        task_profile.disable()
+        task_profile.reset()
+        local_runtime.configure(local_runtime.SERIAL)
+
+    assert list(stats) == ["slow_plus_one"]
+    measures = stats["slow_plus_one"]
+    assert measures["count"] == 3
+    assert measures["wall"] >= 0.15
+    assert measures[task_profile.CPU_FIELD] < measures["wall"]
+    assert measures["bytes_in"] == measures["bytes_out"] == 3
+    assert measures["rss_delta"] >= 0
+
+    report_path = str(tmpdir.join("report.json"))
+    task_profile.write_report(report_path, stats)
+    assert tmpdir.join("report.json").check()
+
+    # Without the CPU time of threads, that of the process is reported
+    measures["cpu_process"] = measures.pop(task_profile.CPU_FIELD)
+    task_profile.log_report(stats)
+
+
+
+@pytest.mark.runtime
+def test_lazy_runtime():
+    """
+    Test that the local runtime is only imported when the first task runs
+    """
+    script = "; ".join([
+        "import sys",
+        "from tools_demos.simpleTool1 import SimpleTool1",
+        "from utils import runtime",
+        "assert 'utils.local_runtime' not in sys.modules",
+        "assert 'concurrent.futures' not in sys.modules",
+        "runtime.barrier()",
+        "assert 'utils.local_runtime' in runtime.import_times()"])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, "-c", script], cwd=root)
+    assert output.decode().count("Cannot import \"pycompss\"") == 1
+
+
+@runtime.constraint(ComputingUnits="2")
+@runtime.task(input_file=runtime.FILE_IN, output_file=runtime.FILE_OUT)
+def plus_one(input_file, output_file):
+    """
+    Task of the runtime backends writing the content of input_file plus one
+    to output_file
+    """
+    with open(input_file, "r") as input_handle:
+        value = int(input_handle.read())
+    with open(output_file, "w") as output_handle:
+        output_handle.write(str(value + 1))
+    return value + 1
+
+
+@pytest.mark.runtime
+@pytest.mark.parametrize("backend", ["serial", "thread", "process"])
+def test_backends(tmpdir, backend):
+    """
+    Test running the same task on each local backend
+    """
+    assert backend in runtime.available_backends()
+    try:
+        assert runtime.use(backend, 2).name == backend
+        assert runtime.active_backend().name == backend
+        assert local_runtime.get_runtime().executor == backend
+        input_file = tmpdir.join("input")
+        input_file.write("1")
+        paths = [str(tmpdir.join("output{}".format(i))) for i in range(3)]
+        chained = [str(input_file)] + paths
+        results = [plus_one(chained[i], chained[i + 1]) for i in range(3)]
+        assert runtime.compss_wait_on(results) == [2, 3, 4]
+        assert tmpdir.join("output2").read() == "4"
+    finally:
+        runtime.use("serial")
+
+    assert plus_one.task_constraints == [((), {"ComputingUnits": "2"})]
+    with pytest.raises(ValueError):
+        runtime.use("unknown")
+
+
+_USAGE = {"cores": 0, "memory": 0, "peak": (0, 0)}
+_USAGE_LOCK = threading.Lock()
+
+
+def _use_resources(cores, memory, delay):
+    """
+    Record the resources in use while running a task
+    """
+    with _USAGE_LOCK:
+        _USAGE["cores"] += cores
+        _USAGE["memory"] += memory
+        _USAGE["peak"] = (max(_USAGE["peak"][0], _USAGE["cores"]),
+                          max(_USAGE["peak"][1], _USAGE["memory"]))
+    time.sleep(delay)
+    with _USAGE_LOCK:
+        _USAGE["cores"] -= cores
+        _USAGE["memory"] -= memory
+
+
+@runtime.constraint(computing_units="3", memory_size=6)
+@runtime.task()
+def heavy_task():
+    """
+    Task requiring most of the resources of the host
+    """
+    _use_resources(3, 6, 0.05)
+
+
+@runtime.task()
+def light_task():
+    """
+    Task requiring one core
+    """
+    _use_resources(1, 0, 0.02)
+
+
+@pytest.mark.runtime
+def test_constraints(monkeypatch):
+    """
+    Test that tasks are only run once the resources they require are
+    available
+    """
+    monkeypatch.setenv("MUG_LOCAL_MEMORY", "8")
+    try:
+        runtime.use("thread")
+        resources = local_runtime.configure("thread", 4).resources
+        assert (resources.cores, resources.memory) == (4, 8)
+        futures = []
+        for _ in range(4):
+            futures.append(heavy_task())
+            futures.extend(light_task() for _ in range(3))
+        compss_wait_on(futures)
+        assert _USAGE["peak"][0] <= 4 and _USAGE["peak"][1] <= 6
+        assert resources.available() == (4, 8)
+    finally:
+        runtime.use("serial")
+
+    # Serial tasks wait for their resources, e.g. in concurrent launches
+    resources = local_runtime.get_runtime().resources
+    with resources.reserved((resources.cores, 0)):
+        waiting = threading.Thread(target=heavy_task)
+        waiting.start()
+        waiting.join(0.1)
+        assert waiting.is_alive()
+    waiting.join()
+
+
+@pytest.mark.runtime
+def test_resource_order():
+    """
+    Test that queued tasks are started in order, and that nested
+    reservations on the same thread reuse the resources of the outer one
+    """
+    pool = ResourcePool(cores=4, memory=8)
+    running = Future()
+    pool.submit((3, 0), lambda: running)
+    started = []
+
+    def _start(name):
+        started.append(name)
+        done = Future()
+        done.set_result(name)
+        return done
+
+    heavy = pool.submit((4, 0), lambda: _start("heavy"))
+    light = pool.submit((1, 0), lambda: _start("light"))
+    assert started == [] and not light.done()
+    running.set_result(None)
+    assert started == ["heavy", "light"]
+    assert (heavy.result(), light.result()) == ("heavy", "light")
+    assert pool.available() == (4, 8)
+
+    def _nested():
+        with pool.reserved((4, 0)):
+            with pool.reserved((1, 0)):
+                started.append("nested")
+            assert pool.available() == (0, 8)
+
+    nested = threading.Thread(target=_nested)
+    nested.start()
+    nested.join(1)
+    assert not nested.is_alive() and started[-1] == "nested"
+    assert pool.available() == (4, 8)
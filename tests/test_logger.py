@@ -16,6 +16,7 @@
 """
 
 import re
+import time
 import pytest
 
 from utils import logger
@@ -103,3 +104,101 @@ def test_progress_02(capsys):
     logger.progress("test", task_id=2, total=5)
     captured = capsys.readouterr()
     assert re.search("PROGRESS: test \(2\/5\)", captured[0])
+
+
+@pytest.mark.logger
+def test_async(capsys):
+    """
+    Test that messages logged in asynchronous mode are written in order
+    """
+    logger.enable_async()
+    try:
+        for i in range(100):
+            logger.info("test {}", i)
+        logger.warn("test {name}", name="warn")
+        logger.flush()
+        captured = capsys.readouterr()
+    finally:
+        logger.disable_async()
+
+    lines = captured[0].splitlines()
+    assert len(lines) == 100
+    assert re.search("INFO: test 0$", lines[0])
+    assert re.search("INFO: test 99$", lines[-1])
+    assert re.search("WARNING: test warn", captured[1])
+
+    logger.info("test sync")
+    assert re.search("INFO: test sync", capsys.readouterr()[0])
+
+
+@pytest.mark.logger
+def test_async_drain(capsys):
+    """
+    Test that queued messages are written without flush, in order, once the
+    flush interval has elapsed
+    """
+    logger.enable_async(flush_interval=0.05, batch_size=10)
+    try:
+        for i in range(25):
+            logger.info("test {}", i)
+        deadline = time.time() + 5
+        lines = []
+        while len(lines) < 25 and time.time() < deadline:
+            time.sleep(0.05)
+            lines.extend(capsys.readouterr()[0].splitlines())
+    finally:
+        logger.disable_async()
+
+    assert [line.rsplit(" ", 1)[1] for line in lines] == [str(i) for i in range(25)]
+
+
+@pytest.mark.logger
+def test_level_threshold(capsys):
+    """
+    Test that messages below the threshold are dropped without formatting
+    """
+    class Unformattable(object):  # pylint: disable=too-few-public-methods
+        """
+        Argument that cannot be formatted
+        """
+        def __format__(self, spec):
+            raise AssertionError("Formatted a filtered message")
+
+    logger.set_level(logger.INFO)
+    try:
+        assert logger.debug("test {}", Unformattable()) is False
+        logger.info("test")
+        logger.progress(50)
+    finally:
+        logger.set_level(logger.DEBUG)
+    captured = capsys.readouterr()
+    assert "DEBUG" not in captured[0]
+    assert re.search("INFO: test", captured[0])
+    assert re.search("PROGRESS: 50", captured[0])
+
+
+@pytest.mark.logger
+def test_module_levels(capsys):
+    """
+    Test the per-module thresholds
+    """
+    namespace = {"__name__": "other.module", "logger": logger}
+    exec("def log_other(message):\n    logger.info(message)\n", namespace)  # pylint: disable=exec-used
+
+    logger.configure_levels("WARNING,{}=DEBUG".format(__name__))
+    try:
+        assert logger.get_level() == logger.WARNING
+        assert logger.get_level("other.module.sub") == logger.WARNING
+        logger.debug("test module")
+        namespace["log_other"]("test other")
+        logger.set_level("INFO", "other")
+        assert logger.get_level("other.module.sub") == logger.INFO
+        namespace["log_other"]("test package")
+    finally:
+        logger.set_level(None, __name__)
+        logger.set_level(None, "other")
+        logger.set_level(logger.DEBUG)
+    captured = capsys.readouterr()
+    assert re.search("DEBUG: test module", captured[0])
+    assert "test other" not in captured[0]
+    assert re.search("INFO: test package", captured[0])
@@ -0,0 +1,140 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import json
+
+import pytest
+
+from apps.jsonapp import JSONApp
+from basic_modules.metadata import Metadata
+
+
+@pytest.mark.metadata
+def test_get_child_copy_on_write():
+    """
+    Test that children share the meta_data of their parents until modified
+    """
+    parent1 = Metadata("Number", "plainText", "/tmp/a",
+                       meta_data={"tool": "a", "params": {"k": 1}})
+    parent2 = Metadata("Other", "txt", "/tmp/b", meta_data={"tool": "b", "n": 2})
+
+    child = Metadata.get_child([parent1, parent2], "/tmp/c")
+    assert child.data_type == "Number"
+    assert child.sources == ["/tmp/a", "/tmp/b"]
+    assert dict(child.meta_data) == {"tool": "b", "params": {"k": 1}, "n": 2}
+    assert not hasattr(child, "__dict__")
+
+    child.meta_data["tool"] = "c"
+    child.meta_data["params"]["k"] = 3
+    assert parent1.meta_data["tool"] == "a"
+    assert parent1.meta_data["params"] == {"k": 1}
+    assert parent2.meta_data["tool"] == "b"
+
+    # Nested values read from a shared child are copied first
+    other = Metadata.get_child(parent1, "/tmp/d")
+    other.meta_data["params"]["k"] = 4
+    assert parent1.meta_data["params"] == {"k": 1}
+
+    parent1.meta_data["tool"] = "x"
+    assert other.meta_data["tool"] == "a"
+
+
+@pytest.mark.metadata
+def test_get_child_chain():
+    """
+    Test that long chains of children share the nested values of the first
+    parent, and have plain dict meta_data
+    """
+    params = {"k": [1]}
+    metadata = Metadata("Number", "plainText", "/tmp/0", meta_data={"i": 0, "params": params})
+    for i in range(1, 100):
+        parent = Metadata("Number", "plainText", "/tmp/p{}".format(i),
+                          meta_data={"i": i, "p{}".format(i): True})
+        metadata = Metadata.get_child([metadata, parent], "/tmp/{}".format(i))
+        assert dict.__getitem__(metadata.meta_data, "params") is params
+    assert metadata.meta_data["i"] == 99
+    assert len(metadata.meta_data) == 101
+
+    assert isinstance(metadata.meta_data, dict)
+    assert json.loads(json.dumps(metadata.meta_data))["params"] == {"k": [1]}
+    metadata.meta_data["params"]["k"].append(2)
+    assert params == {"k": [1]}
+    assert metadata.meta_data.pop("params") == {"k": [1, 2]}
+    assert metadata.meta_data.copy() == metadata.meta_data
+
+
+@pytest.mark.metadata
+def test_write_results(tmpdir):
+    """
+    Test that results.json is written as for plain dict meta_data
+    """
+    parent = Metadata("Number", "plainText", "/tmp/a", meta_data={"tool": "a"})
+    child = Metadata.get_child(parent, "/tmp/b")
+    child.meta_data["visible"] = False
+
+    results_path = str(tmpdir.join("results.json"))
+    JSONApp()._write_results(  # pylint: disable=protected-access
+        {"input": "/tmp/a"}, {"input": parent},
+        {"output": "/tmp/b"}, {"output": child}, results_path)
+    with open(results_path) as handle:
+        results = json.load(handle)
+    assert results["output_files"][0]["meta_data"] == {"tool": "a", "visible": False}
+
+
+@pytest.mark.metadata
+def test_get_ancestry():
+    """
+    Test that children reference their parents and expose their full lineage
+    """
+    inputs = [Metadata("Number", "plainText", "/tmp/in{}".format(i)) for i in range(2)]
+    metadata = Metadata.get_child(inputs, "/tmp/out0")
+    for i in range(1, 1000):
+        metadata = Metadata.get_child([metadata, inputs[1]], "/tmp/out{}".format(i))
+
+    assert metadata.parents[0].file_path == "/tmp/out998"
+    assert metadata.sources == ["/tmp/out998", "/tmp/in1"]
+    ancestry = metadata.get_ancestry()
+    assert ancestry[:3] == ["/tmp/out998", "/tmp/in1", "/tmp/out997"]
+    assert len(ancestry) == 1001
+    assert ancestry[-2:] == ["/tmp/out0", "/tmp/in0"]
+
+    loaded = Metadata.from_dict(metadata.to_dict())
+    assert loaded.parents is None
+    assert loaded.get_ancestry() == ["/tmp/out998", "/tmp/in1"]
+
+
+@pytest.mark.metadata
+def test_write_results_full_provenance(tmpdir):
+    """
+    Test that JSONApp writes the full lineage if full_provenance is set
+    """
+    parent = Metadata("Number", "plainText", "/tmp/a")
+    child = Metadata.get_child(parent, "/tmp/b")
+    grandchild = Metadata.get_child(child, "/tmp/c")
+
+    class ProvenanceApp(JSONApp):  # pylint: disable=too-few-public-methods
+        """
+        JSONApp writing the full lineage
+        """
+        full_provenance = True
+
+    for app, sources in ((JSONApp(), ["/tmp/b"]), (ProvenanceApp(), ["/tmp/b", "/tmp/a"])):
+        results_path = str(tmpdir.join("results.json"))
+        app._write_results(  # pylint: disable=protected-access
+            {}, {}, {"output": "/tmp/c"}, {"output": grandchild}, results_path)
+        with open(results_path) as handle:
+            assert json.load(handle)["output_files"][0]["sources"] == sources
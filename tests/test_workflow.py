@@ -0,0 +1,194 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import os
+import time
+
+import pytest
+
+from apps.workflowapp import WorkflowApp
+from basic_modules.metadata import Metadata
+from basic_modules.workflow import Workflow
+from tools_demos.simpleTool1 import SimpleTool1
+from utils import local_runtime
+
+
+class ChainWorkflow(Workflow):  # pylint: disable=too-few-public-methods
+    """
+    Workflow running SimpleTool1 three times in a chain, failing before the
+    step fail_at if it is set
+    """
+    fail_at = None
+
+    def __init__(self, configuration=None):
+        self.configuration = dict(configuration or {})
+        self.runs = []
+
+    def run(self, input_files, metadata, output_files):
+        tool = SimpleTool1(self.configuration)
+        outputs = [input_files["input"]]
+        out_mds = [metadata["input"]]
+        for i in range(3):
+            if i == self.fail_at:
+                raise ValueError("Step {} failed".format(i))
+            step_output = output_files["output"] + ".step{}".format(i)
+            output, outmd = self.run_tool(
+                tool, {"input": outputs[-1]}, {"input": out_mds[-1]},
+                {"output": step_output})
+            outputs.append(output["output"])
+            out_mds.append(outmd["output"])
+            if self.configuration.get("intermediates") and i < 2:
+                self.add_intermediate(output["output"])
+        return {"output": outputs[-1]}, {"output": out_mds[-1]}
+
+
+@pytest.mark.workflow
+def test_incremental(tmpdir):
+    """
+    Test that up-to-date steps are skipped in incremental mode
+    """
+    input_file = tmpdir.join("input")
+    input_file.write("1")
+    args = ({"input": str(input_file)},
+            {"input": Metadata("Number", "plainText")},
+            {"output": str(tmpdir.join("output"))})
+
+    ChainWorkflow({"incremental": True}).run(*args)
+    steps = [tmpdir.join("output.step{}".format(i)) for i in range(3)]
+    assert [step.read() for step in steps] == ["2", "3", "4"]
+    mtimes = [os.path.getmtime(str(step)) for step in steps]
+
+    # Nothing has changed: all steps are skipped
+    time.sleep(0.05)
+    output_files, output_metadata = ChainWorkflow({"incremental": True}).run(*args)
+    assert [os.path.getmtime(str(step)) for step in steps] == mtimes
+    assert output_files["output"] == str(steps[2])
+    assert output_metadata["output"].file_path == str(steps[2])
+
+    # The second step failed: only steps 2 and 3 are re-run
+    steps[1].remove()
+    ChainWorkflow({"incremental": True}).run(*args)
+    assert os.path.getmtime(str(steps[0])) == mtimes[0]
+    assert steps[2].read() == "4"
+
+    # Input touched but identical: steps are skipped
+    mtimes = [os.path.getmtime(str(step)) for step in steps]
+    time.sleep(0.05)
+    input_file.write("1")
+    ChainWorkflow({"incremental": True}).run(*args)
+    assert [os.path.getmtime(str(step)) for step in steps] == mtimes
+
+    # Input changed: all steps are re-run
+    input_file.write("5")
+    ChainWorkflow({"incremental": True}).run(*args)
+    assert steps[2].read() == "8"
+
+
+@pytest.mark.workflow
+@pytest.mark.parametrize("executor", [local_runtime.SERIAL, local_runtime.THREAD])
+def test_intermediates(tmpdir, executor):
+    """
+    Test that intermediates are deleted once consumed
+    """
+    local_runtime.configure(executor)
+    input_file = tmpdir.join("input")
+    input_file.write("1")
+
+    workflow = ChainWorkflow({"intermediates": True})
+    output_files, _ = workflow.run(
+        {"input": str(input_file)},
+        {"input": Metadata("Number", "plainText")},
+        {"output": str(tmpdir.join("output"))})
+    local_runtime.get_runtime().barrier()
+
+    assert not tmpdir.join("output.step0").exists()
+    assert not tmpdir.join("output.step1").exists()
+    assert tmpdir.join("output.step2").read() == "4"
+    assert output_files["output"] == str(tmpdir.join("output.step2"))
+    assert workflow.get_intermediates() == {}
+    local_runtime.configure(local_runtime.SERIAL)
+
+
+@pytest.mark.workflow
+def test_workflow_app_intermediates(tmpdir):
+    """
+    Test that the WorkflowApp deletes the intermediates left by a Workflow
+    """
+    input_file = tmpdir.join("input")
+    input_file.write("1")
+    unused = tmpdir.join("unused")
+    unused.write("0")
+
+    class UnusedWorkflow(ChainWorkflow):  # pylint: disable=too-few-public-methods
+        """
+        Workflow registering an intermediate that is never consumed
+        """
+        def run(self, input_files, metadata, output_files):
+            self.add_intermediate(str(unused))
+            return super(UnusedWorkflow, self).run(input_files, metadata, output_files)
+
+    output_files, _ = WorkflowApp().launch(
+        UnusedWorkflow,
+        {"input": str(input_file)},
+        {"input": Metadata("Number", "plainText")},
+        {"output": str(tmpdir.join("output"))}, {})
+    assert not unused.exists()
+    with open(output_files["output"]) as handle:
+        assert handle.read() == "4"
+
+
+@pytest.mark.workflow
+def test_resume_keeps_intermediates(tmpdir):
+    """
+    Test that a failed incremental Workflow keeps its intermediates, so that
+    its resubmission skips the steps that completed
+    """
+    input_file = tmpdir.join("input")
+    input_file.write("1")
+    args = ({"input": str(input_file)},
+            {"input": Metadata("Number", "plainText")},
+            {"output": str(tmpdir.join("output"))})
+    steps = [tmpdir.join("output.step{}".format(i)) for i in range(3)]
+    configuration = {"incremental": True, "intermediates": True}
+
+    class FailingWorkflow(ChainWorkflow):  # pylint: disable=too-few-public-methods
+        """
+        ChainWorkflow failing before its last step
+        """
+        fail_at = 2
+
+    with pytest.raises(ValueError):
+        WorkflowApp().launch(FailingWorkflow, *(args + (configuration,)))
+    assert [step.read() for step in steps[:2]] == ["2", "3"]
+    mtimes = [os.path.getmtime(str(step)) for step in steps[:2]]
+
+    time.sleep(0.05)
+    output_files, _ = WorkflowApp().launch(ChainWorkflow, *(args + (configuration,)))
+    assert [os.path.getmtime(str(step)) for step in steps[:2]] == mtimes
+    assert output_files["output"] == str(steps[2])
+    assert steps[2].read() == "4"
+
+    # Without incremental mode, a failed run leaves the intermediates that
+    # were not consumed yet, and a successful one deletes them all
+    for step in steps:
+        step.remove()
+    with pytest.raises(ValueError):
+        WorkflowApp().launch(FailingWorkflow, *(args + ({"intermediates": True},)))
+    assert not steps[0].exists()
+    assert steps[1].read() == "3"
+    WorkflowApp().launch(ChainWorkflow, *(args + ({"intermediates": True},)))
+    assert [step.exists() for step in steps] == [False, False, True]
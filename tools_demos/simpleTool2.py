@@ -17,23 +17,11 @@
 """
 
 from __future__ import print_function
-import sys
-
-try:
-    if hasattr(sys, '_run_from_cmdl') is True:
-        raise ImportError
-    from pycompss.api.parameter import FILE_IN, FILE_OUT
-    from pycompss.api.task import task
-except ImportError:
-    print("[Warning] Cannot import \"pycompss\" API packages.")
-    print("          Using mock decorators.")
-
-    from utils.dummy_pycompss import FILE_IN, FILE_OUT
-    from utils.dummy_pycompss import task
 
 from basic_modules.metadata import Metadata
 from basic_modules.tool import Tool
 from utils import logger   # pylint: disable=ungrouped-imports
+from utils.runtime import FILE_IN, FILE_OUT, task
 
 
 # -----------------------------------------------------------------------------
@@ -17,23 +17,11 @@
 """
 
 from __future__ import print_function
-import sys
-
-try:
-    if hasattr(sys, '_run_from_cmdl') is True:
-        raise ImportError
-    from pycompss.api.parameter import FILE_IN, FILE_OUT
-    from pycompss.api.task import task
-except ImportError:
-    print("[Warning] Cannot import \"pycompss\" API packages.")
-    print("          Using mock decorators.")
-
-    from utils.dummy_pycompss import FILE_IN, FILE_OUT
-    from utils.dummy_pycompss import task
 
 from basic_modules.metadata import Metadata
 from basic_modules.tool import Tool
-from utils import logger  # pylint: disable=ungrouped-imports
+from utils import logger
+from utils.runtime import FILE_IN, FILE_OUT, task
 
 
 # -----------------------------------------------------------------------------
@@ -69,7 +57,8 @@ class SimpleTool3(Tool):
 
     def run(self, input_files, input_metadata, output_files):
         """
-        Standard function to call tasks
+        Standard function to call tasks; each output is yielded as soon as
+        its task is submitted (see Tool.run).
         """
 
         # perform checks
@@ -78,9 +67,6 @@ class SimpleTool3(Tool):
         # prepare outputs
         logger.info("SimpleTool3: Preparing outputs")
         output_pattern = output_files["output"]
-        output_files["output"] = []
-        output_metadata = {}
-        output_metadata["output"] = []
 
         # Iteratively run the task
         previous_input = input_files["input"][0]
@@ -101,16 +87,13 @@ class SimpleTool3(Tool):
                                        next_input,
                                        file_out)
             if success:
-                # keep track of successful iterations
-                output_files["output"].append(file_out)
+                # register successful iterations as they are submitted;
                 # input and outputs share most metadata
-                output_metadata["output"].append(metadata_out)
+                yield "output", file_out, metadata_out
                 previous_input = file_out
                 previous_metadata = metadata_out
                 logger.info("SimpleTool3: Input {} successful", i)
             else:
                 logger.warn("SimpleTool3: Input {} failed", i)
 
-        return output_files, output_metadata
-
 # ------------------------------------------------------------------------------
@@ -33,3 +33,18 @@ def remap(indict, *args, **kwargs):
         {new: indict[old] for new, old in kwargs.items()}
     )
     return outdict
+
+
+def file_paths(files):
+    """
+    Returns the list of all the paths in a dict of files by role, as passed
+    to and returned by Tool.run; lists of paths ("allow_multiple" roles) are
+    flattened, and None values are skipped.
+    """
+    paths = []
+    for path in files.values():
+        if isinstance(path, (list, tuple)):
+            paths.extend(path)
+        elif path is not None:
+            paths.append(path)
+    return paths
@@ -21,25 +21,39 @@ from __future__ import print_function
 from functools import wraps
 
 
+def _local_runtime():
+    """
+    Returns the local runtime, whose module is imported on first use (see
+    utils.runtime).
+    """
+    from utils import runtime
+    return runtime.load("utils.local_runtime").get_runtime()
+
+
 def compss_wait_on(job):
     """
     Dummy wait on function
+
+    Waits for the local tasks producing the job (see utils.local_runtime) and
+    returns its value.
     """
-    return job
+    return _local_runtime().wait_on(job)
 
 
 def compss_open(job, *args, **kwargs):  # pylint: disable=unused-argument
     """
     Dummy open function required when copying from out of the COMPSs system
     """
-    return job
+    return _local_runtime().wait_on(job)
 
 
 def compss_delete_file(job, *args, **kwargs):  # pylint: disable=unused-argument
     """
     Dummy delete file function required when deleting files in the COMPSs system
+
+    The file is deleted once the local tasks using it have finished.
     """
-    pass
+    return _local_runtime().delete_file(job)
 
 
 def compss_delete_object(job, *args, **kwargs):  # pylint: disable=unused-argument
@@ -60,7 +74,7 @@ def barrier():
     """
     Dummy function to trigger the pipeline to wait till all jobs have completed
     """
-    pass
+    _local_runtime().barrier()
 
 
 def local(job):
@@ -74,6 +88,9 @@ def local(job):
 class constraint(object):  # pylint: disable=invalid-name,too-few-public-methods
     """
     Dummy function for handling the contraint decorators
+
+    The constraints of tasks, e.g. computing_units and memory_size, are
+    honoured by the local runtime (see utils.resources).
     """
     @wraps(object)
     def __init__(self, *args, **kwargs):
@@ -81,6 +98,10 @@ class constraint(object):  # pylint: disable=invalid-name,too-few-public-methods
         self.kwargs = kwargs
 
     def __call__(self, function):
+        if hasattr(function, "constraints"):
+            function.constraints.update(self.kwargs)
+            return function
+
         @wraps(function)
         def wrapped_f(*args, **kwargs):
             """
@@ -90,9 +111,66 @@ class constraint(object):  # pylint: disable=invalid-name,too-few-public-methods
         return wrapped_f
 
 
+def _bind_arguments(function, args, kwargs):
+    """
+    Returns a dict of the values of the arguments of the function, by name.
+    """
+    import inspect  # only needed by the local runtime, see utils.runtime
+
+    try:
+        signature = inspect.signature(function)
+    except AttributeError:  # Python 2
+        return inspect.getcallargs(function, *args, **kwargs)
+    return dict(signature.bind(*args, **kwargs).arguments)
+
+
+def file_arguments(function, file_parameters, args, kwargs):
+    """
+    Returns the paths of the files read and written by a call of a task.
+
+
+    Parameters
+    ----------
+    function : function
+        The undecorated task function
+    file_parameters : dict
+        Direction of each file parameter of the task, by name
+    args : list
+        Positional arguments of the call
+    kwargs : dict
+        Keyword arguments of the call
+
+
+    Returns
+    -------
+    (reads, writes)
+        Lists of the paths of the input (FILE_IN and FILE_INOUT) and output
+        (FILE_OUT and FILE_INOUT) files
+    """
+    reads = []
+    writes = []
+    if not file_parameters:
+        return reads, writes
+    values = _bind_arguments(function, args, kwargs)
+    for name, direction in file_parameters.items():
+        path = values.get(name)
+        if path is None:
+            continue
+        if direction in (Direction.IN, Direction.INOUT):
+            reads.append(path)
+        if direction in (Direction.OUT, Direction.INOUT):
+            writes.append(path)
+    return reads, writes
+
+
 class task(object):  # pylint: disable=invalid-name,too-few-public-methods
     """
     Dummy function for handling the task decorators
+
+    The task is run by the local runtime (see utils.local_runtime); the
+    parameters declared as FILE_IN, FILE_OUT or FILE_INOUT define the files
+    read and written by the task, and the constraints given to its
+    constraint decorator the resources it requires.
     """
 
     @wraps(object)
@@ -100,13 +178,31 @@ class task(object):  # pylint: disable=invalid-name,too-few-public-methods
         self.args = args
         self.kwargs = kwargs
 
+    def _file_parameters(self):
+        """
+        Returns a dict of the direction of each file parameter, by name.
+        """
+        return dict(
+            (name, param.direction) for name, param in self.kwargs.items()
+            if isinstance(param, Parameter) and param.type == Type.FILE)
+
     def __call__(self, function):
+        file_parameters = self._file_parameters()
+
         @wraps(function)
         def wrapped_f(*args, **kwargs):
             """
             Function wrapper for the decorator
             """
-            return function(*args, **kwargs)
+            runtime = _local_runtime()
+            if not runtime.tracks_files and not wrapped_f.constraints:
+                return function(*args, **kwargs)
+
+            reads, writes = file_arguments(function, file_parameters, args, kwargs)
+            return runtime.submit(
+                function, args, kwargs, reads, writes, wrapped_f.constraints)
+        wrapped_f.task_function = function
+        wrapped_f.constraints = {}
         return wrapped_f
 
 
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import threading
+import time
+
+"""
+Structured, machine-readable stream of events, written alongside the human
+log of utils.logger so that the VRE can monitor Tools without parsing text.
+
+Events are written as newline-delimited JSON objects, each with the type of
+the event ("event"), its time in seconds since the epoch ("time") and the
+ID of the emitting process ("pid"), as well as the following fields:
+
+progress:       "message", and "status" or "task_id" and "total" if given
+                to logger.progress
+task_start:     "task" (name of the task function), "task_id"
+task_finish:    "task", "task_id", "status" ("done" or "failed"),
+                "duration" (seconds), "bytes_in" and "bytes_out" (total
+                size of the files read and written by the task)
+launch_start:   "tool" (name of the Tool class)
+launch_finish:  "tool", "status", "duration", "bytes_out"
+
+The stream is disabled by default. It can be enabled with configure(), or
+the MUG_EVENTS environment variable, set to either:
+
+fd:<N>          to write to the open file descriptor N;
+unix:<PATH>     to connect to the UNIX stream socket at PATH;
+<PATH>          to append to the file at PATH.
+
+If the stream can not be written, a warning is printed and it is disabled.
+"""  # pylint: disable=pointless-string-statement
+
+PROGRESS = "progress"
+TASK_START = "task_start"
+TASK_FINISH = "task_finish"
+LAUNCH_START = "launch_start"
+LAUNCH_FINISH = "launch_finish"
+
+
+class EventSink(object):
+    """
+    Writes events to a file descriptor, a file, or a UNIX socket.
+    """
+
+    def __init__(self, target):
+        """
+        Open the target of the stream, as described for MUG_EVENTS.
+        """
+        self.target = target
+        self._lock = threading.Lock()
+        self._socket = None
+        self._close_fd = False
+        if target.startswith("fd:"):
+            self._fd = int(target[3:])
+        elif target.startswith("unix:"):
+            import socket
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(target[5:])
+            self._fd = None
+        else:
+            self._fd = os.open(target, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._close_fd = True
+
+    def write(self, event):
+        """
+        Write an event, given as a dict.
+        """
+        data = (json.dumps(event, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._socket is not None:
+                self._socket.sendall(data)
+                return
+            while data:
+                data = data[os.write(self._fd, data):]
+
+    def close(self):
+        """
+        Close the target of the stream, unless it is a file descriptor that
+        was given.
+        """
+        if self._socket is not None:
+            self._socket.close()
+        elif self._close_fd:
+            os.close(self._fd)
+
+
+_SINK = None  # pylint: disable=invalid-name
+
+
+def configure(target):
+    """
+    Set the target of the event stream, as described for MUG_EVENTS; None to
+    disable the stream.
+    """
+    global _SINK  # pylint: disable=global-statement,invalid-name
+    previous = _SINK
+    _SINK = None
+    if previous is not None:
+        previous.close()
+    if target:
+        try:
+            _SINK = EventSink(target)
+        except (IOError, OSError, ValueError) as err:
+            print("[Warning] Cannot open event stream {}: {}".format(target, err),
+                  file=sys.stderr)
+    return _SINK
+
+
+def enabled():
+    """
+    Returns True if events are written; when False, callers can skip
+    collecting the fields of events.
+    """
+    return _SINK is not None
+
+
+def emit(event_type, **fields):
+    """
+    Write an event with the given type and fields, if the stream is enabled.
+    """
+    sink = _SINK
+    if sink is None:
+        return False
+    fields["event"] = event_type
+    fields["time"] = time.time()
+    fields["pid"] = os.getpid()
+    try:
+        sink.write(fields)
+    except (IOError, OSError) as err:
+        print("[Warning] Cannot write to event stream {}: {}".format(sink.target, err),
+              file=sys.stderr)
+        if _SINK is sink:
+            configure(None)
+        return False
+    return True
+
+
+def file_bytes(paths):
+    """
+    Returns the total size of the given files, ignoring missing files.
+    """
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except (OSError, TypeError):
+            pass
+    return total
+
+
+configure(os.environ.get("MUG_EVENTS"))
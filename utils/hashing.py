@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+"""
+Content hashes of files and configurations, used to identify the inputs of
+a Tool run.
+
+File digests are memoised by path, size and modification time, so that a
+file is only read again if it has changed.
+"""  # pylint: disable=pointless-string-statement
+
+ALGORITHM = "sha256"
+BLOCK_SIZE = 1024 * 1024
+
+_DIGESTS = {}  # pylint: disable=invalid-name
+_DIGESTS_LOCK = threading.Lock()
+
+
+def file_stamp(path):
+    """
+    Returns the (real path, size, mtime) identifying the current content of
+    a file, used as key for the memoised digests.
+    """
+    stat = os.stat(path)
+    return (os.path.realpath(path), stat.st_size,
+            getattr(stat, "st_mtime_ns", stat.st_mtime))
+
+
+def file_digest(path):
+    """
+    Returns the hex digest of the content of a file.
+    """
+    stamp = file_stamp(path)
+    with _DIGESTS_LOCK:
+        if stamp in _DIGESTS:
+            return _DIGESTS[stamp]
+
+    digest = hashlib.new(ALGORITHM)
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    digest = digest.hexdigest()
+
+    with _DIGESTS_LOCK:
+        _DIGESTS[stamp] = digest
+    return digest
+
+
+def record_digest(path, digest):
+    """
+    Memoise the digest of a file computed elsewhere, e.g. while copying it
+    (see utils.staging).
+    """
+    stamp = file_stamp(path)
+    with _DIGESTS_LOCK:
+        _DIGESTS[stamp] = digest
+
+
+def files_digest(files):
+    """
+    Returns a dict of the digests of the files in a dict of paths by role,
+    as passed to Tool.run; lists of paths are preserved, and missing files
+    have a digest of None.
+    """
+    def _digest(path):
+        if path is None or not os.path.isfile(path):
+            return None
+        return file_digest(path)
+
+    digests = {}
+    for role, path in files.items():
+        if isinstance(path, (list, tuple)):
+            digests[role] = [_digest(el) for el in path]
+        else:
+            digests[role] = _digest(path)
+    return digests
+
+
+def object_digest(obj):
+    """
+    Returns the hex digest of a JSON-serialisable object, such as a Tool
+    configuration; values that can not be serialised are represented by
+    their str().
+    """
+    text = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.new(ALGORITHM, text.encode("utf-8")).hexdigest()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import codecs
+import json
+import os
+import threading
+from collections import OrderedDict
+from json.encoder import encode_basestring_ascii
+
+"""
+Streaming reader and writer for files containing a large JSON array of
+objects, such as the input_metadata.json written by the VRE and the
+results.json written by JSONApp.
+
+The elements of the array are decoded one at a time from a bounded buffer,
+so that the whole file is never loaded in memory. A JSONArrayIndex records
+the byte offset and length of each element by its ID as the file is
+scanned, keeping only the requested elements; later lookups read the
+elements directly. As when the array is loaded in a dict, the last of the
+elements with the same ID wins, so the scan runs to the end of the array
+even once the requested IDs have been found.
+
+A JSONArrayWriter writes an object holding an array one element at a time,
+to a temporary file that replaces the target file once complete.
+"""  # pylint: disable=pointless-string-statement
+
+CHUNK_SIZE = 64 * 1024
+MAX_INDEXES = 16
+
+_WHITESPACE = " \t\n\r"
+
+
+def _byte_length(text):
+    """
+    Returns the length in bytes of the UTF-8 encoding of the text.
+    """
+    try:
+        if text.isascii():
+            return len(text)
+    except AttributeError:  # Python < 3.7
+        pass
+    return len(text.encode("utf-8"))
+
+
+def scan_array(handle, offset=0, chunk_size=CHUNK_SIZE):
+    """
+    Decode the elements of a JSON array one at a time.
+
+
+    Parameters
+    ----------
+    handle : file
+        File opened in binary mode
+    offset : int
+        Byte offset where to start scanning: either 0, or the end of one of
+        the elements of the array, as returned by a previous scan
+    chunk_size : int
+        Number of bytes read at a time
+
+
+    Returns
+    -------
+    generator
+        (element, start, end) for each element, where start and end are the
+        byte offsets of the element in the file
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder("utf-8")()
+    handle.seek(offset)
+    buf = u""
+    buf_start = offset
+    eof = False
+    expect_open = offset == 0
+    size = chunk_size
+
+    def _read(buf, size):
+        chunk = handle.read(size)
+        return buf + reader.decode(chunk, final=not chunk), not chunk
+
+    while True:
+        # Skip whitespace and separators, reading more data if required
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, eof = _read(buf, size)
+
+        if pos == len(buf):
+            raise ValueError("Unexpected end of JSON array")
+        char = buf[pos]
+        if expect_open:
+            if char != "[":
+                raise ValueError("Expected a JSON array")
+            expect_open = False
+            pos += 1
+        elif char == "]":
+            return
+        elif char == ",":
+            pos += 1
+        buf_start += _byte_length(buf[:pos])
+        buf = buf[pos:]
+
+        # Decode the next element, reading more data until it is complete
+        closed = False
+        while True:
+            stripped = len(buf) - len(buf.lstrip(_WHITESPACE))
+            if stripped < len(buf) and buf[stripped] == "]":
+                closed = True
+                break
+            try:
+                element, end = decoder.raw_decode(buf, stripped)
+                if end < len(buf) or eof:
+                    break
+            except ValueError:
+                if eof:
+                    raise
+            buf, eof = _read(buf, size)
+            size = min(2 * size, 64 * chunk_size)
+        size = chunk_size
+
+        if closed:
+            continue
+        start = buf_start + _byte_length(buf[:stripped])
+        buf_start = start + _byte_length(buf[stripped:end])
+        buf = buf[end:]
+        yield element, start, buf_start
+
+
+class JSONArrayIndex(object):
+    """
+    Index of the elements of a JSON array of objects by one of their keys.
+    """
+
+    def __init__(self, path, key="_id"):
+        """
+        Initialise the index of the JSON file at the given path.
+        """
+        self.path = path
+        self.key = key
+        self.offsets = {}
+        self.complete = False
+        self._scanned_to = 0
+        self._lock = threading.Lock()
+
+    def _scan(self, handle, wanted=None):
+        """
+        Scan the rest of the file, indexing the elements found; the last
+        element with a given key replaces the previous ones.
+
+        Returns the dict of the wanted elements that were found.
+        """
+        found = {}
+        if self.complete:
+            return found
+        for element, start, end in scan_array(handle, self._scanned_to):
+            self._scanned_to = end
+            element_key = element.get(self.key) if isinstance(element, dict) else None
+            if element_key is None:
+                continue
+            self.offsets[element_key] = (start, end - start)
+            if wanted is not None and element_key in wanted:
+                found[element_key] = element
+        self.complete = True
+        return found
+
+    def lookup(self, keys):
+        """
+        Returns a dict of the elements with the given keys; keys that are not
+        in the file are missing from the dict.
+        """
+        keys = set(keys)
+        elements = {}
+        with self._lock, open(self.path, "rb") as handle:
+            for element_key in keys:
+                if element_key in self.offsets:
+                    start, length = self.offsets[element_key]
+                    handle.seek(start)
+                    elements[element_key] = json.loads(
+                        handle.read(length).decode("utf-8"))
+            missing = keys.difference(elements)
+            if missing:
+                elements.update(self._scan(handle, missing))
+        return elements
+
+    def __iter__(self):
+        """
+        Iterate over all the elements of the array, in order.
+        """
+        with open(self.path, "rb") as handle:
+            for element, _, _ in scan_array(handle):
+                yield element
+
+
+_INDEXES = OrderedDict()  # pylint: disable=invalid-name
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_index(path, key="_id"):
+    """
+    Returns the JSONArrayIndex of a file; indexes of the most recently used
+    files are kept, as long as the files are not modified.
+    """
+    stat = os.stat(path)
+    stamp = (os.path.realpath(path), key, stat.st_size,
+             getattr(stat, "st_mtime_ns", stat.st_mtime))
+    with _INDEXES_LOCK:
+        index = _INDEXES.pop(stamp, None)
+        if index is None:
+            index = JSONArrayIndex(path, key)
+        _INDEXES[stamp] = index
+        while len(_INDEXES) > MAX_INDEXES:
+            _INDEXES.popitem(last=False)
+    return index
+
+
+try:
+    _STRING_TYPES = (str, unicode)  # pylint: disable=undefined-variable
+except NameError:  # Python 3
+    _STRING_TYPES = (str,)
+
+INDENT = "    "
+
+
+def _encode_indented(obj, newline):
+    """
+    Encode an object as json.dumps(obj, indent=4, separators=(',', ': ')),
+    where newline is the line break and indentation of the object.
+
+    Dicts with string keys and lists are encoded here, avoiding the slower
+    indenting encoder of the json module; other values are encoded by json.
+    """
+    if isinstance(obj, _STRING_TYPES):
+        return encode_basestring_ascii(obj)
+    if isinstance(obj, dict):
+        if not obj:
+            return "{}"
+        inner = newline + INDENT
+        items = []
+        for key, value in obj.items():
+            if not isinstance(key, _STRING_TYPES):
+                return json.dumps(obj, indent=4, separators=(',', ': ')).replace("\n", newline)
+            items.append(encode_basestring_ascii(key) + ": " + _encode_indented(value, inner))
+        return "{" + inner + ("," + inner).join(items) + newline + "}"
+    if isinstance(obj, (list, tuple)):
+        if not obj:
+            return "[]"
+        inner = newline + INDENT
+        return "[" + inner + ("," + inner).join(
+            _encode_indented(value, inner) for value in obj) + newline + "]"
+    return json.dumps(obj)
+
+
+class JSONArrayWriter(object):
+    """
+    Writes a JSON object holding an array, one element at a time, as:
+
+    {
+        "<key>": [
+            <element>,
+            ...
+        ]
+    }
+
+    The output is the same as that of json.dump(..., indent=4,
+    separators=(',', ': ')); in compact mode, it is written without
+    whitespace. The file is written to a temporary file in the same
+    directory, which replaces the target file when the writer is closed, so
+    that a partially written file is never read.
+
+    Example
+    -------
+    >>> with JSONArrayWriter("results.json", "output_files") as writer:
+    ...     for entry in entries:
+    ...         writer.write(entry)
+    """
+
+    def __init__(self, path, key, compact=False):
+        """
+        Create the temporary file and write the start of the object.
+        """
+        import uuid  # imports platform, which is slow to import
+
+        self.path = path
+        self.compact = compact
+        self.count = 0
+        directory, name = os.path.split(os.path.abspath(path))
+        self._tmp_path = os.path.join(
+            directory, ".{}.tmp-{}".format(name, uuid.uuid4().hex))
+        handle = os.open(self._tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        self._handle = os.fdopen(handle, "w")
+        if compact:
+            self._handle.write("{" + encode_basestring_ascii(key) + ":[")
+        else:
+            self._handle.write("{\n" + INDENT + encode_basestring_ascii(key) + ": [")
+
+    def write(self, element):
+        """
+        Write an element of the array.
+        """
+        if self.compact:
+            self._handle.write(
+                ("," if self.count else "") + json.dumps(element, separators=(',', ':')))
+        else:
+            newline = "\n" + 2 * INDENT
+            self._handle.write(
+                ("," if self.count else "") + newline + _encode_indented(element, newline))
+        self.count += 1
+
+    def close(self):
+        """
+        Write the end of the object, and replace the target file.
+        """
+        if self.compact:
+            self._handle.write("]}")
+        elif self.count:
+            self._handle.write("\n" + INDENT + "]\n}")
+        else:
+            self._handle.write("]\n}")
+        self._handle.close()
+        try:
+            os.replace(self._tmp_path, self.path)
+        except AttributeError:  # Python 2
+            os.rename(self._tmp_path, self.path)
+
+    def abort(self):
+        """
+        Discard the file being written; the target file is left unchanged.
+        """
+        self._handle.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import functools
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+from utils import events
+from utils import task_profile
+from utils.resources import ResourcePool, requirements
+from utils.scheduler import TaskScheduler
+
+try:
+    from collections.abc import KeysView, ValuesView
+except ImportError:  # Python 2
+    from collections import KeysView, ValuesView
+
+"""
+Local execution runtime used by the mock PyCOMPSs decorators in
+utils.dummy_pycompss when Tools are run outside of the COMPSs environment.
+
+Three executors are available:
+
+serial:  tasks are run synchronously in the calling thread, and return
+         their value directly (this is the default, and matches the
+         behaviour of the original mock decorators).
+thread:  tasks are submitted to a pool of threads and return a Future.
+process: tasks are submitted to a pool of processes and return a Future.
+
+In the asynchronous modes the FILE_IN, FILE_OUT and FILE_INOUT parameters
+of each task are used by a TaskScheduler (see utils.scheduler) to build the
+graph of the dependencies between tasks, so that a task is started as soon
+as the tasks producing its input files have finished, and a file is not
+overwritten while it is still being read. compss_wait_on() and barrier()
+resolve the Futures.
+
+Tasks are also only started once the cores and memory they require, given
+by their constraint decorator, are available on the host; the resources
+of each runtime are tracked by a ResourcePool (see utils.resources), whose
+cores are max_workers, if set. Serial tasks with constraints wait for their
+resources too, e.g. when Tools are launched concurrently by App.launch_many.
+
+If the structured event stream is enabled (see utils.events), the start and
+end of each task are reported as "task_start" and "task_finish" events; if
+task profiling is enabled (see utils.task_profile), each call is measured.
+
+The executor can be set with configure(), or using the environment
+variables MUG_LOCAL_EXECUTOR and MUG_LOCAL_WORKERS.
+"""  # pylint: disable=pointless-string-statement
+
+SERIAL = "serial"
+THREAD = "thread"
+PROCESS = "process"
+
+EXECUTORS = (SERIAL, THREAD, PROCESS)
+
+
+def _call_task(module_name, task_name, args, kwargs, profile_files=None):
+    """
+    Run a task in a worker process.
+
+    The decorated task replaces the original function in its module, so the
+    function can not be pickled by reference; instead the task is resolved
+    by name in the worker and the undecorated function is called.
+
+    If profile_files is given, as the (reads, writes) of the task, the call
+    is measured, and (result, sample) is returned (see task_profile.measure).
+    """
+    target = importlib.import_module(module_name)
+    for name in task_name.split("."):
+        target = getattr(target, name)
+    while not hasattr(target, "task_function") and hasattr(target, "__wrapped__"):
+        target = target.__wrapped__
+    function = getattr(target, "task_function", target)
+    if profile_files is not None:
+        return task_profile.measure(function, args, kwargs, *profile_files)
+    return function(*args, **kwargs)
+
+
+def _record_profile(name, running, future):
+    """
+    Record the measures returned by a task run with profile_files, and set
+    its result on future.
+    """
+    error = running.exception()
+    if error is not None:
+        future.set_exception(error)
+        return
+    result, sample = running.result()
+    task_profile.record(name, sample)
+    future.set_result(result)
+
+
+def _run_task(name, function, args, kwargs, reads, writes):  # pylint: disable=too-many-arguments
+    """
+    Run a task in the current process, measuring it if profiling is enabled.
+    """
+    if task_profile.enabled():
+        return task_profile.call(name, function, args, kwargs, reads, writes)
+    return function(*args, **kwargs)
+
+
+def _task_started(name, task_id):
+    """
+    Emit the "task_start" event of a task; returns its start time.
+    """
+    events.emit(events.TASK_START, task=name, task_id=task_id)
+    return time.time()
+
+
+def _task_finished(name, task_id, start, status, reads, writes):  # pylint: disable=too-many-arguments
+    """
+    Emit the "task_finish" event of a task.
+    """
+    events.emit(
+        events.TASK_FINISH, task=name, task_id=task_id, status=status,
+        duration=time.time() - start, bytes_in=events.file_bytes(reads),
+        bytes_out=events.file_bytes(writes))
+
+
+def _remove(path):
+    """
+    Remove a file, ignoring files that do not exist.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class LocalRuntime(object):
+    """
+    Executes tasks locally using the configured executor.
+    """
+
+    def __init__(self, executor=SERIAL, max_workers=None):
+        """
+        Initialise the runtime.
+
+
+        Parameters
+        ----------
+        executor : str
+            One of "serial", "thread" or "process"
+        max_workers : int
+            Maximum number of tasks running concurrently; defaults to the
+            number of CPUs of the machine.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(
+                "Unknown executor '{}': choose from {}".format(executor, EXECUTORS))
+        self.executor = executor
+        self.max_workers = max_workers
+        self.scheduler = TaskScheduler(self._dispatch)
+        self.resources = ResourcePool(max_workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def is_async(self):
+        """
+        True if tasks are run asynchronously and return Futures.
+        """
+        return self.executor != SERIAL
+
+    @property
+    def tracks_files(self):
+        """
+        True if tasks have to be submitted with the files they read and
+        write: in the asynchronous modes, and when tasks are reported or
+        profiled.
+        """
+        return self.executor != SERIAL or events.enabled() or task_profile.enabled()
+
+    def _get_pool(self):
+        """
+        Lazily start the pool of workers.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                if self.executor == PROCESS:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers or multiprocessing.cpu_count())
+            return self._pool
+
+    def submit(self, function, args, kwargs, reads=(), writes=(),  # pylint: disable=too-many-arguments
+               constraints=None):
+        """
+        Add a task to the scheduler; it is run once the tasks it depends on
+        have finished.
+
+
+        Parameters
+        ----------
+        function : function
+            The undecorated task function
+        args : list
+            Positional arguments of the task
+        kwargs : dict
+            Keyword arguments of the task
+        reads : list
+            Paths of the files read by the task
+        writes : list
+            Paths of the files written by the task
+        constraints : dict
+            Arguments of the constraint decorator of the task, if any
+
+
+        Returns
+        -------
+        Future
+            Future of the task; or the value returned by the function if the
+            runtime is serial.
+        """
+        name = getattr(function, "__qualname__", function.__name__)
+        if not self.is_async:
+            if constraints:
+                with self.resources.reserved(requirements(constraints)):
+                    return self._run_serial(name, function, args, kwargs, reads, writes)
+            return self._run_serial(name, function, args, kwargs, reads, writes)
+
+        return self.scheduler.add_task(
+            name, function, args, kwargs, reads, writes, requirements(constraints))
+
+    @staticmethod
+    def _run_serial(name, function, args, kwargs, reads, writes):  # pylint: disable=too-many-arguments
+        """
+        Run a task in the calling thread.
+        """
+        if not events.enabled():
+            return _run_task(name, function, args, kwargs, reads, writes)
+        start = _task_started(name, None)
+        status = "failed"
+        try:
+            result = _run_task(name, function, args, kwargs, reads, writes)
+            status = "done"
+        finally:
+            _task_finished(name, None, start, status, reads, writes)
+        return result
+
+    def _dispatch(self, node):
+        """
+        Start a task once the resources it requires are available.
+        """
+        return self.resources.submit(node.resources, functools.partial(self._start, node))
+
+    def _start(self, node):
+        """
+        Start a task on the pool of workers.
+        """
+        pool = self._get_pool()
+        if self.executor == PROCESS:
+            profile_files = (node.reads, node.writes) if task_profile.enabled() else None
+            running = pool.submit(
+                _call_task, node.function.__module__,
+                getattr(node.function, "__qualname__", node.function.__name__),
+                node.args, node.kwargs, profile_files)
+            if profile_files is not None:
+                measured, running = running, Future()
+                measured.add_done_callback(
+                    lambda done: _record_profile(node.name, done, running))
+        else:
+            running = pool.submit(
+                _run_task, node.name, node.function, node.args, node.kwargs,
+                node.reads, node.writes)
+
+        if events.enabled():
+            start = _task_started(node.name, node.task_id)
+            running.add_done_callback(lambda done: _task_finished(
+                node.name, node.task_id, start,
+                "failed" if done.exception() is not None else "done",
+                node.reads, node.writes))
+        return running
+
+    def wait_on(self, obj):
+        """
+        Wait for the tasks producing the given object and return its value.
+
+        Futures are replaced by their results; lists, tuples and dicts are
+        resolved element by element, and paths of files that are being
+        written by a task are returned once the task has finished.
+        """
+        if isinstance(obj, Future):
+            return obj.result()
+        if isinstance(obj, (list, tuple, set)):
+            return type(obj)(self.wait_on(el) for el in obj)
+        if isinstance(obj, (KeysView, ValuesView)):
+            return [self.wait_on(el) for el in obj]
+        if isinstance(obj, dict):
+            return dict((key, self.wait_on(val)) for key, val in obj.items())
+        if isinstance(obj, str):
+            future = self.scheduler.writer(obj)
+            if future is not None:
+                wait_futures([future])
+        return obj
+
+    def delete_file(self, path):
+        """
+        Delete a file once the pending tasks reading or writing it have
+        finished; in the asynchronous modes, the deletion is scheduled as a
+        task writing the file.
+        """
+        if not self.is_async:
+            _remove(path)
+        else:
+            self.scheduler.add_task("compss_delete_file", _remove, (path,), {}, writes=[path])
+        return True
+
+    def barrier(self):
+        """
+        Wait until all submitted tasks have finished.
+        """
+        while True:
+            pending = self.scheduler.pending()
+            if not pending:
+                return
+            wait_futures(pending)
+
+    def shutdown(self):
+        """
+        Wait for all tasks and stop the workers.
+        """
+        self.barrier()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+_RUNTIME = None  # pylint: disable=invalid-name
+_RUNTIME_LOCK = threading.Lock()
+
+
+def _new_runtime(executor=None, max_workers=None):
+    """
+    Create a LocalRuntime, using the environment variables for the
+    unspecified settings.
+    """
+    if executor is None:
+        executor = os.environ.get("MUG_LOCAL_EXECUTOR", SERIAL)
+    if max_workers is None and os.environ.get("MUG_LOCAL_WORKERS"):
+        max_workers = int(os.environ["MUG_LOCAL_WORKERS"])
+    return LocalRuntime(executor, max_workers)
+
+
+def configure(executor=None, max_workers=None):
+    """
+    Set the executor used to run tasks locally.
+
+    Waits for the tasks submitted to the previous runtime before replacing it.
+
+
+    Parameters
+    ----------
+    executor : str
+        One of "serial", "thread" or "process"; defaults to the value of the
+        MUG_LOCAL_EXECUTOR environment variable, or "serial".
+    max_workers : int
+        Maximum number of concurrent tasks; defaults to the value of the
+        MUG_LOCAL_WORKERS environment variable, or the number of CPUs.
+
+
+    Returns
+    -------
+    LocalRuntime
+    """
+    global _RUNTIME  # pylint: disable=global-statement,invalid-name
+    runtime = _new_runtime(executor, max_workers)
+    with _RUNTIME_LOCK:
+        previous, _RUNTIME = _RUNTIME, runtime
+    if previous is not None:
+        previous.shutdown()
+    return runtime
+
+
+def get_runtime():
+    """
+    Returns the current LocalRuntime, creating it from the environment
+    variables if required.
+    """
+    global _RUNTIME  # pylint: disable=global-statement,invalid-name
+    if _RUNTIME is None:
+        with _RUNTIME_LOCK:
+            if _RUNTIME is None:
+                _RUNTIME = _new_runtime()
+    return _RUNTIME
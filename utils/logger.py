@@ -16,8 +16,15 @@
    limitations under the License.
 """
 
+import atexit
+import collections
+import contextlib
+import os
 import sys
-import datetime
+import threading
+import time
+
+from utils import events
 
 """
 This is the logging facility of the mg-tool-api. It is meant to provide
@@ -39,6 +46,23 @@ FATAL:   A serious error, indicating that the Tool may be unable to
 As well as the following non-standard levels:
 
 PROGRESS: Provide the VRE with information about Tool execution progress.
+
+Messages with a level below the threshold are dropped before any formatting
+takes place. The threshold can be set globally, and for the messages logged
+from specific modules, either with set_level or configure_levels, or with
+the MUG_LOG_LEVEL environment variable, e.g.:
+
+    MUG_LOG_LEVEL=WARNING,tools.my_tool=DEBUG
+
+Apps also apply the "log_level" entry of the Tool configuration, for the
+duration of the launch (see using_levels).
+
+By default messages are written as they are logged. In asynchronous mode
+(see enable_async, or set the MUG_LOG_ASYNC environment variable), the
+logging functions only queue the message and its arguments; a background
+thread formats the queued messages and writes them in batches, and all
+queued messages are written at exit. As formatting is deferred, arguments
+should not be modified after being logged.
 """  # pylint: disable=pointless-string-statement
 
 
@@ -66,21 +90,442 @@ _levelNames = {  # pylint: disable=invalid-name
 }
 
 
+# Default settings of the asynchronous mode: maximum delay before queued
+# messages are written (in seconds), and maximum number of messages per write
+FLUSH_INTERVAL = 0.1
+BATCH_SIZE = 1000
+
+_threshold = DEBUG  # pylint: disable=invalid-name
+_min_threshold = DEBUG  # pylint: disable=invalid-name
+_module_levels = {}  # pylint: disable=invalid-name
+_module_thresholds = {}  # pylint: disable=invalid-name
+# Levels set by acquire_levels, and the thresholds they replaced
+_LEVELS_SCOPE = {"levels": None, "count": 0, "previous": None}
+_LEVELS_LOCK = threading.Lock()
+_writer = None  # pylint: disable=invalid-name
+_writer_lock = threading.Lock()  # pylint: disable=invalid-name
+_timestamp_cache = (None, "")  # pylint: disable=invalid-name
+
+
+def _stream(level):
+    """
+    Returns the stream where messages of the given level are written.
+    """
+    if level in STDERR_LEVELS:
+        return sys.stderr
+    return sys.stdout
+
+
+def _timestamp(log_time):
+    """
+    Returns the formatted timestamp of a time, as returned by time.time();
+    the formatted timestamp is reused within the same second.
+    """
+    global _timestamp_cache  # pylint: disable=global-statement,invalid-name
+    second = int(log_time)
+    cached_second, log_ts = _timestamp_cache
+    if cached_second != second:
+        log_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        _timestamp_cache = (second, log_ts)
+    return log_ts
+
+
+def _format_record(level, log_time, message, args, kwargs):
+    """
+    Returns the line written for a message.
+    """
+    if not hasattr(message, "format"):
+        message = str(message)
+    return "{} | {}: {}\n".format(
+        _timestamp(log_time), _levelNames[level], message.format(*args, **kwargs))
+
+
+class AsyncWriter(object):
+    """
+    Background thread writing the messages queued by the logging functions.
+
+    Messages are appended to a deque, which does not take a lock, and the
+    thread drains it every flush_interval seconds, or as soon as batch_size
+    messages are waiting.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        """
+        Start the thread.
+
+
+        Parameters
+        ----------
+        flush_interval : float
+            Maximum delay before a queued message is written, in seconds
+        batch_size : int
+            Maximum number of messages written at once
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self._records = collections.deque()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mug-logger")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, record):
+        """
+        Queue a message, as a (level, log_time, message, args, kwargs) tuple.
+        """
+        self._records.append(record)
+        if len(self._records) == self.batch_size:
+            self._wake.set()
+
+    def _signal(self, record):
+        """
+        Queue a control record (an Event set once the previous messages are
+        written, or None to stop the thread), and wake the thread up.
+        """
+        self._records.append(record)
+        self._wake.set()
+
+    def _run(self):
+        """
+        Write the queued messages until the thread is stopped.
+        """
+        running = True
+        while running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            running = self._drain()
+        # Messages logged while stopping
+        self._drain()
+
+    def _drain(self):
+        """
+        Write the messages queued so far, in batches, and handle the control
+        records; returns False once the thread is asked to stop.
+        """
+        running = True
+        batch = []
+        while True:
+            try:
+                record = self._records.popleft()
+            except IndexError:
+                break
+            if isinstance(record, tuple):
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+                continue
+            self._write(batch)
+            batch = []
+            if record is None:
+                running = False
+            else:
+                record.set()
+        self._write(batch)
+        return running
+
+    @staticmethod
+    def _write(records):
+        """
+        Format messages and write them, with one write per stream for
+        consecutive messages written to the same stream.
+        """
+        if not records:
+            return
+        chunks = []
+        for level, log_time, message, args, kwargs in records:
+            try:
+                line = _format_record(level, log_time, message, args, kwargs)
+            except Exception as err:  # pylint: disable=broad-except
+                line = "{} | {}: {!r} {!r} {!r} (formatting failed: {})\n".format(
+                    _timestamp(log_time), _levelNames[level], message, args, kwargs, err)
+            stream = _stream(level)
+            if chunks and chunks[-1][0] is stream:
+                chunks[-1][1].append(line)
+            else:
+                chunks.append((stream, [line]))
+
+        try:
+            for stream, lines in chunks:
+                stream.write("".join(lines))
+            for stream in set(stream for stream, _ in chunks):
+                stream.flush()
+        except (IOError, OSError, ValueError):  # closed at exit
+            pass
+
+    def flush(self):
+        """
+        Wait until the messages queued so far have been written.
+        """
+        if self._thread.is_alive():
+            event = threading.Event()
+            self._signal(event)
+            event.wait()
+
+    def close(self):
+        """
+        Write the queued messages and stop the thread.
+        """
+        if self._thread.is_alive():
+            self._signal(None)
+            self._thread.join()
+
+
+def _get_writer():
+    """
+    Returns the AsyncWriter, or None in synchronous mode; the writer is
+    restarted in processes forked after it was started.
+    """
+    writer = _writer
+    if writer is not None and writer.pid != os.getpid():
+        with _writer_lock:
+            writer = _writer
+            if writer is not None and writer.pid != os.getpid():
+                writer = _start_writer(writer.flush_interval, writer.batch_size)
+    return writer
+
+
+def _start_writer(flush_interval, batch_size):
+    """
+    Start a new AsyncWriter; requires _writer_lock.
+    """
+    global _writer  # pylint: disable=global-statement,invalid-name
+    _writer = AsyncWriter(flush_interval, batch_size)
+    return _writer
+
+
+def enable_async(flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+    """
+    Switch to asynchronous mode: messages are queued, then formatted and
+    written in batches by a background thread (see AsyncWriter).
+    """
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _start_writer(flush_interval, batch_size)
+
+
+def disable_async():
+    """
+    Write the queued messages and switch back to synchronous mode.
+    """
+    global _writer  # pylint: disable=global-statement,invalid-name
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None and writer.pid == os.getpid():
+        writer.close()
+
+
+def flush():
+    """
+    Wait until all messages logged so far have been written.
+    """
+    writer = _get_writer()
+    if writer is not None:
+        writer.flush()
+
+
+def _parse_level(level):
+    """
+    Returns the numeric value of a level, given either as a number or as the
+    name of the level (e.g. "DEBUG").
+    """
+    if isinstance(level, int):
+        return level
+    level = str(level).strip().upper()
+    if level.isdigit():
+        return int(level)
+    names = dict((name, value) for value, name in _levelNames.items())
+    names.update({"WARN": WARNING, "CRITICAL": CRITICAL})
+    if level not in names:
+        raise ValueError("Unknown log level: {}".format(level))
+    return names[level]
+
+
+def _update_thresholds():
+    """
+    Reset the cached per-module thresholds after a change of levels.
+    """
+    global _min_threshold, _module_thresholds  # pylint: disable=global-statement,invalid-name
+    _module_thresholds = {}
+    _min_threshold = min([_threshold] + list(_module_levels.values()))
+
+
+def _get_threshold(module):
+    """
+    Returns the threshold of the messages logged from a module: the level
+    set for the module, or for the closest package containing it, or else
+    the global threshold.
+    """
+    threshold = _module_thresholds.get(module)
+    if threshold is None:
+        threshold = _threshold
+        name = module or ""
+        while name:
+            if name in _module_levels:
+                threshold = _module_levels[name]
+                break
+            name = name.rpartition(".")[0]
+        _module_thresholds[module] = threshold
+    return threshold
+
+
+def set_level(level, module=None):
+    """
+    Set the threshold of the logging functions: messages with a lower level
+    are dropped.
+
+
+    Parameters
+    ----------
+    level : int or str
+        Level, or name of the level; None to remove the threshold of the
+        module
+    module : str
+        Name of the module, or package, whose messages are filtered; by
+        default, the global threshold is set
+    """
+    global _threshold  # pylint: disable=global-statement,invalid-name
+    if module is None:
+        _threshold = _parse_level(level)
+    elif level is None:
+        _module_levels.pop(module, None)
+    else:
+        _module_levels[module] = _parse_level(level)
+    _update_thresholds()
+
+
+def get_level(module=None):
+    """
+    Returns the threshold of the messages logged from a module, or the
+    global threshold.
+    """
+    if module is None:
+        return _threshold
+    return _get_threshold(module)
+
+
+def _parse_levels(levels):
+    """
+    Returns the dict of levels by module name (see configure_levels).
+    """
+    if not isinstance(levels, dict):
+        entries = [entry.partition("=") for entry in str(levels).split(",") if entry.strip()]
+        levels = dict(
+            (module.strip(), level) if sep else ("", module)
+            for module, sep, level in entries)
+    return dict(
+        (module or "", None if level is None else _parse_level(level))
+        for module, level in levels.items())
+
+
+def configure_levels(levels):
+    """
+    Set the global and per-module thresholds.
+
+
+    Parameters
+    ----------
+    levels : str or dict
+        Either a dict of levels by module name, where the global level is
+        set with the key "", or a string of comma-separated levels, as
+        "[module=]level" (e.g. "WARNING,tools.my_tool=DEBUG")
+    """
+    if not levels:
+        return
+    for module, level in _parse_levels(levels).items():
+        set_level(level, module or None)
+
+
+def acquire_levels(levels):
+    """
+    Set the thresholds until the matching call of release_levels(); see
+    using_levels.
+    """
+    levels = _parse_levels(levels)
+    with _LEVELS_LOCK:
+        if _LEVELS_SCOPE["count"]:
+            if levels != _LEVELS_SCOPE["levels"]:
+                raise RuntimeError(
+                    "Cannot set the log levels {}: the levels {} are in use by a "
+                    "launch of this process".format(levels, _LEVELS_SCOPE["levels"]))
+        else:
+            _LEVELS_SCOPE["previous"] = (_threshold, dict(_module_levels))
+            _LEVELS_SCOPE["levels"] = levels
+            configure_levels(levels)
+        _LEVELS_SCOPE["count"] += 1
+
+
+def release_levels():
+    """
+    End the thresholds set by acquire_levels(); once all of them have
+    ended, the thresholds set before the first of them are restored.
+    """
+    global _threshold  # pylint: disable=global-statement,invalid-name
+    with _LEVELS_LOCK:
+        _LEVELS_SCOPE["count"] -= 1
+        if _LEVELS_SCOPE["count"]:
+            return
+        threshold, module_levels = _LEVELS_SCOPE["previous"]
+        _LEVELS_SCOPE.update(levels=None, previous=None)
+        _threshold = threshold
+        _module_levels.clear()
+        _module_levels.update(module_levels)
+        _update_thresholds()
+
+
+@contextlib.contextmanager
+def using_levels(levels):
+    """
+    Context manager setting the thresholds for the duration of its block
+    (see configure_levels), then restoring the previous ones.
+
+    The thresholds are shared by the process: blocks can only be nested, or
+    run concurrently in several threads, if they set the same levels;
+    setting other levels raises a RuntimeError.
+    """
+    acquire_levels(levels)
+    try:
+        yield
+    finally:
+        release_levels()
+
+
+def enabled_for(level):
+    """
+    Returns False if messages of the given level, logged from the calling
+    module, are dropped; this can be used to avoid computing the arguments
+    of messages.
+    """
+    if level < _min_threshold:
+        return False
+    if _module_levels:
+        return level >= _get_threshold(sys._getframe(1).f_globals.get("__name__"))  # pylint: disable=protected-access
+    return level >= _threshold
+
+
 def __log(level, message, *args, **kwargs):
     """
     Function to print out the logging input
     """
-    log_time = datetime.datetime.now()
-    log_ts = "{}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
-        log_time.year, log_time.month, log_time.day,
-        log_time.hour, log_time.minute, log_time.second)
     if level not in _levelNames:
         level = INFO
-    outstream = sys.stdout
-    if level in STDERR_LEVELS:
-        outstream = sys.stderr
-    outstream.write("{} | {}: {}\n".format(
-        log_ts, _levelNames[level], message.format(*args, **kwargs)))
+    if level < _min_threshold:
+        return False
+    if _module_levels:
+        # Module of the caller of the logging function
+        module = sys._getframe(2).f_globals.get("__name__")  # pylint: disable=protected-access
+        if level < _get_threshold(module):
+            return False
+    elif level < _threshold:
+        return False
+
+    writer = _get_writer()
+    if writer is not None:
+        writer.put((level, time.time(), message, args, kwargs))
+        return True
+
+    _stream(level).write(_format_record(level, time.time(), message, args, kwargs))
     return True
 
 
@@ -146,7 +591,9 @@ def progress(message, *args, **kwargs):
     The arguments are interpreted as for ``debug()`` (see below for exceptions).
 
     This function provides two pre-baked log message formats, that can be
-    activated by specifying the following items in ``**kwargs``:
+    activated by specifying the following items in ``**kwargs``, which are
+    also reported as fields of the "progress" event if the structured event
+    stream is enabled (see utils.events):
 
     Parameters
     ----------
@@ -187,6 +634,15 @@ def progress(message, *args, **kwargs):
 
     """
 
+    if events.enabled():
+        fields = dict((key, kwargs[key]) for key in ("status", "task_id", "total")
+                      if key in kwargs)
+        if fields or not (args or kwargs):
+            fields["message"] = message
+        else:
+            fields["message"] = message.format(*args, **kwargs)
+        events.emit(events.PROGRESS, **fields)
+
     if "status" in kwargs:
         return __log(PROGRESS, "{} - {}", message, kwargs["status"])
 
@@ -194,3 +650,11 @@ def progress(message, *args, **kwargs):
         return __log(PROGRESS, "{} ({}/{})", message, kwargs["task_id"], kwargs["total"])
 
     return __log(PROGRESS, message, *args, **kwargs)
+
+
+atexit.register(disable_async)
+
+configure_levels(os.environ.get("MUG_LOG_LEVEL"))
+
+if os.environ.get("MUG_LOG_ASYNC"):
+    enable_async()
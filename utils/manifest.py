@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import json
+import os
+import tempfile
+import threading
+
+from basic_modules.metadata import dump_metadata, load_metadata
+from utils import file_paths
+from utils import hashing
+
+"""
+Manifest of the steps of a Workflow, used to skip the steps whose outputs
+are up to date when a Workflow is run incrementally (see Workflow.run_tool).
+
+The manifest is a JSON file stored in the directory of the first output of
+each step. For each step it records the digest of the configuration, the
+size, modification time and digest of each input file, and the output_files
+and output_metadata returned by the Tool.
+
+As for make, a step is up to date if all its recorded outputs exist and
+each of its inputs is either older than the outputs, or has the same content
+as when the step was run; and if its configuration has not changed.
+"""  # pylint: disable=pointless-string-statement
+
+MANIFEST_NAME = ".mug_manifest.json"
+
+_LOCKS = {}  # pylint: disable=invalid-name
+_LOCKS_LOCK = threading.Lock()
+
+
+class StepManifest(object):
+    """
+    Records the inputs and outputs of the steps of a Workflow.
+    """
+
+    def __init__(self, path):
+        """
+        Initialise the manifest stored in the given file.
+        """
+        self.path = path
+        with _LOCKS_LOCK:
+            self._lock = _LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+    @classmethod
+    def for_outputs(cls, output_files):
+        """
+        Returns the manifest stored next to the given output files, or None if
+        there are no output files.
+        """
+        paths = file_paths(output_files)
+        if not paths:
+            return None
+        directory = os.path.dirname(os.path.abspath(paths[0]))
+        return cls(os.path.join(directory, MANIFEST_NAME))
+
+    @staticmethod
+    def step_key(tool_instance, output_files):
+        """
+        Returns the key identifying a step: its Tool and requested outputs.
+        """
+        tool_class = type(tool_instance)
+        return hashing.object_digest({
+            "tool": "{}.{}".format(tool_class.__module__, tool_class.__name__),
+            "output_files": output_files})
+
+    def _load(self):
+        """
+        Returns the content of the manifest.
+        """
+        try:
+            with open(self.path) as handle:
+                return json.load(handle)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save(self, steps):
+        """
+        Atomically replace the content of the manifest.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        with os.fdopen(handle, "w") as tmp_handle:
+            json.dump(steps, tmp_handle, indent=1)
+        os.rename(tmp_path, self.path)
+
+    def lookup(self, key, configuration, input_files):
+        """
+        Returns the recorded (output_files, output_metadata) of a step if it
+        is up to date, or None if the step has to be run.
+        """
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None or entry["configuration"] != hashing.object_digest(configuration):
+            return None
+
+        input_paths = file_paths(input_files)
+        if sorted(input_paths) != sorted(entry["inputs"]):
+            return None
+
+        output_paths = file_paths(entry["output_files"])
+        if not all(os.path.isfile(path) for path in output_paths):
+            return None
+        oldest_output = min(os.path.getmtime(path) for path in output_paths)
+
+        for path in input_paths:
+            if not os.path.isfile(path):
+                return None
+            recorded = entry["inputs"][path]
+            if os.path.getmtime(path) <= oldest_output and \
+                    os.path.getsize(path) == recorded["size"]:
+                continue
+            if hashing.file_digest(path) != recorded["digest"]:
+                return None
+
+        output_metadata = dict(
+            (role, load_metadata(fields))
+            for role, fields in entry["output_metadata"].items())
+        return entry["output_files"], output_metadata
+
+    def record(self, key, configuration, input_files,  # pylint: disable=too-many-arguments
+               output_files, output_metadata):
+        """
+        Record a successful run of a step.
+        """
+        inputs = {}
+        for path in file_paths(input_files):
+            inputs[path] = {
+                "size": os.path.getsize(path),
+                "digest": hashing.file_digest(path)}
+
+        entry = {
+            "configuration": hashing.object_digest(configuration),
+            "inputs": inputs,
+            "output_files": output_files,
+            "output_metadata": dict(
+                (role, dump_metadata(md))
+                for role, md in output_metadata.items())
+        }
+        with self._lock:
+            steps = self._load()
+            steps[key] = entry
+            self._save(steps)
+
+    def discard(self, key):
+        """
+        Remove the record of a step.
+        """
+        with self._lock:
+            steps = self._load()
+            if steps.pop(key, None) is not None:
+                self._save(steps)
@@ -0,0 +1,249 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import Future
+
+from utils import logger
+
+"""
+Accounting of the cores and memory of the host used by the tasks run by
+the local runtime (see utils.local_runtime).
+
+Each task requires the computing_units and memory_size (in GB) given to its
+constraint decorator, as with PyCOMPSs; by default, one core and no memory.
+A task is only started once the cores and memory it requires are
+available. The other tasks wait in a queue, and are started in order as
+soon as the resources released by the tasks that finish allow it: a task
+that fits is not started before the tasks queued earlier, so that the tasks
+requiring many resources are not delayed indefinitely by smaller ones.
+Requirements larger than the host are reduced to the whole host.
+
+The resources of the host are its CPUs and physical memory, unless set by
+the MUG_LOCAL_CORES and MUG_LOCAL_MEMORY (in GB) environment variables.
+"""  # pylint: disable=pointless-string-statement
+
+CORES_KEYS = ("computing_units", "ComputingUnits")
+MEMORY_KEYS = ("memory_size", "MemorySize")
+
+
+def host_cores():
+    """
+    Returns the number of cores of the host available to this process.
+    """
+    if os.environ.get("MUG_LOCAL_CORES"):
+        return int(os.environ["MUG_LOCAL_CORES"])
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux, or Python 2
+        return multiprocessing.cpu_count()
+
+
+def host_memory():
+    """
+    Returns the physical memory of the host in GB, or None if unknown.
+    """
+    if os.environ.get("MUG_LOCAL_MEMORY"):
+        return float(os.environ["MUG_LOCAL_MEMORY"])
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024.0 ** 3
+    except (AttributeError, ValueError, OSError):  # not POSIX
+        return None
+
+
+def _constraint_value(constraints, keys, default):
+    """
+    Returns the value of the first of the keys in the constraints, as a
+    float; values can refer to environment variables, e.g. "${CUS}".
+    """
+    for key in keys:
+        value = constraints.get(key)
+        if value is not None:
+            return float(os.path.expandvars(str(value)))
+    return default
+
+
+def requirements(constraints):
+    """
+    Returns the (cores, memory) required by a task with the given
+    constraints, as passed to the constraint decorator.
+    """
+    constraints = constraints or {}
+    return (_constraint_value(constraints, CORES_KEYS, 1),
+            _constraint_value(constraints, MEMORY_KEYS, 0))
+
+
+class ResourcePool(object):
+    """
+    Cores and memory of the host, reserved by the tasks as they start.
+
+    >>> pool = ResourcePool(cores=8)
+    >>> future = pool.submit((4, 16), lambda: executor.submit(function))
+    """
+
+    def __init__(self, cores=None, memory=None):
+        """
+        Initialise the pool.
+
+
+        Parameters
+        ----------
+        cores : int
+            Number of cores; defaults to the cores of the host.
+        memory : float
+            Memory in GB; defaults to the memory of the host, or no limit if
+            it is unknown.
+        """
+        self.cores = cores or host_cores()
+        self.memory = memory or host_memory()
+        self._used = [0, 0]
+        self._queue = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def available(self):
+        """
+        Returns the (cores, memory) not reserved by running tasks; memory is
+        None if it is not limited.
+        """
+        with self._lock:
+            return (self.cores - self._used[0],
+                    None if self.memory is None else self.memory - self._used[1])
+
+    def _clamp(self, request):
+        """
+        Reduce a (cores, memory) request to the resources of the host.
+        """
+        cores, memory = request
+        if cores > self.cores or (self.memory is not None and memory > self.memory):
+            logger.warn("Task requires {} cores and {} GB, more than the {} cores "
+                        "and {} GB available: reduced", cores, memory, self.cores,
+                        self.memory)
+        return (min(cores, self.cores),
+                memory if self.memory is None else min(memory, self.memory))
+
+    def _fits(self, request):
+        cores, memory = request
+        return (self._used[0] + cores <= self.cores and
+                (self.memory is None or self._used[1] + memory <= self.memory))
+
+    def submit(self, request, start):
+        """
+        Start a task once the resources it requires are available.
+
+
+        Parameters
+        ----------
+        request : (float, float)
+            Cores and memory (in GB) required by the task, see requirements;
+            None for the default requirements
+        start : function
+            Starts the task, and returns a Future of its result; the
+            resources are reserved until the Future is done.
+
+
+        Returns
+        -------
+        Future
+            Future of the result of the task
+        """
+        future = Future()
+        request = self._clamp(request or requirements(None))
+        with self._lock:
+            self._queue.append((request, start, future))
+        self._admit()
+        return future
+
+    def _admit(self):
+        """
+        Start the queued tasks, in order, while they fit in the available
+        resources.
+        """
+        admitted = []
+        with self._lock:
+            while self._queue and self._fits(self._queue[0][0]):
+                entry = self._queue.pop(0)
+                self._used[0] += entry[0][0]
+                self._used[1] += entry[0][1]
+                admitted.append(entry)
+
+        for request, start, future in admitted:
+            try:
+                running = start()
+            except Exception as err:  # pylint: disable=broad-except
+                running = Future()
+                running.set_exception(err)
+            running.add_done_callback(
+                lambda done, request=request, future=future: self._finish(
+                    request, future, done))
+
+    def _finish(self, request, future, running):
+        """
+        Release the resources of a finished task, and start the queued tasks
+        that now fit.
+        """
+        with self._lock:
+            self._used[0] -= request[0]
+            self._used[1] -= request[1]
+        error = running.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(running.result())
+        self._admit()
+
+    @contextlib.contextmanager
+    def reserved(self, request):
+        """
+        Context manager waiting until the resources are available, and
+        reserving them for the duration of its block.
+
+        Within the block of another reservation on the same thread (e.g. a
+        serial task run by a serial task), the resources are not reserved
+        again: the inner block runs with those of the outer one, instead of
+        waiting for them to be released.
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        started = threading.Event()
+        finished = Future()
+
+        def _start():
+            started.set()
+            return finished
+
+        self.submit(request, _start)
+        started.wait()
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            finished.set_result(None)
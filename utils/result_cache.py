@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from basic_modules.metadata import dump_metadata, load_metadata
+from utils import file_paths
+from utils import hashing
+from utils import logger
+
+"""
+Content-addressed cache of the results of Tool runs.
+
+Each entry is identified by a key computed from the Tool class, its
+configuration, the content of the input files, the input metadata and the
+requested output paths (see ResultCache.key). An entry is a directory
+containing a copy of each output file and an "entry.json" file describing
+the output_files and output_metadata returned by the Tool:
+
+    <cache_dir>/<key[:2]>/<key>/entry.json
+    <cache_dir>/<key[:2]>/<key>/0
+    <cache_dir>/<key[:2]>/<key>/1
+    ...
+
+The modification time of the entry directory records its last use; when the
+total size of the entries exceeds the maximum size, the least recently used
+entries are evicted, down to EVICT_RATIO of the maximum size. The total size
+is kept up to date as entries are stored, so that the entries are only
+scanned again when some have to be evicted (other processes may share the
+cache directory).
+"""  # pylint: disable=pointless-string-statement
+
+ENTRY_FILE = "entry.json"
+EVICT_RATIO = 0.9
+
+
+def _key_fields(metadata):
+    """
+    Returns the fields of the metadata of an input (see dump_metadata)
+    identifying it in a key: without its file_path, which depends on where
+    the input is staged. Inputs without metadata (None) are kept as None.
+    """
+    if metadata is None:
+        return None
+    if isinstance(metadata, (list, tuple)):
+        return [_key_fields(item) for item in metadata]
+    fields = dump_metadata(metadata)
+    fields.pop("file_path", None)
+    return fields
+
+
+class ResultCache(object):
+    """
+    Local, size-bounded cache of Tool results.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        """
+        Initialise the cache.
+
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory where the entries are stored; it is created if needed.
+        max_size : int
+            Maximum total size of the entries, in bytes; None for no limit.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._index = None
+        self._total = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def key(tool_class, configuration,  # pylint: disable=too-many-arguments
+            input_files, input_metadata, output_files):
+        """
+        Compute the key identifying a Tool run.
+
+        Input files are identified by the digest of their content, so that
+        the key does not depend on where the inputs are staged.
+        """
+        metadata = dict(
+            (role, _key_fields(value)) for role, value in input_metadata.items())
+        return hashing.object_digest({
+            "tool": "{}.{}".format(tool_class.__module__, tool_class.__name__),
+            "configuration": configuration,
+            "input_files": hashing.files_digest(input_files),
+            "input_metadata": metadata,
+            "output_files": output_files
+        })
+
+    def _entry_dir(self, key):
+        """
+        Returns the directory of the entry with the given key.
+        """
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """
+        Restore the outputs of the cached run with the given key.
+
+        The cached files are copied to the paths originally returned by the
+        Tool, and the entry is marked as recently used.
+
+
+        Returns
+        -------
+        (output_files, output_metadata)
+            As returned by Tool.run; or None if the key is not in the cache.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, ENTRY_FILE)) as handle:
+                entry = json.load(handle)
+            for blob, path in entry["blobs"]:
+                shutil.copyfile(os.path.join(entry_dir, blob), path)
+            os.utime(entry_dir, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        output_metadata = dict(
+            (role, load_metadata(fields))
+            for role, fields in entry["output_metadata"].items())
+        return entry["output_files"], output_metadata
+
+    def put(self, key, output_files, output_metadata):
+        """
+        Store the outputs of a run, then evict the least recently used
+        entries if the cache is larger than its maximum size.
+
+        Runs with no outputs, or whose output files are missing, are not
+        stored.
+
+
+        Returns
+        -------
+        bool
+            True if the outputs were stored
+        """
+        paths = file_paths(output_files)
+        if not paths or not all(os.path.isfile(path) for path in paths):
+            return False
+
+        entry_dir = self._entry_dir(key)
+        parent_dir = os.path.dirname(entry_dir)
+        if not os.path.isdir(parent_dir):
+            try:
+                os.makedirs(parent_dir)
+            except OSError:  # created concurrently
+                pass
+
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=parent_dir)
+        try:
+            blobs = []
+            size = 0
+            for i, path in enumerate(paths):
+                blob = str(i)
+                shutil.copyfile(path, os.path.join(tmp_dir, blob))
+                size += os.path.getsize(path)
+                blobs.append((blob, path))
+
+            with open(os.path.join(tmp_dir, ENTRY_FILE), "w") as handle:
+                json.dump({
+                    "output_files": output_files,
+                    "output_metadata": dict(
+                        (role, dump_metadata(md))
+                        for role, md in output_metadata.items()),
+                    "blobs": blobs,
+                    "size": size
+                }, handle)
+
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        except (IOError, OSError) as err:
+            logger.warn("Could not store results in the cache: {}", err)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        with self._lock:
+            index = self._tracked()
+            if entry_dir in index:
+                self._total -= index[entry_dir][1]
+            index[entry_dir] = (time.time(), size)
+            self._total += size
+            full = self.max_size is not None and self._total > self.max_size
+        if full:
+            self.evict()
+        return True
+
+    def _entries(self):
+        """
+        Returns a list of (last_use, size, entry_dir) for all entries.
+        """
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    with open(os.path.join(entry_dir, ENTRY_FILE)) as handle:
+                        size = json.load(handle)["size"]
+                    entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+                except (IOError, OSError, ValueError, KeyError):
+                    continue
+        return entries
+
+    def _tracked(self):
+        """
+        Returns the {entry_dir: (last_use, size)} index of the entries,
+        scanning them if it is not loaded; called with the lock held.
+        """
+        if self._index is None:
+            self._index = dict(
+                (entry_dir, (last_use, size))
+                for last_use, size, entry_dir in self._entries())
+            self._total = sum(size for _, size in self._index.values())
+        return self._index
+
+    def size(self):
+        """
+        Returns the total size of the cached outputs, in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """
+        If the total size of the cache exceeds its maximum size, remove the
+        least recently used entries until it is within EVICT_RATIO of the
+        maximum size.
+        """
+        if self.max_size is None:
+            return
+        with self._lock:
+            self._index = None
+            index = self._tracked()
+            if self._total <= self.max_size:
+                return
+            entries = sorted(
+                (last_use, size, entry_dir)
+                for entry_dir, (last_use, size) in index.items())
+            for _, size, entry_dir in entries:
+                if self._total <= self.max_size * EVICT_RATIO:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                del index[entry_dir]
+                self._total -= size
+                logger.debug("Evicted cache entry {}", entry_dir)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            for _, _, entry_dir in self._entries():
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            self._index = None
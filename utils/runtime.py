@@ -0,0 +1,539 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import importlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from utils import logger
+
+"""
+Execution backends of Tools, Workflows and Apps.
+
+Tasks are decorated with the task and constraint decorators of this module,
+and use its API functions (compss_wait_on, ...):
+
+>>> from utils.runtime import FILE_IN, FILE_OUT, task, compss_wait_on
+
+Each call of a task is run by the active backend, selected from a registry:
+
+serial:   the local runtime, running tasks synchronously (see
+          utils.local_runtime and the mock decorators of utils.dummy_pycompss)
+thread:   the local runtime, with a pool of threads
+process:  the local runtime, with a pool of processes
+pycompss: PyCOMPSs, if its API packages can be imported (unless run from the
+          command line, see sys._run_from_cmdl)
+
+The active backend is selected with use(), or else by the MUG_BACKEND
+environment variable; it defaults to PyCOMPSs if it is available, and
+otherwise to the local runtime configured by the MUG_LOCAL_EXECUTOR
+environment variable. Other backends can be added with register_backend().
+
+The active backend, and the pool of the local runtime, are shared by the
+whole process. A backend can also be selected for the duration of a block
+with using(), e.g. by the "backend" entry of the configuration of
+App.launch: the previous backend is restored at the end of the block.
+Blocks can be nested, or run concurrently by several threads, only if they
+select the same backend; selecting another backend, with using() or use(),
+while a block is running raises a RuntimeError.
+
+PyCOMPSs is detected once, when this module is first imported, which prints
+a warning if it is not available; only the parameters (FILE_IN, ...) are
+imported by the detection. The other modules of the backends are imported
+the first time they are used, so that importing a Tool does not load the
+PyCOMPSs runtime, nor the local runtime. The time spent importing each of
+these modules is recorded, see import_times().
+"""  # pylint: disable=pointless-string-statement
+
+MOCK_MODULE = "utils.dummy_pycompss"
+
+# Modules of the PyCOMPSs API
+PYCOMPSS_MODULES = {
+    "parameter": "pycompss.api.parameter",
+    "task": "pycompss.api.task",
+    "constraint": "pycompss.api.constraint",
+    "api": "pycompss.api.api",
+}
+
+_IMPORT_TIMES = OrderedDict()
+_MODULES = {}
+_LOCK = threading.RLock()
+
+
+def load(name):
+    """
+    Import a module, recording the time spent on the first import (see
+    import_times).
+    """
+    module = _MODULES.get(name)
+    if module is not None:
+        return module
+    with _LOCK:
+        # Modules in sys.modules may still be being imported by another thread
+        imported = name in sys.modules
+        start = time.time()
+        module = importlib.import_module(name)
+        if not imported and name not in _IMPORT_TIMES:
+            _IMPORT_TIMES[name] = time.time() - start
+            logger.debug("Imported {} in {:.3f}s", name, _IMPORT_TIMES[name])
+        _MODULES[name] = module
+    return module
+
+
+def import_times():
+    """
+    Returns the time spent importing each module of the backends, in
+    seconds, in the order they were imported.
+    """
+    return OrderedDict(_IMPORT_TIMES)
+
+
+def _detect():
+    """
+    Returns True if PyCOMPSs can be used.
+    """
+    if hasattr(sys, '_run_from_cmdl') is True:
+        return False
+    try:
+        load(PYCOMPSS_MODULES["parameter"])
+    except ImportError:
+        return False
+    return True
+
+
+PYCOMPSS_AVAILABLE = _detect()
+
+if not PYCOMPSS_AVAILABLE:
+    print("[Warning] Cannot import \"pycompss\" API packages.")
+    print("          Using mock decorators.")
+
+_PARAMETERS = load(PYCOMPSS_MODULES["parameter"] if PYCOMPSS_AVAILABLE else MOCK_MODULE)
+
+IN = _PARAMETERS.IN
+OUT = _PARAMETERS.OUT
+INOUT = _PARAMETERS.INOUT
+FILE_IN = _PARAMETERS.FILE_IN
+FILE_OUT = _PARAMETERS.FILE_OUT
+FILE_INOUT = _PARAMETERS.FILE_INOUT
+
+
+def file_direction(param):
+    """
+    Returns the direction of a parameter of the task decorator, as a
+    Direction of utils.dummy_pycompss, if it is a file parameter, or None.
+    """
+    dummy = load(MOCK_MODULE)
+    if isinstance(param, dummy.Parameter):
+        return param.direction if param.type == dummy.Type.FILE else None
+    if not PYCOMPSS_AVAILABLE:
+        return None
+    for name, direction in (("FILE_IN", dummy.Direction.IN),
+                            ("FILE_OUT", dummy.Direction.OUT),
+                            ("FILE_INOUT", dummy.Direction.INOUT)):
+        value = getattr(_PARAMETERS, name, None)
+        if param is value or param == value:
+            return direction
+    return None
+
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+
+class Backend(object):
+    """
+    Execution backend of tasks.
+
+    Subclasses implement task, and the API functions with api_module; eager
+    backends decorate each task when it is defined, rather than on its first
+    call by the backend.
+    """
+
+    eager = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def available(self):  # pylint: disable=no-self-use
+        """
+        Returns True if the backend can be used.
+        """
+        return True
+
+    def activate(self, max_workers=None):
+        """
+        Prepare the backend to run tasks, with at most max_workers tasks
+        running concurrently if it is given.
+        """
+        pass
+
+    def task(self, function, args, kwargs):
+        """
+        Returns the implementation of the task function on this backend,
+        given the arguments of the task decorator.
+        """
+        raise NotImplementedError
+
+    def constraint(self, function, args, kwargs):  # pylint: disable=no-self-use,unused-argument
+        """
+        Returns the implementation of a task with the given constraints, from
+        its implementation returned by task.
+        """
+        return function
+
+    def api_module(self):
+        """
+        Returns the module providing compss_wait_on, barrier, etc.
+        """
+        raise NotImplementedError
+
+
+class LocalBackend(Backend):
+    """
+    Runs tasks with the local runtime and the given executor (see
+    utils.local_runtime).
+    """
+
+    def __init__(self, name, executor):
+        super(LocalBackend, self).__init__(name)
+        self.executor = executor
+
+    def activate(self, max_workers=None):
+        local_runtime = load("utils.local_runtime")
+        current = local_runtime.get_runtime()
+        if current.executor != self.executor or \
+                (max_workers is not None and current.max_workers != max_workers):
+            local_runtime.configure(self.executor, max_workers)
+
+    def task(self, function, args, kwargs):
+        dummy = load(MOCK_MODULE)
+        if PYCOMPSS_AVAILABLE:
+            # Use the mock parameters, so that the files of the task are tracked
+            local_files = {
+                dummy.Direction.IN: dummy.FILE_IN,
+                dummy.Direction.OUT: dummy.FILE_OUT,
+                dummy.Direction.INOUT: dummy.FILE_INOUT}
+            kwargs = dict(
+                (name, local_files.get(file_direction(param), param))
+                for name, param in kwargs.items())
+        return dummy.task(*args, **kwargs)(function)
+
+    def constraint(self, function, args, kwargs):
+        return load(MOCK_MODULE).constraint(*args, **kwargs)(function)
+
+    def api_module(self):
+        return load(MOCK_MODULE)
+
+
+class PyCOMPSsBackend(Backend):
+    """
+    Runs tasks with PyCOMPSs; when task profiling is enabled (see
+    utils.task_profile), the tasks decorated afterwards are profiled.
+    """
+
+    eager = True
+
+    def available(self):
+        return PYCOMPSS_AVAILABLE
+
+    def activate(self, max_workers=None):
+        if not self.available():
+            raise ValueError("PyCOMPSs is not available")
+
+    def task(self, function, args, kwargs):
+        from utils import task_profile
+
+        if task_profile.enabled():
+            function = task_profile.profiled(function, kwargs)
+        return load(PYCOMPSS_MODULES["task"]).task(*args, **kwargs)(function)
+
+    def constraint(self, function, args, kwargs):
+        return load(PYCOMPSS_MODULES["constraint"]).constraint(*args, **kwargs)(function)
+
+    def api_module(self):
+        return load(PYCOMPSS_MODULES["api"])
+
+
+_BACKENDS = OrderedDict()
+_ACTIVE = {"backend": None}
+# Backend selected by the running using() blocks, their number, and the
+# backend to restore once they have all finished
+_SCOPE = {"backend": None, "count": 0, "previous": None}
+
+
+def register_backend(backend):
+    """
+    Add a backend to the registry, replacing any backend with the same name.
+    """
+    _BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(name):
+    """
+    Returns the registered backend with the given name.
+    """
+    if name not in _BACKENDS:
+        raise ValueError(
+            "Unknown backend '{}': choose from {}".format(name, list(_BACKENDS)))
+    return _BACKENDS[name]
+
+
+def available_backends():
+    """
+    Returns the names of the registered backends that can be used.
+    """
+    return [name for name, backend in _BACKENDS.items() if backend.available()]
+
+
+def use(name, max_workers=None):
+    """
+    Select the backend running the tasks called from now on.
+
+
+    Parameters
+    ----------
+    name : str
+        Name of a registered backend, e.g. "serial", "thread", "process" or
+        "pycompss"
+    max_workers : int
+        Maximum number of tasks running concurrently, for the backends
+        supporting it; defaults to the number of CPUs.
+
+
+    Returns
+    -------
+    Backend
+    """
+    backend = get_backend(name)
+    with _LOCK:
+        _check_scope(backend)
+        backend.activate(max_workers)
+        _ACTIVE["backend"] = backend
+    return backend
+
+
+def _check_scope(backend):
+    """
+    Raise a RuntimeError if a using() block has selected another backend;
+    requires _LOCK.
+    """
+    selected = _SCOPE["backend"]
+    if selected is not None and selected is not backend:
+        raise RuntimeError(
+            "Cannot select the backend '{}': the backend '{}' is in use by a "
+            "launch of this process".format(backend.name, selected.name))
+
+
+def acquire(name, max_workers=None):
+    """
+    Select a backend until the matching call of release(); see using.
+    """
+    backend = get_backend(name)
+    with _LOCK:
+        if _SCOPE["count"]:
+            _check_scope(backend)
+            if max_workers is not None:
+                logger.warn("Backend '{}' already in use: backend_workers={} ignored",
+                            name, max_workers)
+        else:
+            _SCOPE["previous"] = _ACTIVE["backend"]
+            backend.activate(max_workers)
+            _ACTIVE["backend"] = backend
+            _SCOPE["backend"] = backend
+        _SCOPE["count"] += 1
+    return backend
+
+
+def release():
+    """
+    End the selection of a backend by acquire(); once all of them have
+    ended, the backend active before the first of them is restored.
+    """
+    with _LOCK:
+        _SCOPE["count"] -= 1
+        if _SCOPE["count"]:
+            return
+        previous = _SCOPE["previous"]
+        _SCOPE.update(backend=None, previous=None)
+        _ACTIVE["backend"] = previous
+        (previous or active_backend()).activate()
+
+
+@contextlib.contextmanager
+def using(name, max_workers=None):
+    """
+    Context manager selecting a backend for the duration of its block (see
+    use), then restoring the previous one.
+
+    The backend is shared by the process: blocks can only be nested, or run
+    concurrently in several threads, if they select the same backend, and
+    the max_workers of the first block apply. Selecting another backend
+    raises a RuntimeError.
+
+
+    >>> with runtime.using("thread", 4):
+    ...     app.launch(...)
+    """
+    backend = acquire(name, max_workers)
+    try:
+        yield backend
+    finally:
+        release()
+
+
+def active_backend():
+    """
+    Returns the backend running tasks, selecting the default backend if none
+    has been selected with use().
+    """
+    backend = _ACTIVE["backend"]
+    if backend is not None:
+        return backend
+    with _LOCK:
+        if _ACTIVE["backend"] is None:
+            if os.environ.get("MUG_BACKEND"):
+                use(os.environ["MUG_BACKEND"])
+            else:
+                _ACTIVE["backend"] = get_backend(
+                    "pycompss" if PYCOMPSS_AVAILABLE
+                    else os.environ.get("MUG_LOCAL_EXECUTOR", "serial"))
+    return _ACTIVE["backend"]
+
+
+for _executor in ("serial", "thread", "process"):
+    register_backend(LocalBackend(_executor, _executor))
+register_backend(PyCOMPSsBackend("pycompss"))
+
+
+# -----------------------------------------------------------------------------
+# Decorators and API
+# -----------------------------------------------------------------------------
+
+class task(object):  # pylint: disable=invalid-name,too-few-public-methods
+    """
+    task decorator; each call of the task is run by the active backend.
+
+    The implementation of the task on each backend is created on its first
+    call by the backend, or when the task is defined for eager backends
+    (e.g. PyCOMPSs); the constraints of the task are applied to each of
+    them (see constraint).
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, function):
+        implementations = {}
+        constraints = []
+
+        def _implementation(backend):
+            """
+            Returns the implementation of the task on the backend.
+            """
+            implementation = implementations.get(backend.name)
+            if implementation is None:
+                implementation = backend.task(function, self.args, self.kwargs)
+                for args, kwargs in constraints:
+                    implementation = backend.constraint(implementation, args, kwargs)
+                implementations[backend.name] = implementation
+            return implementation
+
+        @wraps(function)
+        def task_f(*args, **kwargs):
+            """
+            Run the task on the active backend.
+            """
+            return _implementation(active_backend())(*args, **kwargs)
+
+        def _constrain(args, kwargs):
+            """
+            Add constraints to the task and its current implementations.
+            """
+            constraints.append((args, kwargs))
+            for name, implementation in list(implementations.items()):
+                implementations[name] = get_backend(name).constraint(
+                    implementation, args, kwargs)
+
+        for backend in _BACKENDS.values():
+            if backend.eager and backend.available():
+                _implementation(backend)
+
+        task_f.task_function = function
+        task_f.task_constraints = constraints
+        task_f.add_constraint = _constrain
+        return task_f
+
+
+class constraint(object):  # pylint: disable=invalid-name,too-few-public-methods
+    """
+    constraint decorator, to be applied to a function decorated with task;
+    the constraints are passed to each backend (see Backend.constraint).
+    Other functions are returned unchanged.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, function):
+        if hasattr(function, "add_constraint"):
+            function.add_constraint(self.args, self.kwargs)
+        return function
+
+
+def compss_wait_on(*args, **kwargs):
+    """
+    compss_wait_on of the active backend
+    """
+    return active_backend().api_module().compss_wait_on(*args, **kwargs)
+
+
+def compss_open(*args, **kwargs):
+    """
+    compss_open of the active backend
+    """
+    return active_backend().api_module().compss_open(*args, **kwargs)
+
+
+def compss_delete_file(*args, **kwargs):
+    """
+    compss_delete_file of the active backend
+    """
+    return active_backend().api_module().compss_delete_file(*args, **kwargs)
+
+
+def compss_delete_object(*args, **kwargs):
+    """
+    compss_delete_object of the active backend
+    """
+    return active_backend().api_module().compss_delete_object(*args, **kwargs)
+
+
+def barrier(*args, **kwargs):
+    """
+    barrier of the active backend
+    """
+    return active_backend().api_module().barrier(*args, **kwargs)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import itertools
+import threading
+
+from concurrent.futures import Future
+
+"""
+Dependency scheduler for the tasks run by the local runtime (see
+utils.local_runtime).
+
+Each task declares the paths of the files it reads (FILE_IN, FILE_INOUT)
+and writes (FILE_OUT, FILE_INOUT). When a task is added, the scheduler
+links it to the tasks it depends on, building a DAG at call time:
+
+- a task reading a file depends on the last task writing it;
+- a task writing a file depends on the last task writing it, and on all
+  the tasks reading it since.
+
+Tasks without pending dependencies are dispatched straight away; the others
+are dispatched as soon as the last of the tasks they depend on has finished.
+A task depending on a task that failed is not dispatched: it fails in turn,
+with a DependencyError, once the last of the tasks it depends on has
+finished, and so do the tasks depending on it.
+"""  # pylint: disable=pointless-string-statement
+
+
+class DependencyError(RuntimeError):
+    """
+    Raised by the Future of a task that was not run because a task it
+    depends on failed; cause is the error of the first such task.
+    """
+
+    def __init__(self, node, parent, cause):
+        super(DependencyError, self).__init__(
+            "Task {} not run: task {} failed: {}".format(node.name, parent.name, cause))
+        self.cause = cause
+
+
+class FileTracker(object):
+    """
+    Keeps track of the last task writing each file, and of the tasks reading
+    it since, so that the dependencies of a new task can be determined.
+    """
+
+    def __init__(self):
+        self._writers = {}
+        self._readers = {}
+
+    def dependencies(self, reads, writes):
+        """
+        List the tasks that have to finish before a task reading and writing
+        the given files can start.
+        """
+        depends = []
+        for path in reads:
+            if path in self._writers:
+                depends.append(self._writers[path])
+        for path in writes:
+            if path in self._writers:
+                depends.append(self._writers[path])
+            depends.extend(self._readers.get(path, []))
+        return depends
+
+    def register(self, node, reads, writes):
+        """
+        Record the files read and written by a task.
+        """
+        for path in reads:
+            self._readers.setdefault(path, []).append(node)
+        for path in writes:
+            self._writers[path] = node
+            self._readers.pop(path, None)
+
+    def writer(self, path):
+        """
+        Returns the last task writing the file, or None.
+        """
+        return self._writers.get(path)
+
+    def users(self, path):
+        """
+        Returns the tasks writing or reading the file.
+        """
+        users = list(self._readers.get(path, []))
+        if path in self._writers:
+            users.append(self._writers[path])
+        return users
+
+    def forget(self, node):
+        """
+        Remove a completed task from the tracker.
+        """
+        for path in node.writes:
+            if self._writers.get(path) is node:
+                del self._writers[path]
+        for path in node.reads:
+            readers = self._readers.get(path)
+            if readers and node in readers:
+                readers.remove(node)
+                if not readers:
+                    del self._readers[path]
+
+
+class TaskNode(object):  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    A task in the dependency graph.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, function, args, kwargs, reads, writes,  # pylint: disable=too-many-arguments
+                 resources=None):
+        self.task_id = next(self._ids)
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.reads = list(reads)
+        self.writes = list(writes)
+        self.resources = resources
+        self.future = Future()
+        self.waiting = 0
+        self.dependents = []
+        self.error = None
+
+    def __repr__(self):
+        return "<TaskNode {} ({})>".format(self.task_id, self.name)
+
+
+class TaskScheduler(object):
+    """
+    Builds the dependency graph of the tasks as they are added, and
+    dispatches each task once its dependencies are satisfied.
+    """
+
+    def __init__(self, dispatch):
+        """
+        Initialise the scheduler.
+
+
+        Parameters
+        ----------
+        dispatch : function
+            Called with a TaskNode when it is ready to run; it should start
+            the task and return a Future of its result.
+        """
+        self._dispatch = dispatch
+        self.tracker = FileTracker()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def add_task(self, name, function, args, kwargs, reads=(), writes=(),  # pylint: disable=too-many-arguments
+                 resources=None):
+        """
+        Add a task to the graph.
+
+
+        Parameters
+        ----------
+        name : str
+            Name of the task
+        function : function
+            The task function
+        args : list
+            Positional arguments of the task
+        kwargs : dict
+            Keyword arguments of the task
+        reads : list
+            Paths of the files read by the task
+        writes : list
+            Paths of the files written by the task
+        resources : (float, float)
+            Cores and memory required by the task (see utils.resources)
+
+
+        Returns
+        -------
+        Future
+            Future of the result of the task
+        """
+        node = TaskNode(name, function, args, kwargs, reads, writes, resources)
+        with self._lock:
+            depends = set(self.tracker.dependencies(node.reads, node.writes))
+            for parent in depends:
+                parent.dependents.append(node)
+            node.waiting = len(depends)
+            self.tracker.register(node, node.reads, node.writes)
+            self._pending.add(node)
+        if node.waiting == 0:
+            self._start(node)
+        return node.future
+
+    def _start(self, node):
+        """
+        Dispatch a task whose dependencies are satisfied.
+        """
+        try:
+            running = self._dispatch(node)
+        except Exception as err:  # pylint: disable=broad-except
+            running = Future()
+            running.set_exception(err)
+        running.add_done_callback(lambda done: self._finish(node, done))
+
+    def _finish(self, node, running):
+        """
+        Record the result of a task and dispatch the tasks that were only
+        waiting for it; if it failed, these tasks fail too.
+        """
+        finished = [(node, running.exception(), running)]
+        while finished:
+            node, error, running = finished.pop()
+            ready = []
+            with self._lock:
+                self.tracker.forget(node)
+                self._pending.discard(node)
+                for child in node.dependents:
+                    if error is not None and child.error is None:
+                        child.error = DependencyError(
+                            child, node, getattr(error, "cause", error))
+                    child.waiting -= 1
+                    if child.waiting == 0:
+                        ready.append(child)
+                node.dependents = []
+
+            if error is not None:
+                node.future.set_exception(error)
+            else:
+                node.future.set_result(running.result())
+
+            for child in ready:
+                if child.error is not None:
+                    finished.append((child, child.error, None))
+                else:
+                    self._start(child)
+
+    def writer(self, path):
+        """
+        Returns the Future of the last pending task writing the file, or None.
+        """
+        with self._lock:
+            node = self.tracker.writer(path)
+        if node is None:
+            return None
+        return node.future
+
+    def users(self, path):
+        """
+        Returns the Futures of the pending tasks reading or writing the file.
+        """
+        with self._lock:
+            return [node.future for node in self.tracker.users(path)]
+
+    def pending(self):
+        """
+        Returns the Futures of all the tasks that have not finished yet.
+        """
+        with self._lock:
+            return [node.future for node in self._pending]
@@ -0,0 +1,528 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils import hashing
+from utils import logger
+from utils import runtime
+
+"""
+Staging of input files to a node-local directory, and unstaging of output
+files to their final location.
+
+Each source file is staged once per node: its staged copy is stored as
+
+    <staging_dir>/<key[:2]>/<key>/<basename>
+
+where key identifies the real path, size and modification time of the
+source, so that the copy is reused by all the runs on the node, including
+those of other processes, until the source changes. Within a process, the
+dedup table of the Stager makes concurrent requests for the same source
+wait for a single copy.
+
+Each file is staged with the cheapest method the filesystems allow, in
+order: a reflink (copy-on-write clone, Linux only), a hard link (same
+filesystem only, if links are allowed), a kernel-side copy
+(os.copy_file_range, or os.sendfile), or a copy through user space. Copies
+are written to a temporary file, which is renamed once complete.
+
+A hard link shares the data of its source, and so do all the runs reusing
+it: a Tool writing to a linked input would modify the source and the staged
+file reused by the other runs. Hard links are therefore not allowed by
+default when staging inputs (they would not move the data to another
+filesystem either), but are when unstaging outputs, whose sources are
+removed. Reflinks are copy-on-write, and safe.
+
+Reflinks and hard links share the data of the source, so only copies are
+verified: each block is compared with the source as soon as it has been
+copied, while both are in the page cache, and the digest of the source is
+computed on the way (see utils.hashing).
+
+An Unstager moves each output file to a destination directory as soon as
+the tasks writing it have finished, while the other tasks of the Tool are
+still running; at most max_workers files are transferred at a time. The
+files are transferred like staged files, and the sources are removed once
+the outputs of the run have all been collected. Each file keeps its path
+relative to the root directory (by default, the working directory) under
+the destination; files outside of the root are moved to the destination
+itself, and two files moved to the same path at the same time are
+rejected.
+"""  # pylint: disable=pointless-string-statement
+
+BLOCK_SIZE = hashing.BLOCK_SIZE
+
+# ioctl cloning a file on Linux (btrfs, XFS, ...), from linux/fs.h
+FICLONE = 0x40049409
+
+METHODS = ("reused", "reflink", "link", "copy")
+
+
+class StagingError(IOError):
+    """
+    Raised when a staged copy differs from its source, or when two files
+    would be unstaged to the same path.
+    """
+
+
+def _reflink(source, target):
+    """
+    Clone source to target; returns False if the filesystem does not
+    support it.
+    """
+    try:
+        import fcntl
+    except ImportError:  # not POSIX
+        return False
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except (IOError, OSError):
+            return False
+    return True
+
+
+def _kernel_copy(src_fd, dst_fd, offset, count):
+    """
+    Copy count bytes at offset from src_fd to dst_fd, without passing them
+    through user space. Returns the number of bytes copied, or None if no
+    kernel-side copy is available.
+    """
+    copy_file_range = getattr(os, "copy_file_range", None)  # Python >= 3.8
+    if copy_file_range is not None:
+        try:
+            return copy_file_range(src_fd, dst_fd, count, offset, offset)
+        except OSError as err:
+            if err.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    sendfile = getattr(os, "sendfile", None)
+    if sendfile is not None:
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        try:
+            return sendfile(dst_fd, src_fd, offset, count)
+        except OSError as err:
+            if err.errno not in (errno.ENOSYS, errno.EINVAL):
+                raise
+    return None
+
+
+def _pread(fd, count, offset):
+    """
+    Read count bytes at offset, without moving the file position.
+    """
+    pread = getattr(os, "pread", None)  # Python >= 3.3
+    if pread is not None:
+        return pread(fd, count, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+def copy_file(source, target, verify=True, block_size=BLOCK_SIZE):
+    """
+    Copy a file block by block, using kernel-side copies where available.
+
+    If verify is True, each block of the copy is read back and compared with
+    the source as soon as it is written.
+
+
+    Returns
+    -------
+    str
+        Hex digest of the source (see utils.hashing), or None if verify is
+        False
+    """
+    digest = hashlib.new(hashing.ALGORITHM) if verify else None
+    src_fd = os.open(source, os.O_RDONLY)
+    try:
+        dst_fd = os.open(target, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            kernel = True
+            offset = 0
+            while True:
+                copied = None
+                if kernel:
+                    copied = _kernel_copy(src_fd, dst_fd, offset, block_size)
+                    kernel = copied is not None
+                if copied is None:
+                    block = _pread(src_fd, block_size, offset)
+                    os.lseek(dst_fd, offset, os.SEEK_SET)
+                    os.write(dst_fd, block)
+                    copied = len(block)
+                if not copied:
+                    break
+                if verify:
+                    block = _pread(src_fd, copied, offset)
+                    if _pread(dst_fd, copied, offset) != block:
+                        raise StagingError(
+                            "Staged copy of {} differs from the source at byte {}".format(
+                                source, offset))
+                    digest.update(block)
+                offset += copied
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(source, target)
+    return digest.hexdigest() if verify else None
+
+
+def _hard_link(source, tmp_path):
+    """
+    Replace tmp_path by a hard link to source; returns False if the
+    filesystems do not allow it.
+    """
+    os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        open(tmp_path, "wb").close()
+        return False
+    return True
+
+
+def place_file(source, target, link=True, verify=True):
+    """
+    Make target a copy of source, with the cheapest method available: a
+    reflink, a hard link if link is True, or a copy verified as it is
+    written if verify is True (see copy_file). The file is written to a
+    temporary file in the directory of target, created if needed, which
+    replaces target once complete.
+
+    Returns the method used: "reflink", "link" or "copy".
+    """
+    target_dir = os.path.dirname(os.path.abspath(target))
+    if not os.path.isdir(target_dir):
+        try:
+            os.makedirs(target_dir)
+        except OSError:  # created concurrently
+            pass
+
+    handle, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=target_dir)
+    os.close(handle)
+    digest = None
+    try:
+        if _reflink(source, tmp_path):
+            method = "reflink"
+        elif link and _hard_link(source, tmp_path):
+            method = "link"
+        else:
+            digest = copy_file(source, tmp_path, verify)
+            method = "copy"
+        os.rename(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if digest is not None:
+        hashing.record_digest(source, digest)
+        hashing.record_digest(target, digest)
+    return method
+
+
+class Stager(object):
+    """
+    Stages input files to a node-local directory, once per source file.
+
+    >>> stager = Stager("/scratch/staging")
+    >>> input_files = stager.stage_files({"genome": "/shared/genome.fa"})
+    """
+
+    def __init__(self, staging_dir, max_workers=None, link=False, verify=True):
+        """
+        Initialise the Stager.
+
+
+        Parameters
+        ----------
+        staging_dir : str
+            Directory where the files are staged; it is created if needed.
+        max_workers : int
+            Maximum number of files staged concurrently; by default, 8.
+        link : bool
+            Whether sources can be staged as hard links, which share the
+            data of the source (and changes made to it, by any of the runs
+            using the staged file); False by default.
+        verify : bool
+            Whether copies are compared with their source.
+        """
+        self.staging_dir = staging_dir
+        self.max_workers = max_workers or 8
+        self.link = link
+        self.verify = verify
+        self.stats = dict((method, 0) for method in METHODS)
+        self._table = {}
+        self._lock = threading.Lock()
+        if not os.path.isdir(staging_dir):
+            try:
+                os.makedirs(staging_dir)
+            except OSError:  # created concurrently
+                pass
+
+    def staged_path(self, path):
+        """
+        Returns the path where a source file is staged.
+        """
+        stamp = hashing.file_stamp(path)
+        key = hashing.object_digest(list(stamp))
+        return os.path.join(
+            self.staging_dir, key[:2], key, os.path.basename(stamp[0]))
+
+    def stage(self, path):
+        """
+        Stage a file, unless it has already been staged, and returns the
+        path of the staged file. Paths that are None, or that are not
+        files, are returned unchanged.
+        """
+        if path is None or not os.path.isfile(path):
+            return path
+        target = self.staged_path(path)
+
+        with self._lock:
+            future = self._table.get(target)
+            owner = future is None
+            if owner:
+                future = self._table[target] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            method = self._stage(path, target)
+        except BaseException as err:
+            with self._lock:
+                del self._table[target]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            self.stats[method] += 1
+        logger.debug("Staged {} to {} ({})", path, target, method)
+        future.set_result(target)
+        return target
+
+    def _stage(self, path, target):
+        """
+        Stage path to target; returns the method used (see METHODS).
+        """
+        if os.path.isfile(target):
+            return "reused"
+        return place_file(path, target, self.link, self.verify)
+
+    def stage_files(self, files):
+        """
+        Stage concurrently all the files in a dict of paths by role, as
+        passed to Tool.run; lists of paths ("allow_multiple" roles) are
+        preserved.
+
+        Returns the dict of the paths of the staged files by role.
+        """
+        jobs = []
+        for role, path in files.items():
+            if isinstance(path, (list, tuple)):
+                jobs.extend((role, i, el) for i, el in enumerate(path))
+            else:
+                jobs.append((role, None, path))
+        if not jobs:
+            return dict(files)
+
+        workers = min(self.max_workers, len(jobs))
+        if workers == 1:
+            staged = [self.stage(path) for _, _, path in jobs]
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            try:
+                staged = list(executor.map(self.stage, [path for _, _, path in jobs]))
+            finally:
+                executor.shutdown(wait=True)
+
+        staged_files = dict(
+            (role, list(path) if isinstance(path, (list, tuple)) else path)
+            for role, path in files.items())
+        for (role, i, _), path in zip(jobs, staged):
+            if i is None:
+                staged_files[role] = path
+            else:
+                staged_files[role][i] = path
+        return staged_files
+
+    def clear(self):
+        """
+        Remove all the staged files.
+        """
+        with self._lock:
+            self._table.clear()
+            for name in os.listdir(self.staging_dir):
+                shutil.rmtree(os.path.join(self.staging_dir, name), ignore_errors=True)
+
+
+class Unstager(object):
+    """
+    Moves output files to a destination directory as soon as each of them
+    is complete.
+
+    >>> unstager = Unstager("/shared/results")
+    >>> futures = [unstager.submit(path) for path in paths]
+    >>> reports = unstager.collect(futures)
+    >>> reports[0]["path"]
+    '/shared/results/output.bam'
+    """
+
+    def __init__(self, destination, max_workers=None, link=True, verify=True,  # pylint: disable=too-many-arguments
+                 max_waiting=64, root=None):
+        """
+        Initialise the Unstager.
+
+
+        Parameters
+        ----------
+        destination : str
+            Directory where the files are moved; it is created if needed.
+        max_workers : int
+            Maximum number of files transferred concurrently; by default, 4.
+        link : bool
+            Whether files can be moved as hard links.
+        verify : bool
+            Whether copies are compared with their source.
+        max_waiting : int
+            Maximum number of files whose completion is awaited
+            concurrently.
+        root : str
+            Directory whose structure is kept under the destination; by
+            default, the working directory.
+        """
+        self.destination = destination
+        self.max_workers = max_workers or 4
+        self.link = link
+        self.verify = verify
+        self.root = root
+        # Sources of the files being moved, by target (see collect)
+        self._claims = {}
+        self._claims_lock = threading.Lock()
+        self._waiting = ThreadPoolExecutor(max_workers=max_waiting)
+        self._transfers = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def unstaged_path(self, path):
+        """
+        Returns the path where an output file is moved: its path relative to
+        the root under the destination, or its name in the destination if it
+        is not under the root.
+        """
+        path = os.path.abspath(path)
+        destination = os.path.abspath(self.destination)
+        if path.startswith(destination + os.sep):
+            return path
+        relative = os.path.relpath(path, os.path.abspath(self.root or os.getcwd()))
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            relative = os.path.basename(path)
+        return os.path.join(destination, relative)
+
+    def _claim(self, path):
+        """
+        Reserve the target of a file until its move is collected; raises
+        StagingError if another file is being moved to it.
+        """
+        target = self.unstaged_path(path)
+        source = os.path.abspath(path)
+        with self._claims_lock:
+            claimed = self._claims.setdefault(target, source)
+        if claimed != source:
+            raise StagingError(errno.EEXIST, "{} and {} would both be unstaged to".format(
+                claimed, source), target)
+        return target
+
+    def _release(self, target):
+        with self._claims_lock:
+            self._claims.pop(target, None)
+
+    def submit(self, path):
+        """
+        Move an output file once the tasks writing it have finished (see
+        runtime.compss_wait_on).
+
+        Returns a Future of the report of the move: a dict with the "path"
+        of the moved file, its "source", the "method" used (see
+        place_file), and the seconds spent waiting for the file ("wait")
+        and moving it ("duration"); its target attribute is the path where
+        the file is moved. Raises StagingError if another file is being
+        moved to the same path.
+        """
+        submitted = time.time()
+        target = self._claim(path)
+        report = Future()
+
+        def _transfer(waited):
+            start = time.time()
+            if target == os.path.abspath(path):
+                method = "reused"
+            else:
+                method = place_file(path, target, self.link, self.verify)
+            logger.debug("Unstaged {} to {} ({})", path, target, method)
+            return {"path": target, "source": path, "method": method,
+                    "wait": waited, "duration": time.time() - start}
+
+        def _forward(future):
+            error = future.exception()
+            if error is not None:
+                report.set_exception(error)
+            else:
+                report.set_result(future.result())
+
+        def _wait():
+            runtime.compss_wait_on(path)
+            self._transfers.submit(
+                _transfer, time.time() - submitted).add_done_callback(_forward)
+
+        self._waiting.submit(_wait).add_done_callback(
+            lambda future: future.exception() and _forward(future))
+        report.target = target
+        return report
+
+    def collect(self, futures):
+        """
+        Wait for the files submitted to be moved, and remove their sources.
+
+        Returns the list of their reports, in the order of the futures.
+        """
+        try:
+            reports = [future.result() for future in futures]
+        finally:
+            self.discard(futures)
+        for report in reports:
+            if report["method"] != "reused" and os.path.exists(report["source"]):
+                os.remove(report["source"])
+        return reports
+
+    def discard(self, futures):
+        """
+        Release the targets of files submitted to be moved, once they have
+        been moved, without waiting for them, e.g. after a failed run; their
+        sources are kept.
+        """
+        for future in futures:
+            future.add_done_callback(lambda done: self._release(done.target))
+
+    def close(self):
+        """
+        Stop the threads of the Unstager, once the pending moves are done.
+        """
+        self._waiting.shutdown(wait=True)
+        self._transfers.shutdown(wait=True)
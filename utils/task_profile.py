@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import atexit
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # pylint: disable=invalid-name
+
+from utils import events
+from utils import logger
+from utils import runtime
+
+"""
+Opt-in profiling of tasks.
+
+When profiling is enabled, each successful call of a task is measured, and
+the measures are aggregated by task name, which is the unit used by COMPSs
+traces:
+
+count:      number of calls
+wall:       total wall-clock time, in seconds
+cpu:        total CPU time of the thread running the task, in seconds;
+            before Python 3.7, only the CPU time of the whole process is
+            available, which includes that of its other threads: it is
+            reported as cpu_process instead
+rss_delta:  largest increase of the peak resident set size of the process
+            during a call, in bytes
+bytes_in:   total size of the FILE_IN and FILE_INOUT files, before the calls
+bytes_out:  total size of the FILE_OUT and FILE_INOUT files, after the calls
+
+The tasks run by the local backends of utils.runtime are profiled by the
+local runtime, in all its executors. The tasks run by PyCOMPSs are wrapped
+by its backend if profiling is enabled when they are decorated (see
+profiled); as the tasks are run in the COMPSs workers, each call is also
+written to the directory of samples, which must be shared with the master
+so that the report includes them.
+
+Profiling is enabled with enable(), or the MUG_TASK_PROFILE environment
+variable, set either to 1 or to the path of the JSON report to write; the
+directory of samples is set by MUG_TASK_PROFILE_DIR. The report is logged,
+and written to its path, at exit.
+"""  # pylint: disable=pointless-string-statement
+
+CPU_FIELD = "cpu" if hasattr(time, "thread_time") else "cpu_process"
+FIELDS = ("count", "wall", CPU_FIELD, "rss_delta", "bytes_in", "bytes_out")
+
+_CONFIG = {"enabled": False, "report_path": None, "samples_dir": None}
+_STATS = {}
+_LOCK = threading.Lock()
+
+
+def enable(report_path=None, samples_dir=None):
+    """
+    Enable profiling.
+
+
+    Parameters
+    ----------
+    report_path : str
+        Path where the JSON report is written at exit
+    samples_dir : str
+        Directory where each measured call is written; required to report
+        the calls of tasks run in other processes by PyCOMPSs
+    """
+    _CONFIG.update(enabled=True, report_path=report_path, samples_dir=samples_dir)
+
+
+def disable():
+    """
+    Disable profiling; the measures recorded so far are kept.
+    """
+    _CONFIG["enabled"] = False
+
+
+def enabled():
+    """
+    Returns True if tasks are profiled.
+    """
+    return _CONFIG["enabled"]
+
+
+def reset():
+    """
+    Discard the measures recorded so far.
+    """
+    with _LOCK:
+        _STATS.clear()
+
+
+def _cpu_time():
+    """
+    Returns the CPU time of the current thread, or of the process if it is
+    not available (see CPU_FIELD).
+    """
+    try:
+        return time.thread_time()
+    except AttributeError:  # Python < 3.7
+        return time.clock()  # pylint: disable=no-member
+
+
+def _peak_rss():
+    """
+    Returns the peak resident set size of the process, in bytes.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if os.uname()[0] == "Darwin" else peak * 1024
+
+
+def measure(function, args, kwargs, reads=(), writes=()):  # pylint: disable=too-many-arguments
+    """
+    Call a task function and measure the call.
+
+
+    Returns
+    -------
+    (result, sample)
+        The value returned by the function, and a dict of the measures of
+        the call (see FIELDS)
+    """
+    bytes_in = events.file_bytes(reads)
+    peak_rss = _peak_rss()
+    start_cpu = _cpu_time()
+    start = time.time()
+    result = function(*args, **kwargs)
+    sample = {
+        "count": 1,
+        "wall": time.time() - start,
+        CPU_FIELD: _cpu_time() - start_cpu,
+        "rss_delta": _peak_rss() - peak_rss,
+        "bytes_in": bytes_in,
+        "bytes_out": events.file_bytes(writes)
+    }
+    return result, sample
+
+
+def _merge(stats, sample):
+    """
+    Add a sample to the aggregated measures of a task.
+    """
+    for field, value in sample.items():
+        if field == "rss_delta":
+            stats[field] = max(stats.get(field, 0), value)
+        else:
+            stats[field] = stats.get(field, 0) + value
+
+
+def record(name, sample):
+    """
+    Add the measures of a call to those of the task with the given name.
+    """
+    with _LOCK:
+        _merge(_STATS.setdefault(name, {}), sample)
+    samples_dir = _CONFIG["samples_dir"]
+    if samples_dir:
+        line = json.dumps(dict(sample, task=name)) + "\n"
+        path = os.path.join(samples_dir, "samples-{}.ndjson".format(os.getpid()))
+        with open(path, "a") as handle:
+            handle.write(line)
+
+
+def call(name, function, args, kwargs, reads=(), writes=()):  # pylint: disable=too-many-arguments
+    """
+    Call a task function, and record its measures (see measure).
+    """
+    result, sample = measure(function, args, kwargs, reads, writes)
+    record(name, sample)
+    return result
+
+
+def report():
+    """
+    Returns the aggregated measures of each task, by task name.
+
+    If a directory of samples is set, the calls recorded in other processes
+    are included.
+    """
+    with _LOCK:
+        stats = dict((name, dict(values)) for name, values in _STATS.items())
+
+    samples_dir = _CONFIG["samples_dir"]
+    if samples_dir:
+        own_path = os.path.join(samples_dir, "samples-{}.ndjson".format(os.getpid()))
+        for path in glob.glob(os.path.join(samples_dir, "samples-*.ndjson")):
+            if path == own_path:
+                continue
+            with open(path) as handle:
+                for line in handle:
+                    sample = json.loads(line)
+                    _merge(stats.setdefault(sample.pop("task"), {}), sample)
+    return stats
+
+
+def log_report(stats=None):
+    """
+    Log the aggregated measures of each task, from the slowest.
+    """
+    if stats is None:
+        stats = report()
+    for name, values in sorted(stats.items(), key=lambda item: -item[1]["wall"]):
+        values = dict(values)
+        cpu_label = "CPU"
+        if "cpu" not in values:
+            values["cpu"] = values.pop("cpu_process", 0)
+            cpu_label = "process CPU"
+        logger.info(
+            "Task {}: {count} calls, wall {wall:.3f}s, {} {cpu:.3f}s, "
+            "peak RSS +{rss_delta} B, read {bytes_in} B, written {bytes_out} B",
+            name, cpu_label, **values)
+
+
+def write_report(path, stats=None):
+    """
+    Write the aggregated measures of each task to a JSON file.
+    """
+    if stats is None:
+        stats = report()
+    with open(path, "w") as handle:
+        json.dump(stats, handle, indent=4, separators=(',', ': '), sort_keys=True)
+
+
+def _report_at_exit():
+    """
+    Log and write the report, if profiling was enabled.
+    """
+    if not (_CONFIG["enabled"] and (_STATS or _CONFIG["samples_dir"])):
+        return
+    stats = report()
+    if not stats:
+        return
+    log_report(stats)
+    if _CONFIG["report_path"]:
+        write_report(_CONFIG["report_path"], stats)
+
+
+def profiled(function, task_kwargs):
+    """
+    Returns a wrapper of a task function measuring each call, for the
+    PyCOMPSs backend (see utils.runtime); the signature of the function is
+    preserved for PyCOMPSs.
+
+
+    Parameters
+    ----------
+    function : function
+        The undecorated task function
+    task_kwargs : dict
+        Keyword arguments of the task decorator, defining its file parameters
+    """
+    from utils.dummy_pycompss import file_arguments
+
+    file_parameters = {}
+    for name, param in task_kwargs.items():
+        direction = runtime.file_direction(param)
+        if direction is not None:
+            file_parameters[name] = direction
+    task_name = getattr(function, "__qualname__", function.__name__)
+
+    @wraps(function)
+    def profiled_f(*args, **kwargs):
+        """
+        Function wrapper measuring each call
+        """
+        reads, writes = file_arguments(function, file_parameters, args, kwargs)
+        return call(task_name, function, args, kwargs, reads, writes)
+
+    if hasattr(inspect, "signature"):
+        profiled_f.__signature__ = inspect.signature(function)
+    return profiled_f
+
+
+atexit.register(_report_at_exit)
+
+if os.environ.get("MUG_TASK_PROFILE"):
+    enable(
+        report_path=(None if os.environ["MUG_TASK_PROFILE"].lower() in ("1", "true", "yes")
+                     else os.environ["MUG_TASK_PROFILE"]),
+        samples_dir=os.environ.get("MUG_TASK_PROFILE_DIR"))